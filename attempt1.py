@@ -2,34 +2,157 @@ import logging
 import argparse
 import utils
 import asyncio
-import google.generativeai as ai
+import backends
+import cache
+import syscalls
+import budget
+import locks
+import ipc
+import metrics
+import retrieval
 import time
 import dotenv
-import os
+from typing import AsyncIterator, Callable
+from collections import deque
 
 dotenv.load_dotenv()
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-ai.configure(api_key=API_KEY)
-
 class LLM:
+    model: str = backends.DEFAULT_MODEL
+    generation_config: dict | None = None
+    response_cache: cache.ResponseCache | None = cache.ResponseCache()
+
     @staticmethod
-    async def call(input: str) -> str:
-        model = ai.GenerativeModel("gemini-1.5-flash")
-        model._generation_config
-        response = await model.generate_content_async(input)
-        return response.candidates[0].content.parts[0].text
+    async def call(input: str, fresh: bool = False, generation_config: dict | None = None) -> str:
+        """Answer from the response cache when possible. fresh=True always goes to the backend."""
+        generation_config = generation_config or LLM.generation_config
+        calls = 0
+        async def generate():
+            nonlocal calls
+            calls += 1
+            return await backends.get_backend().generate(input, LLM.model, generation_config)
+        with metrics.get_metrics().span("llm_call", model=LLM.model) as span:
+            if LLM.response_cache is None:
+                response = await generate()
+            else:
+                response = await LLM.response_cache.fetch(LLM.model, generation_config, input, generate, fresh)
+            if span:
+                span.set(cache_hit=calls == 0).add(prompt_tokens=budget.count_tokens(input), response_tokens=budget.count_tokens(response))
+        return response
+
+    @staticmethod
+    async def stream(input: str, fresh: bool = False) -> AsyncIterator[str]:
+        """Yield the response in chunks as they arrive. A cached response comes back as one chunk."""
+        key = cache.cache_key(LLM.model, LLM.generation_config, input)
+        with metrics.get_metrics().span("llm_call", model=LLM.model) as span:
+            if LLM.response_cache is not None and not fresh:
+                response = LLM.response_cache.get(key)
+                if response is not None:
+                    if span:
+                        span.set(cache_hit=True).add(prompt_tokens=budget.count_tokens(input), response_tokens=budget.count_tokens(response))
+                    yield response
+                    return
+            chunks = []
+            async for chunk in backends.get_backend().stream(input, LLM.model, LLM.generation_config):
+                chunks.append(chunk)
+                yield chunk
+            if LLM.response_cache is not None:
+                LLM.response_cache.put(key, "".join(chunks))
+            if span:
+                span.set(cache_hit=False).add(prompt_tokens=budget.count_tokens(input), response_tokens=budget.count_tokens("".join(chunks)))
 
     @staticmethod
     async def test(prompt: str):
         start_time = time.time()
         print(f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}")
-        model = ai.GenerativeModel("gemini-1.5-flash")
-        response = await model.generate_content_async(prompt)
+        response = await LLM.call(prompt, fresh=True)
         end_time = time.time()
         print(f"Ended at: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end_time))}")
         print(f"Duration: {end_time - start_time:.2f} seconds")
-        print(response.candidates[0].content.parts[0].text)
+        logging.debug("Test response: %s", response)
+
+
+class RegisterStorage:
+    """
+    Append only UTF-8 segments behind a register.
+    Appends extend the last segment in place (amortized O(1)), sizes are tracked per segment so nothing is joined
+    to measure, and the full text is only decoded (and then cached) when something actually reads it.
+    """
+    SEGMENT_BYTES = 64 * 1024
+
+    def __init__(self):
+        self.segments: list[bytearray] = []
+        self.segment_chars: list[int] = []
+        self.chars = 0
+        self.nbytes = 0
+        self.text: str | None = ""
+
+    def append(self, value: str):
+        if not value:
+            return
+        data = value.encode("utf-8")
+        if self.segments and len(self.segments[-1]) + len(data) <= self.SEGMENT_BYTES:
+            self.segments[-1] += data
+            self.segment_chars[-1] += len(value)
+        else:
+            self.segments.append(bytearray(data))
+            self.segment_chars.append(len(value))
+        self.chars += len(value)
+        self.nbytes += len(data)
+        self.text = None
+
+    def clear(self):
+        self.segments = []
+        self.segment_chars = []
+        self.chars = 0
+        self.nbytes = 0
+        self.text = ""
+
+    def __len__(self):
+        return self.chars
+
+    def materialize(self) -> str:
+        if self.text is None:
+            self.text = b"".join(self.segments).decode("utf-8")
+        return self.text
+
+    def tail(self, chars: int) -> str:
+        """The last chars characters, decoding only the segments they live in."""
+        if chars <= 0:
+            return ""
+        if self.text is not None:
+            return self.text[-chars:]
+        needed, parts = chars, []
+        for segment, segment_chars in zip(reversed(self.segments), reversed(self.segment_chars)):
+            view = memoryview(segment)
+            if segment_chars == len(segment):
+                # ASCII only, so characters and bytes line up and we can slice the view directly.
+                parts.append(str(view[max(len(segment) - needed, 0):], "ascii"))
+            else:
+                parts.append(str(view, "utf-8")[-needed:])
+            needed -= segment_chars
+            if needed <= 0:
+                break
+        return "".join(reversed(parts))
+
+    def slice(self, start: int, stop: int) -> str:
+        """Characters [start, stop), decoding only the segments they overlap."""
+        start, stop = max(start, 0), min(stop, self.chars)
+        if self.text is not None:
+            return self.text[start:stop]
+        parts, offset = [], 0
+        for segment, segment_chars in zip(self.segments, self.segment_chars):
+            if offset >= stop:
+                break
+            if offset + segment_chars > start:
+                lo, hi = max(start - offset, 0), min(stop - offset, segment_chars)
+                view = memoryview(segment)
+                if segment_chars == len(segment):
+                    parts.append(str(view[lo:hi], "ascii"))
+                else:
+                    parts.append(str(view, "utf-8")[lo:hi])
+            offset += segment_chars
+        return "".join(parts)
 
 
 class Register:
@@ -39,59 +162,81 @@ class Register:
     Register names must be unique, and are used to access the register.
     Register descriptions are used to describe the contents of the register.
     """
+    # How much of a register manager prompts get to see.
+    PREVIEW_CHARS = 200
+
     def __init__(self, name: str, description: str, size: int = 1000):
-        self.content: str = ""
+        self.storage = RegisterStorage()
         self.name = name
         self.description = description
         self.size = size
         self.locked_to: str = ""
-        logging.debug(f"Creating register {self.name}")
-        logging.info(f"Register {self.name} created")
+        logging.debug("Creating register %s", self.name)
+        logging.info("Register %s created", self.name)
+
+    @property
+    def content(self) -> str:
+        return self.storage.materialize()
 
     def lock_to_process(self, pid: str):
         self.locked_to = pid
-        logging.debug(f"Locking register {self.name} to process {pid}")
-        logging.info(f"Locking register {self.name} to process {pid}")
+        logging.debug("Locking register %s to process %s", self.name, pid)
+        logging.info("Locking register %s to process %s", self.name, pid)
+
+    def unlock(self):
+        logging.debug("Unlocking register %s from process %s", self.name, self.locked_to)
+        self.locked_to = ""
 
     def __check_lock(self, pid: str):
         if pid != self.locked_to:
-            logging.error(f"Process {pid} does not have lock on register {self.name}")
+            logging.error("Process %s does not have lock on register %s", pid, self.name)
             raise ValueError(f"Process {pid} does not have lock on register {self.name}")
 
     def set(self, value: str, pid: str):
         self.__check_lock(pid)
         if len(value) > self.size:
-            logging.error(f"Value too large for register {self.name}")
+            logging.error("Value too large for register %s", self.name)
             raise ValueError(f"Value too large for register {self.name}")
-        self.content = value
-        logging.debug(f"Setting register {self.name} to {value}")
-        logging.info(f"Setting register {self.name}")
+        self.storage.clear()
+        self.storage.append(value)
+        logging.debug("Setting register %s to %s", self.name, value)
+        logging.info("Setting register %s", self.name)
 
     def add(self, value: str, pid: str):
         self.__check_lock(pid)
-        if len(self.content) + len(value) > self.size:
-            logging.error(f"Value too large for register {self.name}")
+        if len(self.storage) + len(value) > self.size:
+            logging.error("Value too large for register %s", self.name)
             raise ValueError(f"Value too large for register {self.name}")
-        self.content += value
-        logging.debug(f"Adding {value} to register {self.name}")
-        logging.info(f"Adding to register {self.name}")
+        self.storage.append(value)
+        logging.debug("Adding %s to register %s", value, self.name)
+        logging.info("Adding to register %s", self.name)
 
     def content_size(self):
-        return len(self.content)
+        return len(self.storage)
 
     def clear(self, pid: str):
         self.__check_lock(pid)
-        self.content = ""
-        logging.debug(f"Clearing register {self.name}")
-        logging.info(f"Clearing register {self.name}")
+        self.storage.clear()
+        logging.debug("Clearing register %s", self.name)
+        logging.info("Clearing register %s", self.name)
 
     def get(self):
-        return self.content
-    
+        return self.storage.materialize()
+
+    def tail(self, chars: int) -> str:
+        return self.storage.tail(chars)
 
+    def slice(self, start: int, stop: int) -> str:
+        return self.storage.slice(start, stop)
     
+    def __repr__(self):
+        # This is what lands in manager prompts via REGISTERS: {self.memory}, so it never materializes the whole register.
+        preview = self.storage.tail(self.PREVIEW_CHARS)
+        ellipsis = "..." if len(self.storage) > self.PREVIEW_CHARS else ""
+        return f"Register({self.description!r}, {len(self.storage)}/{self.size} chars, ends with {ellipsis}{preview!r})"
+
     def __str__(self):
-        return str(self.content)
+        return self.storage.materialize()
 
 
 
@@ -104,55 +249,381 @@ class Thought:
 
     async def trigger(self):
         """Trigger must be called to generate the summary and opinion. Context will generally be included as part of 'information' to the call."""
-        summary = await LLM.call(f'Summarize this information in under {self.summary_size} characters: {self.information}')
+        information = budget.truncate(self.information, budget.ContextBudget(model=LLM.model).max_tokens - 64, "middle")
+        summary = await LLM.call(f'Summarize this information in under {self.summary_size} characters: {information}')
         self.summary = summary
-        opinion = await LLM.call(f'What do you think about this information in under {self.opinion_size} characters: {self.information}')
+        opinion = await LLM.call(f'What do you think about this information in under {self.opinion_size} characters: {information}')
         self.opinion = opinion
 
     def __str__(self):
         return f"<info> {self.information} <info>  <opinion>{self.opinion} <opinion>"
 
-class ChannelIn:
+class Message:
+    def __init__(self, sender: str, body: str, kind: str = "message"):
+        self.sender = sender
+        self.body = body
+        self.kind = kind
+
+    def __repr__(self):
+        return f"{self.kind} from {self.sender}: {self.body}"
+
+
+class Mailbox:
+    """
+    Bounded FIFO of messages. put waits while the mailbox is full (backpressure), put_nowait raises asyncio.QueueFull.
+    receive takes the oldest message, or with match, the oldest message match accepts (selective receive),
+    leaving the others queued in order.
+    """
+    def __init__(self, name: str, maxsize: int = 10):
+        self.name = name
+        self.maxsize = maxsize
+        self.messages: deque[Message] = deque()
+        self.changed = asyncio.Condition()
+        # Wake-ups in flight. The loop only keeps weak references to tasks, so they're held here until done.
+        self.wakers: set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def full(self) -> bool:
+        return len(self.messages) >= self.maxsize
+
+    def notify(self):
+        async def wake():
+            async with self.changed:
+                self.changed.notify_all()
+        task = asyncio.ensure_future(wake())
+        self.wakers.add(task)
+        task.add_done_callback(self.woken)
+
+    def woken(self, task: asyncio.Task):
+        self.wakers.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Waking receivers of mailbox %s failed: %r", self.name, task.exception())
+
+    def put_nowait(self, message: Message):
+        if self.full():
+            raise asyncio.QueueFull(f"Mailbox {self.name} is full")
+        self.messages.append(message)
+        self.notify()
+
+    async def put(self, message: Message):
+        async with self.changed:
+            await self.changed.wait_for(lambda: not self.full())
+            self.messages.append(message)
+            self.changed.notify_all()
+
+    def take(self, match: Callable[[Message], bool] | None) -> Message | None:
+        for index, message in enumerate(self.messages):
+            if match is None or match(message):
+                del self.messages[index]
+                return message
+        return None
+
+    async def receive(self, match: Callable[[Message], bool] | None = None, timeout: float | None = None) -> Message:
+        async def wait():
+            async with self.changed:
+                message = None
+                def ready():
+                    nonlocal message
+                    message = self.take(match)
+                    return message is not None
+                await self.changed.wait_for(ready)
+                self.changed.notify_all()
+                return message
+        return await asyncio.wait_for(wait(), timeout)
+
+    def drain(self) -> list[Message]:
+        messages = list(self.messages)
+        self.messages.clear()
+        if messages:
+            self.notify()
+        return messages
+
+
+class ChannelIn(Mailbox):
+    """Messages into a process."""
     pass
 
-class ChannelOut:
+class ChannelOut(Mailbox):
+    """Messages out of a process."""
     pass
 
 class Angel:
-    def __init__(self, name: str, goal: str,  manager: 'Chuck'):
+    def __init__(self, name: str, goal: str,  manager: 'Chuck', mailbox_size: int = 10):
         self.name = name
         self.goal = goal
         self.manager = manager
-        self.manager_messages: list[str] = []
+        self.inbox = ChannelIn(f"{name}.in", mailbox_size)
+        self.outbox = ChannelOut(f"{name}.out", mailbox_size)
         self.locked_registers: list[str] = []
         self.locked_channels: list[str] = []
+        self.thoughts: int = 0
+
+    def __repr__(self):
+        return f"Angel(goal={self.goal!r}, thoughts={self.thoughts}, unread={len(self.inbox)}, registers={self.locked_registers})"
+
+    async def run(self):
+        """The angel's own loop: think about its goal, then about every message it is sent."""
+        await self.think("Begin working on your goal.")
+        while True:
+            message = await self.inbox.receive()
+            await self.think(repr(message))
+
+    async def think(self, stimulus: str):
+        prompt = budget.ContextBudget(model=LLM.model)
+        prompt.add(self.goal, priority=0, label="You are a child process of an AI agent kernel. Your goal: ")
+        prompt.add(stimulus, priority=1, policy="tail", label="\nNew input: ")
+        prompt.add("\nRespond with your next thought or report for the manager, concisely.")
+        thought = await LLM.call(prompt.render())
+        self.thoughts += 1
+        await self.outbox.put(Message(self.name, thought, "thought"))
 
     def smite(self):
-        for register in self.locked_registers:
-            self.manager.call_release_register_lock(register)
-        for channel in self.locked_channels:
-            self.manager.call_release_channel_lock(channel)
+        self.manager.call_release_all_locks(self.name)
 
-    def __ask_for_register_lock(self, register_name: str, reason: str):
-        self.manager.req_ask_for_register_lock(self.name, register_name, reason)
+    def __ask_for_register_lock(self, register_name: str, reason: str) -> str:
+        return self.manager.req_ask_for_register_lock(self.name, register_name, reason)
 
-    def __ask_for_channel_lock(self, channel_name: str):
-        self.manager.req_ask_for_channel_lock(channel_name)
+    def __ask_for_channel_lock(self, channel_name: str) -> str:
+        return self.manager.req_ask_for_channel_lock(self.name, channel_name)
 
     def __release_channel_lock(self, channel_name: str):
-        self.manager.call_release_channel_lock(channel_name)
-        self.locked_channels.remove(channel_name)
+        self.manager.call_release_channel_lock(channel_name, self.name)
     
     def __release_register_lock(self, register_name: str):
-        self.manager.call_release_register_lock(register_name)
+        self.manager.call_release_register_lock(register_name, self.name)
+
+
+class RemoteInbox(ChannelIn):
+    """
+    Inbox of an angel on a worker process. Messages go straight over the wire. The unread count is what the worker
+    last reported plus what was sent since, so it never undercounts and the worker's own inbox never overflows.
+    """
+    def __init__(self, angel: 'RemoteAngel', name: str, maxsize: int = 10):
+        super().__init__(name, maxsize)
+        self.angel = angel
+        self.unread = 0
+
+    def __len__(self):
+        return self.unread
+
+    def full(self) -> bool:
+        return self.unread >= self.maxsize
+
+    def update(self, unread: int):
+        self.unread = unread
+        self.notify()
+
+    def put_nowait(self, message: Message):
+        if self.full():
+            raise asyncio.QueueFull(f"Mailbox {self.name} is full")
+        self.angel.pool.send(self.angel.name, "deliver", self.angel.name, message.sender, message.body, message.kind)
+        self.unread += 1
+
+    async def put(self, message: Message):
+        async with self.changed:
+            await self.changed.wait_for(lambda: not self.full())
+        self.put_nowait(message)
+
+
+class RemoteAngel(Angel):
+    """
+    Stands in for an Angel running on a worker process. Chuck treats it like any other child: run() lasts as long as
+    the remote angel's loop (so supervision works unchanged), the outbox is refilled by Chuck.collect_remote, and
+    locks are tracked here on the coordinator.
+    """
+    def __init__(self, name: str, goal: str, manager: 'Chuck', pool: ipc.WorkerPool, mailbox_size: int = 10):
+        super().__init__(name, goal, manager, mailbox_size)
+        self.pool = pool
+        self.worker = pool.place(name)
+        self.inbox = RemoteInbox(self, f"{name}.in", mailbox_size)
+        self.exited: asyncio.Future | None = None
+        pool.send(name, "spawn", name, goal, mailbox_size)
+
+    def __repr__(self):
+        return f"{super().__repr__()[:-1]}, worker={self.worker})"
+
+    async def run(self):
+        self.exited = asyncio.get_running_loop().create_future()
+        self.pool.send(self.name, "start", self.name)
+        try:
+            error = await self.exited
+        except asyncio.CancelledError:
+            if self.name in self.pool.placed:
+                self.pool.send(self.name, "stop", self.name)
+            raise
+        if error is not None:
+            raise RuntimeError(f"{self.name} failed on worker {self.worker}: {error}")
+
+    def exit(self, error: str | None):
+        if self.exited is not None and not self.exited.done():
+            self.exited.set_result(error)
+
+    def smite(self):
+        super().smite()
+        self.pool.send(self.name, "kill", self.name)
+        self.pool.forget(self.name)
+
+
+class ManagerProxy:
+    """
+    What an angel on a worker process sees as its manager. Requests cross the IPC link to Chuck.
+    Requests that only return a decision can't block the worker's loop, they are sent and answered with ESCALATE,
+    acquire_register_lock waits for Chuck's real answer.
+    """
+    def __init__(self, connection: ipc.Connection):
+        self.connection = connection
+
+    def req_ask_for_register_lock(self, child: str, register_name: str, reason: str) -> str:
+        self.connection.send("cast", "req_ask_for_register_lock", [child, register_name, reason])
+        return locks.ESCALATE
+
+    def req_ask_for_channel_lock(self, child: str, channel_name: str, reason: str = "") -> str:
+        self.connection.send("cast", "req_ask_for_channel_lock", [child, channel_name, reason])
+        return locks.ESCALATE
+
+    async def acquire_register_lock(self, child: str, register_name: str, reason: str, timeout: float | None = None) -> bool:
+        return await self.connection.call("acquire_register_lock", [child, register_name, reason, timeout])
+
+    def call_release_register_lock(self, register_name: str, child: str | None = None):
+        self.connection.send("cast", "call_release_register_lock", [register_name, child])
+
+    def call_release_channel_lock(self, channel_name: str, child: str | None = None):
+        self.connection.send("cast", "call_release_channel_lock", [channel_name, child])
+
+    def call_release_all_locks(self, child: str):
+        self.connection.send("cast", "call_release_all_locks", [child])
+
+
+class AngelHost:
+    """Runs the angels placed on one worker process, driven by frames from the coordinator."""
+    def __init__(self):
+        self.connection: ipc.Connection | None = None
+        self.manager: ManagerProxy | None = None
+        self.angels: dict[str, Angel] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.stopped = asyncio.Event()
+
+    async def serve(self, path: str, index: int):
+        self.connection = await ipc.connect(path, index, self.handle)
+        self.manager = ManagerProxy(self.connection)
+        serving = asyncio.ensure_future(self.connection.serve())
+        await asyncio.wait([serving, asyncio.ensure_future(self.stopped.wait())], return_when=asyncio.FIRST_COMPLETED)
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        await self.connection.drain()
+        self.connection.close()
+
+    def handle(self, connection: ipc.Connection, frame: tuple):
+        op, *args = frame
+        if op == "spawn":
+            name, goal, mailbox_size = args
+            self.angels[name] = Angel(name, goal, self.manager, mailbox_size)
+        elif op == "start":
+            self.start(args[0])
+        elif op == "stop":
+            self.stop(args[0])
+        elif op == "kill":
+            self.stop(args[0])
+            self.angels.pop(args[0], None)
+        elif op == "deliver":
+            name, sender, body, kind = args
+            try:
+                self.angels[name].inbox.put_nowait(Message(sender, body, kind))
+            except asyncio.QueueFull:
+                connection.send("full", name, len(self.angels[name].inbox), body)
+            except KeyError:
+                logging.warning("Message for %s, which is not on this worker", name)
+        elif op == "collect":
+            return self.collect()
+        elif op == "metrics":
+            return metrics.get_metrics().drain()
+        elif op == "shutdown":
+            self.stopped.set()
+        else:
+            logging.error("Unknown frame %s", op)
+
+    def start(self, name: str):
+        task = asyncio.ensure_future(self.angels[name].run())
+        task.add_done_callback(lambda task: self.exited(name, task))
+        self.tasks[name] = task
+
+    def stop(self, name: str):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def exited(self, name: str, task: asyncio.Task):
+        if self.tasks.get(name) is not task:
+            return
+        del self.tasks[name]
+        error = None if task.cancelled() or task.exception() is None else repr(task.exception())
+        self.connection.send("exit", name, error)
+
+    def collect(self) -> list:
+        """Drain every outbox in one batch: (name, thoughts, unread, [(sender, body, kind), ...]) per angel."""
+        return [(name, angel.thoughts, len(angel.inbox), [(m.sender, m.body, m.kind) for m in angel.outbox.drain()])
+                for name, angel in self.angels.items()]
+
+
+def worker_main(path: str, index: int, backend: backends.Backend, log_level: int,
+                response_cache: cache.ResponseCache | None = None, metrics_enabled: bool = False):
+    """Entry point of a worker process. Its metrics are drained into the coordinator's every tick, it never exports them."""
+    logging.basicConfig(level=log_level, format=f"[worker {index}] %(levelname)s %(message)s")
+    backends.set_backend(backend)
+    LLM.response_cache = response_cache
+    metrics.set_metrics(metrics.Metrics(enabled=metrics_enabled))
+    asyncio.run(AngelHost().serve(path, index))
 
 
 class Chuck:
+    RESTART_STRATEGIES = ("permanent", "transient", "temporary")
+
     def __init__(self,
-                goal: str):
+                goal: str,
+                fused: bool = False,
+                structured: bool = True,
+                streaming: bool = False,
+                restart: str = "transient",
+                max_restarts: int = 3,
+                restart_window: float = 60.0,
+                workers: int = 0,
+                placement: str = "least-loaded",
+                knowledge: retrieval.Index | None = None,
+                context_k: int = 8,
+                knowledge_tokens: int = 1500):
+        """
+        restart is what happens when a child's task ends: permanent restarts it always, transient only when it crashed,
+        temporary never. A child restarted more than max_restarts times in restart_window seconds is killed.
+        With workers > 0 children are sharded over that many worker processes by placement, and Chuck only
+        coordinates: registers, locks and the manager prompts stay here. workers=0 keeps everything in one process.
+        Manager prompts carry the context_k registers and public ideas most relevant to the goal rather than all of them,
+        and up to knowledge_tokens of the knowledge base when there is one.
+        """
+        if restart not in self.RESTART_STRATEGIES:
+            raise ValueError(f"Unknown restart strategy {restart}, expected one of {self.RESTART_STRATEGIES}")
         self.goal = goal
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.restarts: dict[str, list[float]] = {}
+        self.workers = workers
+        self.placement = placement
+        self.pool: ipc.WorkerPool | None = None
+        self.knowledge = knowledge
+        self.context_k = context_k
+        self.knowledge_tokens = knowledge_tokens
+        self.fused = fused
+        self.structured = structured
+        self.streaming = streaming
         self.memory: dict[str, Register] = {}
-        self.memory_locks: dict[str, str] = {} # register_name: child_name
+        self.register_lock_manager = locks.LockManager("register",
+                                                      on_grant=self.__on_register_grant,
+                                                      on_release=self.__on_register_release,
+                                                      on_escalate=self.__on_register_escalate)
 
         self.pub_thoughts: dict[str, Thought] = {}
         self.child_message_queue: dict[str, str] = {}
@@ -160,13 +631,34 @@ class Chuck:
 
         self.InChannels: dict[str, ChannelIn] = {}
         self.OutChannels: dict[str, ChannelOut] = {}
-        self.channel_locks: dict[str, str] = {} # channel_name: child_name
+        self.channel_lock_manager = locks.LockManager("channel",
+                                                     on_grant=self.__on_channel_grant,
+                                                     on_release=self.__on_channel_release,
+                                                     on_escalate=self.__on_channel_escalate)
 
         self.name_generator = utils.NameGenerator()
         self.children: dict[str, Angel] = {}
 
-    async def child_lifecycle(self):
-        OPTIONS = """
+        self.syscall_table = syscalls.DispatchTable({
+            "__spawn_process": self.__spawn_process,
+            "__kill_process": self.__kill_process,
+            "__create_register": self.__create_register,
+            "__consolidate_registers": self.__consolidate_registers,
+            "__delete_register": self.__delete_register,
+            "__grant_register_lock": self.__grant_register_lock,
+            "__force_release_register_lock": self.__force_release_register_lock,
+            "__send_message": self.__send_message,
+        }, on_error=self.__on_syscall_error)
+
+    @property
+    def memory_locks(self) -> dict[str, str]: # register_name: child_name
+        return self.register_lock_manager.holders()
+
+    @property
+    def channel_locks(self) -> dict[str, str]: # channel_name: child_name
+        return self.channel_lock_manager.holders()
+
+    CHILD_OPTIONS = """
 1. __spawn_process(goal: str)
 A child process is created with the given name and goal.
 The child process will process information and communicate with the parent process using sys calls.
@@ -175,29 +667,11 @@ The child process will be added to the list of child processes.
 2. __kill_process(name: str)
 The child process with the given name is killed.
 """
-        KNOWLEDGE = f"""
-GOAL: {self.goal}
-CHILDREN: {self.children}
-MESSAGES FROM CHILDREN: {self.child_message_queue}
-"""
-        EXAMPLE = """__spawn_process("Figure out what we should do with the new information")
+    CHILD_EXAMPLE = """__spawn_process("Figure out what we should do with the new information")
 __spawn_process("Where can we find more information on this topic?")
 __kill_process("michael")
 """
-        EXTRA= "Do not include any extraneous information. Do not give children the same task."
-        resp = await LLM.call(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {OPTIONS}. Example response: {EXAMPLE}. Extra: {EXTRA}")
-        resp = resp.split("\n")
-        print(resp)
-        for r in resp:
-            if "__spawn_process" in r:
-                goal= r.removeprefix("__spawn_process(").removesuffix(")")
-                self.__spawn_process(goal)
-            elif "__kill_process" in r:
-                name= r.removeprefix("__kill_process(").removesuffix(")")
-                self.__kill_process(name)
-
-    async def register_lifecycle(self):
-        OPTIONS = """
+    REGISTER_OPTIONS = """
 1. __create_register(name: str, description: str)
 A register is created with the given name and description. Registers are used for storing general information that might be useful to children.
 The register is added to the list of registers.
@@ -208,35 +682,11 @@ The old registers are deleted.
 3. __delete_register(name: str)
 The register with the given name is deleted.
 """
-        KNOWLEDGE = f"""
-GOAL: {self.goal}
-REGISTERS: {self.memory}
-PUBLIC IDEAS: {self.pub_thoughts}
-PRIVATE IDEAS: {self.priv_thoughts}
-"""
-        EXAMPLE = """__create_register("thoughts", "A register to store thoughts")
+    REGISTER_EXAMPLE = """__create_register("thoughts", "A register to store thoughts")
 __consolidate_registers(["favorite_exercises", "favorite_foods"], "favorite_things")
 __delete_register("fish")
 """
-        resp = await LLM.call(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {OPTIONS}. Example response: {EXAMPLE} Do not include any extraneous information.")
-        resp = resp.split("\n")
-        print(resp)
-        for r in resp:
-            if "__create_register" in r:
-                name= r.removeprefix("__create_register(").split(",")[0].replace('"', "")
-                description= r.removeprefix("__create_register(").split(",")[1].removesuffix(")")
-                self.memory[name] = Register(name, description)
-                self.__create_register(name, description)
-            elif "__consolidate_registers" in r:
-                list_of_registers= r.removeprefix("__consolidate_registers(").split(",")[0]
-                new_register_name= r.removeprefix("__consolidate_registers(").split(",")[1].removesuffix(")")
-                print("NOT IMPLEMENTED")
-            elif "__delete_register" in r:
-                name= r.removeprefix("__delete_register(").removesuffix(")")
-                print("NOT IMPLEMENTED")
-
-    async def child_communication_lifecycle(self):
-        OPTIONS = """
+    COMMUNICATION_OPTIONS = """
 1. __grant_register_lock(register_name: str, child: str)
 The register with the given name is locked to the child process with the given name.
 The register lock is a sempaphore to protect concurrent access to the register. Only one child can have access to the register at a time.
@@ -248,38 +698,157 @@ The register with the given name is forcefully released.
 3. __send_message(name: str, message: str)
 The child process with the given name is sent the given message.
 """
-        KNOWLEDGE = f"""
-GOAL: {self.goal}
-CHILDREN: {self.children}
-MESSAGES FROM CHILDREN: {self.child_message_queue}
-"""
-        EXAMPLE = """__grant_register_lock("thoughts", "michael")
+    COMMUNICATION_EXAMPLE = """__grant_register_lock("thoughts", "michael")
 __force_release_register_lock("project_facts")
 __send_message("michael", "What do you think about the new information?")
 """
+    # Order fused tick syscalls are dispatched in: free children and registers before handing out new work and locks.
+    SYSCALL_ORDER = [
+        "__kill_process",
+        "__spawn_process",
+        "__create_register",
+        "__consolidate_registers",
+        "__delete_register",
+        "__force_release_register_lock",
+        "__grant_register_lock",
+        "__send_message",
+    ]
+    FUSED_END = "END"
+
+    async def child_lifecycle(self):
+        KNOWLEDGE = self.knowledge_block(("GOAL", self.goal, 0, "head"),
+                                   ("CHILDREN", self.children, 1, "head"),
+                                   ("MESSAGES FROM CHILDREN", self.child_message_queue, 2, "tail"))
+        EXTRA= "Do not include any extraneous information. Do not give children the same task."
+        await self.__run_syscalls(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {self.CHILD_OPTIONS}. Example response: {self.CHILD_EXAMPLE}. Extra: {EXTRA}",
+                                   syscalls.subset("__spawn_process", "__kill_process"))
+
+    async def register_lifecycle(self):
+        KNOWLEDGE = self.knowledge_block(("GOAL", self.goal, 0, "head"),
+                                         ("REGISTERS", self.relevant_registers(), 1, "head"),
+                                         ("PUBLIC IDEAS", retrieval.relevant(self.goal, self.pub_thoughts, self.context_k, lambda thought: thought.information), 2, "tail"),
+                                         ("PRIVATE IDEAS", self.priv_thoughts, 3, "tail"),
+                                         ("KNOWLEDGE BASE", self.knowledge_context(), 4, "tail"))
+        await self.__run_syscalls(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {self.REGISTER_OPTIONS}. Example response: {self.REGISTER_EXAMPLE} Do not include any extraneous information.",
+                                   syscalls.subset("__create_register", "__consolidate_registers", "__delete_register"))
+
+    async def child_communication_lifecycle(self):
+        KNOWLEDGE = self.knowledge_block(("GOAL", self.goal, 0, "head"),
+                                   ("CHILDREN", self.children, 1, "head"),
+                                   ("MESSAGES FROM CHILDREN", self.child_message_queue, 2, "tail"))
         EXTRA= "Do not include any extraneous information. Do not send a message with no purpose."
-        resp = await LLM.call(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {OPTIONS}. Example response: {EXAMPLE}. Extra: {EXTRA}")
-        print(resp)
-        resp = resp.split("\n")
-        for r in resp:
-            if "__grant_register_lock" in r:
-                register_name= r.removeprefix("__grant_register_lock(").split(",")[0].replace('"', "").replace(" ", "")
-                child= r.removeprefix("__grant_register_lock(").split(",")[1].removesuffix(")").replace('"', "").replace(" ", "")
-                logging.debug(f"Register lock requested for {register_name} by {child}")
-                self.__grant_register_lock(register_name, child)
-
-            elif "__force_release_register_lock" in r:
-                register_name= r.removeprefix("__force_release_register_lock(").removesuffix(")")
-                logging.debug(f"Force releasing register {register_name}")
-                self.__force_release_register_lock(register_name)
-
-            elif "__send_message" in r:
-                name= r.removeprefix("__send_message(").split(",")[0].replace('"', "").replace(" ", "")
-                message= r.removeprefix("__send_message(").split(",")[1].removesuffix(")")
-                logging.debug(f"Sending message to {name}, {message}")
-                self.__send_message(name, message)
+        await self.__run_syscalls(f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {self.COMMUNICATION_OPTIONS}. Example response: {self.COMMUNICATION_EXAMPLE}. Extra: {EXTRA}",
+                                   syscalls.subset("__grant_register_lock", "__force_release_register_lock", "__send_message"))
+
+    def relevant_registers(self) -> dict[str, Register] | str:
+        """The context_k registers most relevant to the goal, the rest listed by name so they can still be consolidated."""
+        relevant = retrieval.relevant(self.goal, self.memory, self.context_k, lambda register: register.description)
+        others = [name for name in self.memory if name not in relevant]
+        return f"{relevant}, others: {others}" if others else relevant
+
+    def knowledge_context(self) -> str | None:
+        """Knowledge base chunks relevant to the goal and to what the registers hold."""
+        if self.knowledge is None:
+            return None
+        query = " ".join([self.goal] + [register.description for register in self.memory.values()])
+        return self.knowledge.context(query, self.knowledge_tokens)
+
+    def knowledge_block(self, *sections: tuple[str, object, int, str]) -> str:
+        """
+        The KNOWLEDGE block of a manager prompt from (name, value, priority, truncation policy) sections.
+        It gets the prompt budget minus room for the options and examples around it. Sections without a value are left out.
+        """
+        knowledge = budget.ContextBudget(budget.DEFAULT_PROMPT_TOKENS - 2000, LLM.model)
+        for name, value, priority, policy in sections:
+            if value is None:
+                continue
+            knowledge.add(value, priority, policy, label=f"\n{name}: ")
+        return knowledge.add("\n").render()
+
+    async def __run_syscalls(self, prompt: str, schema: dict[str, syscalls.Syscall]):
+        """Prompt for syscalls and dispatch them. When streaming, each call is dispatched as soon as its line is complete."""
+        if not self.streaming or (self.structured and backends.get_backend().supports_json):
+            for call in await self.__prompt_syscalls(prompt, schema):
+                self.syscall_table.dispatch(call)
+            return
+        errors = []
+        async for parsed in syscalls.parse_stream(LLM.stream(prompt), schema):
+            if isinstance(parsed, syscalls.SyscallError):
+                errors.append(parsed)
+                continue
+            logging.debug("Streamed %r", parsed)
+            self.syscall_table.dispatch(parsed)
+        if errors:
+            for call in await self.__repair_syscalls(errors, schema):
+                self.syscall_table.dispatch(call)
+
+    async def __prompt_syscalls(self, prompt: str, schema: dict[str, syscalls.Syscall], fused: bool = False) -> list[syscalls.SyscallCall] | None:
+        """
+        Ask for syscalls and parse them, as JSON when the backend supports structured output.
+        Broken calls are re-prompted once on their own. A fused response that is missing END or has no usable calls gives None.
+        """
+        if self.structured and backends.get_backend().supports_json:
+            resp = await LLM.call(f"{prompt}\n{syscalls.json_instructions(schema)}", generation_config=backends.JSON_CONFIG)
+            logging.debug("Syscall response: %s", resp)
+            calls, errors = syscalls.parse_json(resp, schema)
+        else:
+            resp = await LLM.call(prompt)
+            logging.debug("Syscall response: %s", resp)
+            if fused:
+                lines = resp.strip().strip("`").rstrip().split("\n")
+                if lines[-1].strip() != self.FUSED_END:
+                    return None
+                resp = "\n".join(lines[:-1])
+            calls, errors = syscalls.parse(resp, schema)
+        if fused and errors and not calls:
+            return None
+        if errors:
+            calls += await self.__repair_syscalls(errors, schema)
+        return calls
+
+    async def __repair_syscalls(self, errors: list[syscalls.SyscallError], schema: dict[str, syscalls.Syscall]) -> list[syscalls.SyscallCall]:
+        for error in errors:
+            logging.warning("Malformed syscall, %s", error)
+        BROKEN = "\n".join(str(error) for error in errors)
+        SIGNATURES = "\n".join(syscall.signature() for syscall in schema.values())
+        resp = await LLM.call(f"These syscalls could not be parsed:\n{BROKEN}\nRewrite only these calls so each matches one of:\n{SIGNATURES}\nOne call per line, strings in double quotes, lists in square brackets. Do not include any extraneous information.", fresh=True)
+        calls, errors = syscalls.parse(resp, schema)
+        for error in errors:
+            logging.error("Dropping syscall, %s", error)
+        return calls
+
+    def fused_prompt(self) -> str:
+        KNOWLEDGE = self.knowledge_block(("GOAL", self.goal, 0, "head"),
+                                         ("CHILDREN", self.children, 1, "head"),
+                                         ("MESSAGES FROM CHILDREN", self.child_message_queue, 2, "tail"),
+                                         ("REGISTERS", self.relevant_registers(), 2, "head"),
+                                         ("PUBLIC IDEAS", retrieval.relevant(self.goal, self.pub_thoughts, self.context_k, lambda thought: thought.information), 3, "tail"),
+                                         ("PRIVATE IDEAS", self.priv_thoughts, 4, "tail"),
+                                         ("KNOWLEDGE BASE", self.knowledge_context(), 5, "tail"))
+        OPTIONS = f"""
+Child processes:{self.CHILD_OPTIONS}
+Registers:{self.REGISTER_OPTIONS}
+Communication:{self.COMMUNICATION_OPTIONS}"""
+        EXAMPLE = self.CHILD_EXAMPLE + self.REGISTER_EXAMPLE + self.COMMUNICATION_EXAMPLE + self.FUSED_END
+        EXTRA = (f"Do not include any extraneous information, one call per line. Do not give children the same task. "
+                 f"Do not send a message with no purpose. Finish with a line containing only {self.FUSED_END}.")
+        return f"Context: {KNOWLEDGE}. Choose from options, can choose multiple: {OPTIONS}. Example response: {EXAMPLE}. Extra: {EXTRA}"
+
+    async def fused_lifecycle(self) -> bool:
+        """One round trip covering children, registers and communication. Returns False if the response was unusable."""
+        calls = await self.__prompt_syscalls(self.fused_prompt(), syscalls.KERNEL_SYSCALLS, fused=True)
+        if calls is None:
+            logging.warning("Could not parse fused tick response, falling back to three phase tick")
+            return False
+        for call in sorted(calls, key=lambda call: self.SYSCALL_ORDER.index(call.name)):
+            self.syscall_table.dispatch(call)
+        return True
 
     async def chuck_lifecycle(self):
+        self.register_lock_manager.reap()
+        self.channel_lock_manager.reap()
+        if self.fused and await self.fused_lifecycle():
+            return
         await self.child_lifecycle()
         await self.register_lifecycle()
         await self.child_communication_lifecycle()
@@ -287,85 +856,320 @@ __send_message("michael", "What do you think about the new information?")
 
     def __spawn_process(self, goal: str):
         name = self.name_generator.generate_name()
-        logging.debug(f"Spawning process {name} with goal {goal}")
-        child = Angel(name=name, goal=goal, manager=self)
+        logging.debug("Spawning process %s with goal %s", name, goal)
+        if self.pool is not None:
+            child = RemoteAngel(name=name, goal=goal, manager=self, pool=self.pool)
+        else:
+            child = Angel(name=name, goal=goal, manager=self)
         self.children[name] = child
-        logging.info(f"Spawned {name} created with goal {goal}")
+        self.start_child(name)
+        metrics.get_metrics().count("syscalls_total", syscall="spawn")
+        logging.info("Spawned %s created with goal %s", name, goal)
 
-    def __kill_process(self, name: str):
-        logging.debug(f"Killing {name}")
+    def start_child(self, name: str):
+        """Run the child as its own task, if there is an event loop to run it on."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = asyncio.ensure_future(self.children[name].run())
+        task.add_done_callback(lambda task: self.__supervise(name, task))
+        self.tasks[name] = task
+
+    def __supervise(self, name: str, task: asyncio.Task):
+        if self.tasks.get(name) is not task or name not in self.children:
+            return
+        del self.tasks[name]
+        crashed = not task.cancelled() and task.exception() is not None
+        if crashed:
+            logging.error("Process %s crashed: %r", name, task.exception())
+        if task.cancelled() or self.restart == "temporary" or (self.restart == "transient" and not crashed):
+            return
+        now = time.monotonic()
+        recent = [t for t in self.restarts.get(name, []) if now - t < self.restart_window] + [now]
+        self.restarts[name] = recent
+        if len(recent) > self.max_restarts:
+            logging.error("Process %s restarted %s times in %ss, killing it", name, self.max_restarts, self.restart_window)
+            self.__kill_process(name)
+            return
+        logging.info("Restarting process %s", name)
+        self.start_child(name)
 
-        self.children[name].smite()
+    def __kill_process(self, name: str):
+        logging.debug("Killing %s", name)
+        child = self.children[name]
+        child.smite()
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+        # Names are recycled, whatever the dead process had pending must not reach the next one to get its name.
+        child.inbox.drain()
+        child.outbox.drain()
+        self.child_message_queue.pop(name, None)
         del self.children[name]
-        logging.info(f"Killed {name}")
+        self.restarts.pop(name, None)
+        self.name_generator.release(name)
+        metrics.get_metrics().count("syscalls_total", syscall="kill")
+        logging.info("Killed %s", name)
 
     def __send_message(self, name: str, message: str):
-        logging.debug(f"Sending message to process {name}")
-        logging.info(f"Sending message to process {name}: {message}")
-        if len(self.children[name].manager_messages) > 10:
-            self.children[name].manager_messages.pop(0)
-        self.children[name].manager_messages.append(message)
+        logging.debug("Sending message to process %s", name)
+        logging.info("Sending message to process %s: %s", name, message)
+        try:
+            self.children[name].inbox.put_nowait(Message("manager", message))
+        except asyncio.QueueFull:
+            # Backpressure: the manager hears about it next tick instead of the message silently replacing an older one.
+            logging.warning("Mailbox of %s is full, message not delivered", name)
+            self.child_message_queue['self'] = f"{name} has {len(self.children[name].inbox)} unread messages, message not delivered: {message}"
+        else:
+            metrics.get_metrics().count("syscalls_total", syscall="message")
+
+    def collect_messages(self):
+        """Move everything children have sent into child_message_queue, which frees their outboxes."""
+        for name, child in self.children.items():
+            messages = child.outbox.drain()
+            if messages:
+                self.child_message_queue[name] = "\n".join(message.body for message in messages)
+
+    async def collect_remote(self):
+        """Fetch what children on worker processes have sent, one batched call per worker."""
+        if self.pool is None:
+            return
+        for batch in await self.pool.gather("collect"):
+            for name, thoughts, unread, messages in batch:
+                child = self.children.get(name)
+                if not isinstance(child, RemoteAngel):
+                    continue
+                child.thoughts = thoughts
+                child.inbox.update(unread)
+                child.outbox.messages.extend(Message(*message) for message in messages)
+        await self.collect_metrics()
+
+    async def collect_metrics(self):
+        """Fold what the workers recorded into this process's metrics, so one export covers every process."""
+        if self.pool is None or not metrics.get_metrics().enabled:
+            return
+        for data in await self.pool.gather("metrics"):
+            metrics.get_metrics().merge(data)
+
+    # What angels on worker processes may ask of their manager.
+    REMOTE_CALLS = {
+        "req_ask_for_register_lock",
+        "req_ask_for_channel_lock",
+        "acquire_register_lock",
+        "call_release_register_lock",
+        "call_release_channel_lock",
+        "call_release_all_locks",
+    }
+
+    def __on_worker_frame(self, connection: ipc.Connection, frame: tuple):
+        op, *args = frame
+        if op == "cast" or op in self.REMOTE_CALLS:
+            # Casts arrive as ("cast", method, args), calls as (method, args) and get the result sent back.
+            method, arguments = args if op == "cast" else frame
+            if method not in self.REMOTE_CALLS:
+                raise ValueError(f"{method} can't be called by a worker")
+            return getattr(self, method)(*arguments)
+        if op == "exit":
+            name, error = args
+            child = self.children.get(name)
+            if isinstance(child, RemoteAngel):
+                child.exit(error)
+        elif op == "full":
+            name, unread, body = args
+            logging.warning("Mailbox of %s is full, message not delivered", name)
+            self.child_message_queue['self'] = f"{name} has {unread} unread messages, message not delivered: {body}"
+            if isinstance(self.children.get(name), RemoteAngel):
+                self.children[name].inbox.update(unread)
+        else:
+            logging.error("Unknown frame %s from a worker", op)
+
+    async def start_workers(self):
+        if self.workers <= 0 or self.pool is not None:
+            return
+        self.pool = ipc.WorkerPool(self.workers, worker_main,
+                                   (backends.get_backend(), logging.getLogger().level, LLM.response_cache, metrics.get_metrics().enabled),
+                                   self.placement, handler=self.__on_worker_frame)
+        await self.pool.start()
+
+    async def run(self, ticks: int | None = None, interval: float = 0.0):
+        """Run manager ticks while children work concurrently. ticks=None runs until cancelled."""
+        tick = 0
+        try:
+            await self.start_workers()
+            while ticks is None or tick < ticks:
+                with metrics.get_metrics().span("tick") as span:
+                    await self.collect_remote()
+                    self.collect_messages()
+                    await self.chuck_lifecycle()
+                    span.set(tick=tick, children=len(self.children), registers=len(self.memory))
+                metrics.get_metrics().export()
+                tick += 1
+                await asyncio.sleep(interval)
+        finally:
+            await self.shutdown()
+            metrics.get_metrics().export()
+
+    async def shutdown(self):
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.pool is not None:
+            await self.collect_metrics()
+            await self.pool.stop()
+            self.pool = None
+
+    def __on_syscall_error(self, call: syscalls.SyscallCall, error: Exception):
+        # Shown in the next manager prompt, so the model can correct the call.
+        self.child_message_queue['self'] = f"{call!r} failed: {error}"
 
     def __create_register(self, name: str, description: str):
-        logging.debug(f"Creating register {name}")
+        if name in self.memory:
+            raise ValueError(f"Register {name} already exists")
+        logging.debug("Creating register %s", name)
         self.memory[name] = Register(name, description)
-        logging.info(f"Created register {name}")
+        logging.info("Created register %s", name)
+
+    def __consolidate_registers(self, list_of_registers: list[str], new_register_name: str):
+        registers = [self.memory[name] for name in list_of_registers]
+        for name in list_of_registers:
+            if name in self.memory_locks:
+                raise ValueError(f"Register {name} is locked to {self.memory_locks[name]}")
+        # Consolidating into one of the registers being consolidated is fine, it is replaced.
+        if new_register_name in self.memory and new_register_name not in list_of_registers:
+            raise ValueError(f"Register {new_register_name} already exists")
+        logging.debug("Consolidating registers %s into %s", list_of_registers, new_register_name)
+        consolidated = Register(new_register_name,
+                                "; ".join(register.description for register in registers),
+                                size=sum(register.size for register in registers) + len(registers))
+        # Straight into storage, the new register isn't locked to anyone yet.
+        consolidated.storage.append("\n".join(register.get() for register in registers if register.get()))
+        for name in list_of_registers:
+            del self.memory[name]
+            self.register_lock_manager.discard(name)
+        self.memory[new_register_name] = consolidated
+        logging.info("Consolidated %d registers into %s", len(registers), new_register_name)
+
+    def __delete_register(self, name: str):
+        logging.debug("Deleting register %s", name)
+        register = self.memory.pop(name)
+        self.register_lock_manager.discard(name)
+        logging.info("Deleted register %s", register.name)
+
+    def req_ask_for_register_lock(self, child: str, register_name: str, reason: str) -> str:
+        """
+        Free registers are locked to the child straight away. Contended requests are queued and escalated to the
+        manager prompt, the child gets the lock in FIFO order when it's released unless the manager steps in first.
+        """
+        try:
+            return self.register_lock_manager.request(register_name, child, reason)
+        except locks.DeadlockError as e:
+            self.child_message_queue[child] = f"denied: {e}"
+            return locks.DENY
+
+    async def acquire_register_lock(self, child: str, register_name: str, reason: str, timeout: float | None = None) -> bool:
+        try:
+            return await self.register_lock_manager.acquire(register_name, child, reason, timeout)
+        except locks.DeadlockError as e:
+            self.child_message_queue[child] = f"denied: {e}"
+            return False
+
+    def __on_register_grant(self, register_name: str, child: str):
+        metrics.get_metrics().count("syscalls_total", syscall="lock_grant")
+        if register_name in self.memory:
+            self.memory[register_name].lock_to_process(child)
+        if child in self.children and register_name not in self.children[child].locked_registers:
+            self.children[child].locked_registers.append(register_name)
 
-    def req_ask_for_register_lock(self, child: str, register_name: str, reason: str):
+    def __on_register_release(self, register_name: str, child: str):
+        if register_name in self.memory:
+            self.memory[register_name].unlock()
+        if child in self.children and register_name in self.children[child].locked_registers:
+            self.children[child].locked_registers.remove(register_name)
+
+    def __on_register_escalate(self, register_name: str, child: str, reason: str):
         self.child_message_queue[child] = f"requesting: __grant_register_lock({register_name}, {child}) reason: {reason}"
-         
-        if register_name not in self.memory_locks.keys():
+        holder = self.register_lock_manager.holder(register_name)
+        if holder is None:
             message = f"Register {register_name} is not currently locked by any child. Use __grant_register_lock(register_name: str, child: str) to grant access."
-            logging.debug(message)
-            self.child_message_queue['self'] = message
         else:
-            message = f"Register {register_name} is currently locked by {self.memory_locks[register_name]}. Use __force_release_register_lock(register_name: str) to force release it."
-            logging.debug(message)
-            self.child_message_queue['self'] = message
+            message = f"Register {register_name} is currently locked by {holder}. Use __force_release_register_lock(register_name: str) to force release it."
+        logging.debug(message)
+        self.child_message_queue['self'] = message
 
     def __grant_register_lock(self, register_name: str, child: str):
-        self.memory_locks[register_name] = child
-        self.children[child].locked_registers.append(register_name)
-        logging.info(f"Register {register_name} locked to {child}")
+        if child not in self.children:
+            raise KeyError(child)
+        self.register_lock_manager.grant(register_name, child)
 
     def __force_release_register_lock(self, register_name: str):
-        child_locker = self.memory_locks[register_name]
-        self.children[child_locker].__release_register_lock(register_name)
-        self.memory_locks.pop(register_name)
+        if self.register_lock_manager.holder(register_name) is None:
+            raise KeyError(register_name)
+        logging.debug("Force releasing register %s", register_name)
+        self.register_lock_manager.release(register_name)
 
+    def call_release_register_lock(self, register_name: str, child: str | None = None):
+        self.register_lock_manager.release(register_name, child)
 
-    def call_release_register_lock(self, register_name: str):
-        self.__force_release_register_lock(register_name)
-        pass
+    def call_release_all_locks(self, child: str):
+        self.register_lock_manager.release_all(child)
+        self.channel_lock_manager.release_all(child)
 
     def call_add_public_thought(self, thought_name: str, thought: Thought):
         self.pub_thoughts[thought_name] = thought
 
-    def req_ask_for_channel_lock(self, channel_name: str):
-        pass
+    def req_ask_for_channel_lock(self, child: str, channel_name: str, reason: str = "") -> str:
+        try:
+            return self.channel_lock_manager.request(channel_name, child, reason)
+        except locks.DeadlockError as e:
+            self.child_message_queue[child] = f"denied: {e}"
+            return locks.DENY
 
-    def __grant_channel_lock(self, channel_name: str, child: str):
-        pass
+    def __on_channel_grant(self, channel_name: str, child: str):
+        if child in self.children and channel_name not in self.children[child].locked_channels:
+            self.children[child].locked_channels.append(channel_name)
+
+    def __on_channel_release(self, channel_name: str, child: str):
+        if child in self.children and channel_name in self.children[child].locked_channels:
+            self.children[child].locked_channels.remove(channel_name)
+
+    def __on_channel_escalate(self, channel_name: str, child: str, reason: str):
+        self.child_message_queue[child] = f"requesting channel {channel_name}, held by {self.channel_lock_manager.holder(channel_name)}. reason: {reason}"
 
-    def call_release_channel_lock(self, channel_name: str):
-        pass
+    def __grant_channel_lock(self, channel_name: str, child: str):
+        if child not in self.children:
+            raise KeyError(child)
+        self.channel_lock_manager.grant(channel_name, child)
 
+    def call_release_channel_lock(self, channel_name: str, child: str | None = None):
+        self.channel_lock_manager.release(channel_name, child)
 
     
 def main():
     parser = argparse.ArgumentParser(description="Register script with logging.")
     parser.add_argument('--log-level', default='WARNING', help='Set the logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)')
+    backends.add_backend_arguments(parser)
+    cache.add_cache_arguments(parser)
+    parser.add_argument('--fused', action='store_true', help='Run each kernel tick as one combined LLM call')
+    parser.add_argument('--streaming', action='store_true', help='Dispatch syscalls as soon as each line is streamed back')
+    parser.add_argument('--ticks', type=int, default=1, help='Manager ticks to run, 0 runs forever')
+    parser.add_argument('--tick-interval', type=float, default=0.0, help='Seconds between manager ticks')
+    parser.add_argument('--restart', default='transient', choices=Chuck.RESTART_STRATEGIES, help='What to do when a child process stops')
+    ipc.add_ipc_arguments(parser)
+    retrieval.add_retrieval_arguments(parser)
+    metrics.add_metrics_arguments(parser)
     args = parser.parse_args()
 
     logging.basicConfig(level=getattr(logging, args.log_level.upper(), None))
-    chuck = Chuck(goal="Create a new fitness app.")
-    async def run_lifecycle():
-        #while True:
-        await chuck.chuck_lifecycle()
-
-
-
-    asyncio.run(run_lifecycle())
+    backends.set_backend(backends.backend_from_args(args))
+    LLM.response_cache = cache.cache_from_args(args)
+    metrics.set_metrics(metrics.metrics_from_args(args))
+    chuck = Chuck(goal="Create a new fitness app.", fused=args.fused, streaming=args.streaming, restart=args.restart,
+                  workers=args.workers, placement=args.placement,
+                  knowledge=retrieval.knowledge_from_args(args), knowledge_tokens=args.knowledge_tokens)
+    asyncio.run(chuck.run(args.ticks or None, args.tick_interval))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,42 +1,93 @@
-import google.generativeai as ai
+import backends
 import time
 import dotenv
-import os
 import asyncio
 import logging
 import argparse
-from typing import Tuple
+from typing import Tuple, Callable, AsyncIterator
 import inspect
-import subprocess
+import json
+import sys
+import os
+import threading
+from collections import deque
 import utils
+import scheduler
+import cache
+import packing
+import budget
+import hedging
+import digest
+import terminal
+import retrieval
+import metrics
+from src import mirror
+from src import symbols
+from src import file_classifier
 
 dotenv.load_dotenv()
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-ai.configure(api_key=API_KEY)
-
 
 Id=str
 
 PipelineTask = tuple[Id,str]
 
 class LLM:
+    model: str = backends.DEFAULT_MODEL
+    generation_config: dict | None = None
+    task_scheduler: scheduler.Scheduler = scheduler.Scheduler()
+    response_cache: cache.ResponseCache | None = cache.ResponseCache()
+    hedger: hedging.Hedger | None = None
+
+    @staticmethod
+    async def prompt(prompt: str, priority: int = scheduler.PRIORITY_DEFAULT, fresh: bool = False):
+        """
+        Answer from the response cache when possible, otherwise schedule a call. fresh=True skips the cache.
+        With a hedger, a scheduled call that runs long races a duplicate.
+        """
+        attempts = scheduled = 0
+        async def generate_once():
+            nonlocal attempts
+            attempts += 1
+            return await LLM.generate(prompt)
+        tokens = scheduler.estimate_tokens(prompt)
+        def generate():
+            nonlocal scheduled
+            scheduled += 1
+            if LLM.hedger is None:
+                return generate_once()
+            # The duplicate takes its own slot and rate limit share.
+            return LLM.hedger.run(LLM.model, generate_once, lambda hedge: LLM.task_scheduler.attempt(hedge, priority, tokens))
+        async def call():
+            return await LLM.task_scheduler.run(generate, priority, tokens)
+        with metrics.get_metrics().span("llm_call", model=LLM.model) as span:
+            if LLM.response_cache is None:
+                response = await call()
+            else:
+                response = await LLM.response_cache.fetch(LLM.model, LLM.generation_config, prompt, call, fresh)
+            if span:
+                # Every scheduler attempt after the first is a retry, every call beyond those a hedge. No attempts at all means the cache answered.
+                span.set(cache_hit=attempts == 0).add(prompt_tokens=tokens, response_tokens=scheduler.estimate_tokens(response),
+                                                      attempts=attempts, retries=max(scheduled - 1, 0), hedges=attempts - scheduled)
+        return response
+
+    @staticmethod
+    async def generate(prompt: str):
+        # Timing is in the llm_call span, see metrics.
+        start_time = time.monotonic()
+        response = await backends.get_backend().generate(prompt, LLM.model, LLM.generation_config)
+        logging.debug("Backend call took %.2f seconds: %s", time.monotonic() - start_time, response)
+        return response
 
     @staticmethod
-    async def prompt(prompt: str):
-        start_time = time.time()
-        logging.debug(f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))}")
-        model = ai.GenerativeModel("gemini-1.5-flash")
-        response = await model.generate_content_async(prompt)
-        end_time = time.time()
-        logging.debug(f"Ended at: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end_time))}")
-        logging.debug(f"Duration: {end_time - start_time:.2f} seconds")
-        logging.debug(response.candidates[0].content.parts[0].text)
-        return response.candidates[0].content.parts[0].text
+    def submit(task: PipelineTask, priority: int = scheduler.PRIORITY_DEFAULT, fresh: bool = False) -> asyncio.Task:
+        return asyncio.ensure_future(LLM.prompt(task[1], priority, fresh))
 
     @staticmethod
-    async def multi_prompt(prompts: list[PipelineTask]):
-        tasks = [LLM.prompt(prompt[1]) for prompt in prompts]
+    async def multi_prompt(prompts: list[PipelineTask], priorities: dict[Id, int] | None = None, fresh: set[Id] | None = None):
+        priorities = priorities or {}
+        fresh = fresh or set()
+        tasks = [LLM.submit(prompt, priorities.get(prompt[0], scheduler.PRIORITY_DEFAULT), prompt[0] in fresh) for prompt in prompts]
         results = await asyncio.gather(*tasks)
         prompt_result_dict = dict(zip([prompt[0] for prompt in prompts], results))
         return prompt_result_dict
@@ -44,24 +95,186 @@ class LLM:
 # -- 
 class Chuck:
     
-    def __init__(self):
+    def __init__(self, packing: bool = False, pack_tokens: int = 30000, pack_size: int = 8, carry_over: bool = True):
+        """carry_over decides what happens to tasks still running at the tick deadline: run again next tick, or fail as timed out."""
         self.pipeline: list[PipelineTask] = []
-        self.recent_result_set: dict[id, str]
+        self.priorities: dict[Id, int] = {}
+        self.fresh: set[Id] = set()
+        self.prefixes: dict[Id, str] = {}
+        self.packing = packing
+        self.pack_tokens = pack_tokens
+        self.pack_size = pack_size
+        self.callbacks: dict[Id, Callable[[str], None]] = {}
+        self.errbacks: dict[Id, Callable[[BaseException], None]] = {}
+        self.waiters: dict[Id, asyncio.Future] = {}
+        self.recent_result_set: dict[id, str] = {}
+        self.carry_over = carry_over
+        self.carried_over: int = 0
+        self.timed_out: list[Id] = []
         self.time: int = 0
         
-    def add(self, task_id: str, prompt: str):
+    def add(self, task_id: str, prompt: str, priority: int = scheduler.PRIORITY_DEFAULT, fresh: bool = False,
+            callback: Callable[[str], None] | None = None, prefix: str | None = None,
+            errback: Callable[[BaseException], None] | None = None):
+        """
+        callback is called with the result as soon as it lands, before the rest of the tick finishes.
+        errback is called with the error instead when the task fails or misses the deadline without carry_over.
+        prefix is the leading part of prompt shared with other tasks, tasks with the same prefix can be packed into one request.
+        """
         self.pipeline.append((task_id,prompt))
+        self.priorities[task_id] = priority
+        if fresh:
+            self.fresh.add(task_id)
+        if callback is not None:
+            self.callbacks[task_id] = callback
+        if errback is not None:
+            self.errbacks[task_id] = errback
+        if prefix and prompt.startswith(prefix):
+            self.prefixes[task_id] = prefix
 
     def lookup(self, task_id: str):
         return self.recent_result_set.get(task_id)
 
-
-    async def run(self):
-        logging.info(f"Running pipeline with {len(self.pipeline)} tasks, day {self.time}.")
-        self.recent_result_set= await LLM.multi_prompt(self.pipeline)
-        logging.info(F"Pipeline finished running")
-        self.pipeline=[]
-        self.time+=1
+    def waiter(self, task_id: Id) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        waiter = self.waiters.get(task_id)
+        if waiter is None or waiter.get_loop() is not loop:
+            waiter = loop.create_future()
+            self.waiters[task_id] = waiter
+        return waiter
+
+    async def lookup_async(self, task_id: Id) -> str:
+        """Wait for a specific task's result, even if the rest of the tick is still running."""
+        if task_id in self.recent_result_set:
+            return self.recent_result_set[task_id]
+        return await self.waiter(task_id)
+
+    def deliver(self, task_id: Id, result: str):
+        self.recent_result_set[task_id] = result
+        self.priorities.pop(task_id, None)
+        self.prefixes.pop(task_id, None)
+        self.fresh.discard(task_id)
+        self.errbacks.pop(task_id, None)
+        waiter = self.waiters.pop(task_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+        callback = self.callbacks.pop(task_id, None)
+        if callback is not None:
+            callback(result)
+
+    def fail(self, task_id: Id, error: BaseException):
+        if not isinstance(error, asyncio.TimeoutError):
+            logging.error("Task %s failed: %s", task_id, error)
+        self.priorities.pop(task_id, None)
+        self.prefixes.pop(task_id, None)
+        self.fresh.discard(task_id)
+        self.callbacks.pop(task_id, None)
+        waiter = self.waiters.pop(task_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(error)
+        errback = self.errbacks.pop(task_id, None)
+        if errback is not None:
+            errback(error)
+
+    def plan(self, tasks: list[PipelineTask]) -> list[list[PipelineTask]]:
+        """Group tasks into requests: packable tasks sharing a prefix are packed together, everything else goes alone."""
+        if not self.packing:
+            return [[task] for task in tasks]
+        groups: list[list[PipelineTask]] = []
+        by_prefix: dict[str, list[PipelineTask]] = {}
+        for task in tasks:
+            prefix = self.prefixes.get(task[0])
+            if prefix is None or task[0] in self.fresh:
+                groups.append([task])
+            else:
+                by_prefix.setdefault(prefix, []).append(task)
+        for prefix, members in by_prefix.items():
+            prompts = dict(members)
+            bodies = [(task_id, prompt[len(prefix):]) for task_id, prompt in members]
+            for pack in packing.plan_packs(prefix, bodies, self.pack_tokens, self.pack_size):
+                groups.append([(task_id, prompts[task_id]) for task_id, _ in pack])
+        return groups
+
+    def submit(self, group: list[PipelineTask]) -> asyncio.Task:
+        priority = min(self.priorities.get(task[0], scheduler.PRIORITY_DEFAULT) for task in group)
+        if len(group) == 1:
+            return LLM.submit(group[0], priority, group[0][0] in self.fresh)
+        prefix = self.prefixes[group[0][0]]
+        prompt = packing.pack_prompt(prefix, [task[1][len(prefix):] for task in group])
+        return LLM.submit((group[0][0], prompt), priority)
+
+    async def stream(self, deadline: float | None = None) -> AsyncIterator[tuple[Id, str]]:
+        """
+        Run the pipeline and yield (task_id, result) pairs as they complete.
+        Tasks still running after deadline seconds are cancelled and carried over to the next tick, or without
+        carry_over, failed with TimeoutError and listed in timed_out.
+        Tasks added while the tick is running (e.g. by callbacks) are run in the same tick.
+        When packing, a packed response that can't be split is retried as individual requests.
+        """
+        logging.info("Running pipeline with %d tasks, day %d.", len(self.pipeline), self.time)
+        span = metrics.get_metrics().span("tick")
+        span.set(day=self.time, tasks=len(self.pipeline))
+        tasks, self.pipeline = self.pipeline, []
+        self.recent_result_set = {}
+        self.timed_out = []
+        running = {self.submit(group): group for group in self.plan(tasks)}
+        if len(running) < len(tasks):
+            logging.info("Packed %d tasks into %d requests.", len(tasks), len(running))
+        end = None if deadline is None else time.monotonic() + deadline
+        try:
+            while running:
+                timeout = None if end is None else max(end - time.monotonic(), 0)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    group = running.pop(future)
+                    if future.exception() is not None:
+                        for task in group:
+                            self.fail(task[0], future.exception())
+                        continue
+                    if len(group) == 1:
+                        results = [future.result()]
+                    else:
+                        results = packing.split_packed(future.result(), len(group))
+                        if results is None:
+                            logging.warning("Could not split packed response, retrying %s tasks individually.", len(group))
+                            running.update({self.submit([task]): [task] for task in group})
+                            continue
+                    for task, result in zip(group, results):
+                        self.deliver(task[0], result)
+                        yield task[0], result
+                if self.pipeline:
+                    # Callbacks may queue follow-up work, it runs in this tick.
+                    added, self.pipeline = self.pipeline, []
+                    running.update({self.submit(group): group for group in self.plan(added)})
+        finally:
+            stragglers = [task for group in running.values() for task in group]
+            for future in running:
+                future.cancel()
+            if self.carry_over:
+                self.pipeline.extend(stragglers)
+                self.carried_over = len(stragglers)
+                if stragglers:
+                    logging.warning("%s tasks missed the tick deadline, carrying them over to day %s.", len(stragglers), self.time + 1)
+            else:
+                self.carried_over = 0
+                self.timed_out = [task[0] for task in stragglers]
+                if stragglers:
+                    logging.warning("%s tasks missed the tick deadline on day %s, marking them timed out.", len(stragglers), self.time)
+                for task in stragglers:
+                    self.fail(task[0], asyncio.TimeoutError(f"missed the day {self.time} deadline"))
+            logging.info("Pipeline finished running")
+            if LLM.response_cache is not None:
+                logging.info("Response cache: %s", LLM.response_cache.stats())
+            span.add(carried_over=self.carried_over, timed_out=len(self.timed_out))
+            span.end()
+            metrics.get_metrics().export()
+            self.time+=1
+
+    async def run(self, deadline: float | None = None):
+        async for _ in self.stream(deadline):
+            pass
 
 class IO:
     def __init__(self):
@@ -71,21 +284,91 @@ class IO:
         return inspect.getsource(type(self))
     
 class Terminal(IO):
-    def __init__(self):
+    def __init__(self, pool: terminal.TerminalPool | None = None):
+        super().__init__()
+        self.pool = pool or terminal.TerminalPool()
+
+    async def execute(self, command: str, angel: str | None = None, timeout: float | None = None) -> terminal.CommandResult:
+        """
+        Execute a command in the shell without blocking the kernel. With angel, it runs in that angel's own shell,
+        which keeps its working directory and variables between commands, otherwise each command gets a new shell.
+        The result has the exit code, stdout, stderr, duration and whether output was truncated or the command timed out.
+        """
+        return await self.pool.run(command, timeout, angel)
+
+    async def stream(self, command: str, angel: str | None = None, timeout: float | None = None) -> AsyncIterator[tuple[str, str] | terminal.CommandResult]:
+        """Like execute, but yields (stdout or stderr, text) as the command writes it, then the result."""
+        async for chunk in self.pool.stream(command, timeout, angel):
+            yield chunk
+
+    def close_session(self, angel: str):
+        self.pool.end_session(angel)
+
+class Mirror(IO):
+    def __init__(self, store: mirror.MirrorStore):
         super().__init__()
+        self.store = store
 
-    def execute(self, command: str) -> str:
-        """Execute a command in the shell. Each command gets a new shell."""
-        try:
-            result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            return result.stdout
-        except subprocess.CalledProcessError as e:
-            return e.stderr
+    def summary(self, path: str) -> str | None:
+        """The summary of one file of the repository, by its path relative to the repository root."""
+        return self.store.summary(path)
+
+    def analysis(self, path: str) -> dict | None:
+        """Everything known about one file: summary, type, definitions, key points, relevance and context."""
+        return self.store.get(path)
+
+    def files(self, category: str | None = None) -> list[str]:
+        """Paths of the analyzed files, only those of category ('code', 'data' or 'knowledge') when given."""
+        return self.store.files(category)
+
+    def defining(self, symbol: str) -> list[str]:
+        """Paths of the files that define symbol."""
+        return self.store.defining(symbol)
+
+    def search(self, text: str) -> list[str]:
+        """Paths of the files whose analysis mentions text."""
+        return self.store.search(text)
+
+class Symbols(IO):
+    def __init__(self, index: symbols.SymbolIndex):
+        super().__init__()
+        self.index = index
+
+    def find(self, name: str) -> list[dict]:
+        """Where name (e.g. run, or Chuck.run) is defined: file, kind, lines, signature and the first line of its docstring."""
+        return self.index.find(name)
+
+    def source(self, name: str) -> list[str]:
+        """The source of each definition of name, without the rest of its file."""
+        return self.index.source(name)
+
+    def outline(self, path: str) -> list[dict]:
+        """Every definition in one file, in order."""
+        return self.index.outline(path)
+
+    def references(self, name: str) -> list[str]:
+        """Files that use name."""
+        return self.index.references(name)
+
+    def callers(self, name: str) -> list[tuple[str, str]]:
+        """(file, function) of every call to name."""
+        return self.index.callers(name)
+
+    def callees(self, path: str, function: str) -> list[str]:
+        """Names called by function (qualified, e.g. Chuck.run) in the file at path."""
+        return self.index.callees(path, function)
 
 class Angel:
-    def __init__(self, goal: str, narrow_goal: str, global_info: str, name: str, thought_depth: int = 4):
+    __slots__ = ("name", "thoughts", "evicted", "summary", "goal", "narrow_goal", "global_info", "think_task_id", "thought_depth", "in_danger")
+    # Shared by every angel, think prompts carry the parts of it relevant to each angel's narrow goal.
+    knowledge: retrieval.Index | None = None
+    knowledge_tokens: int = 1500
+
+    def __init__(self, goal: str, narrow_goal: str, global_info: digest.Digest, name: str, thought_depth: int = 4):
         self.name = name
-        self.thoughts: list[str] = []
+        self.thoughts: deque[str] = deque(maxlen=thought_depth)
+        self.evicted: list[str] = []
+        self.summary: str = ""
         self.goal = goal
         self.narrow_goal = narrow_goal
         self.global_info = global_info
@@ -93,71 +376,248 @@ class Angel:
         self.thought_depth = thought_depth
         self.in_danger = False
 
+    def think_prefix(self) -> str:
+        """The part of the think prompt every angel shares, it gets half the prompt budget."""
+        return (budget.ContextBudget(budget.DEFAULT_PROMPT_TOKENS // 2, LLM.model)
+                .add(self.global_info.render(), priority=2, policy="middle", label="Information: ")
+                .add(self.goal, priority=1, label="\nGoal: ")
+                .add("\n")
+                .render())
+
     def think(self) -> PipelineTask:
         new_id = utils.get_random_id()
-        if not self.in_danger:        
-            prompt = f"Information: {self.global_info}\nGoal: {self.goal}\nPrevious Thoughts:{'/n'.join(self.thoughts)}"
+        body = budget.ContextBudget(budget.DEFAULT_PROMPT_TOKENS // 2, LLM.model)
+        relevant = self.global_info.relevant(self.narrow_goal)
+        if relevant:
+            # Per angel, so it goes in the body rather than the shared prefix.
+            body.add("\n...\n".join(relevant), priority=3, policy="tail", label="Details Relevant to Your Task (" + self.narrow_goal + "):\n")
+            body.add("\n")
+        if Angel.knowledge is not None:
+            context = Angel.knowledge.context(self.narrow_goal, Angel.knowledge_tokens)
+            if context:
+                body.add(context, priority=4, policy="tail", label="Knowledge Relevant to Your Task:\n")
+                body.add("\n")
+        if self.summary:
+            body.add(self.summary, priority=2, policy="tail", label="Summary of Earlier Thoughts: ")
+            body.add("\n")
+        body.add('/n'.join(self.thoughts), priority=1, policy="tail", label="Previous Thoughts:")
         if self.in_danger:
-            prompt = f"Information: {self.global_info}\nGoal: {self.goal}\nPrevious Thoughts:{'/n'.join(self.thoughts)}\nPlease explain why what you are working on is aligned with our goal, if it is not you will be destroyed."
+            body.add("\nPlease explain why what you are working on is aligned with our goal, if it is not you will be destroyed.")
+        prompt = self.think_prefix() + body.render()
         self.think_task_id = new_id
         return (new_id,prompt)
     
     def add_thoughts(self, thought: str):
+        """Oldest thoughts past thought_depth are kept in evicted until Metatron folds them into the summary."""
+        if len(self.thoughts) == self.thoughts.maxlen:
+            self.evicted.append(self.thoughts[0])
         self.thoughts.append(thought)
-        if len(self.thoughts) > self.thought_depth:
-            self.thoughts.pop(0)
 
     def __str__(self):
-        return f"Angel Name: {self.name}. Angel Thoughts: {self.thoughts}"
+        return f"Angel Name: {self.name}. Angel Thoughts: {list(self.thoughts)}"
         
+class AngelRegistry:
+    """
+    Every living angel by name, with secondary indexes on in_danger and narrow_goal.
+    Batch operations work out their changes before making them, so they are safe to call while iterating,
+    and iterating always walks a snapshot. Listeners are called with (event, angel) for every
+    created, destroyed, marked and spared angel.
+    """
+    CREATED = "created"
+    DESTROYED = "destroyed"
+    MARKED = "marked"
+    SPARED = "spared"
+
+    def __init__(self):
+        self.angels: dict[str, Angel] = {}
+        # Dicts rather than sets so the indexes keep creation order.
+        self.endangered_names: dict[str, None] = {}
+        self.by_goal: dict[str, dict[str, None]] = {}
+        self.listeners: list[Callable[[str, Angel], None]] = []
+
+    def __len__(self):
+        return len(self.angels)
+
+    def __iter__(self):
+        return iter(list(self.angels.values()))
+
+    def __contains__(self, name: str):
+        return name in self.angels
+
+    def __getitem__(self, name: str) -> Angel:
+        return self.angels[name]
+
+    def get(self, name: str) -> Angel | None:
+        return self.angels.get(name)
+
+    def subscribe(self, listener: Callable[[str, Angel], None]):
+        self.listeners.append(listener)
+
+    def emit(self, event: str, angel: Angel):
+        for listener in self.listeners:
+            listener(event, angel)
+
+    def add(self, angel: Angel) -> bool:
+        """False (and nothing changes) if the name is taken."""
+        if angel.name in self.angels:
+            logging.warning("An angel named %s already exists", angel.name)
+            return False
+        self.angels[angel.name] = angel
+        self.by_goal.setdefault(angel.narrow_goal, {})[angel.name] = None
+        if angel.in_danger:
+            self.endangered_names[angel.name] = None
+        self.emit(self.CREATED, angel)
+        return True
+
+    def create(self, angels_info: list[dict], goal: str, global_info: digest.Digest) -> list[Angel]:
+        """Create angels from {"name", "goal"} dicts. Malformed entries and names already taken are skipped."""
+        created = []
+        for angel_info in angels_info:
+            if not isinstance(angel_info, dict) or not angel_info.get('name') or not angel_info.get('goal'):
+                logging.warning("Skipping malformed angel %s", angel_info)
+                continue
+            angel = Angel(narrow_goal=angel_info['goal'], name=angel_info['name'], goal=goal, global_info=global_info)
+            if self.add(angel):
+                created.append(angel)
+        return created
+
+    def remove(self, name: str) -> Angel | None:
+        angel = self.angels.pop(name, None)
+        if angel is None:
+            return None
+        self.endangered_names.pop(name, None)
+        names = self.by_goal.get(angel.narrow_goal)
+        if names is not None:
+            names.pop(name, None)
+            if not names:
+                del self.by_goal[angel.narrow_goal]
+        self.emit(self.DESTROYED, angel)
+        return angel
+
+    def destroy(self, names) -> list[Angel]:
+        return [angel for angel in map(self.remove, list(dict.fromkeys(names))) if angel is not None]
+
+    def mark(self, names) -> list[Angel]:
+        marked = [self.angels[name] for name in dict.fromkeys(names) if name in self.angels and name not in self.endangered_names]
+        for angel in marked:
+            angel.in_danger = True
+            self.endangered_names[angel.name] = None
+            self.emit(self.MARKED, angel)
+        return marked
+
+    def spare(self, names) -> list[Angel]:
+        spared = [self.angels[name] for name in dict.fromkeys(names) if name in self.endangered_names]
+        for angel in spared:
+            angel.in_danger = False
+            del self.endangered_names[angel.name]
+            self.emit(self.SPARED, angel)
+        return spared
+
+    def endangered(self) -> list[Angel]:
+        return [self.angels[name] for name in self.endangered_names]
+
+    def safe(self) -> list[Angel]:
+        return [angel for name, angel in self.angels.items() if name not in self.endangered_names]
+
+    def with_goal(self, narrow_goal: str) -> list[Angel]:
+        return [self.angels[name] for name in self.by_goal.get(narrow_goal, ())]
+
 class Metatron:
-    """Responsible for condensing information."""
-    pass
+    """
+    Responsible for condensing information.
+    Thoughts an angel evicts are folded into its running summary by a pipeline task in the same tick.
+    """
+    def __init__(self, summary_tokens: int = 400):
+        self.summary_tokens = summary_tokens
+        # angel name: (how many evicted thoughts the task folds, task id)
+        self.in_flight: dict[str, tuple[int, Id]] = {}
+
+    def condense(self, angel: Angel) -> PipelineTask | None:
+        """A task that refreshes the angel's summary, or None if there is nothing new or it's already in flight."""
+        if not angel.evicted or angel.name in self.in_flight:
+            return None
+        folded = list(angel.evicted)
+        prompt = budget.ContextBudget(model=LLM.model)
+        prompt.add(f"You keep the long term memory of {angel.name}, whose goal is: ")
+        prompt.add(angel.narrow_goal, priority=1)
+        prompt.add(f"\nFold the older thoughts below into the running summary. Keep decisions, facts and open questions, drop repetition. Answer with the new summary only, in under {int(self.summary_tokens * 0.75)} words.")
+        prompt.add(angel.summary or "(empty)", priority=2, policy="tail", label="\nRunning Summary: ")
+        prompt.add('\n'.join(folded), priority=3, policy="tail", label="\nOlder Thoughts:\n")
+        task_id = utils.get_random_id()
+        self.in_flight[angel.name] = (len(folded), task_id)
+        return (task_id, prompt.render())
+
+    def settle(self, angel: Angel, task_id: Id) -> tuple[int, Id] | None:
+        # Not ours if the angel was destroyed meanwhile, its name may already belong to a new angel.
+        entry = self.in_flight.get(angel.name)
+        if entry is None or entry[1] != task_id:
+            return None
+        return self.in_flight.pop(angel.name)
+
+    def absorb(self, angel: Angel, task_id: Id, summary: str):
+        """Callback for a condense task's result."""
+        entry = self.settle(angel, task_id)
+        if entry is None:
+            return
+        self.fold(angel, entry[0], summary)
+
+    def abandon(self, angel: Angel, task_id: Id, error: BaseException):
+        """Callback for a condense task that failed, the evicted thoughts are tried again with the next condense."""
+        self.settle(angel, task_id)
+
+    def forget(self, name: str):
+        self.in_flight.pop(name, None)
+
+    def fold(self, angel: Angel, folded: int, summary: str):
+        angel.summary = budget.truncate(summary.strip(), self.summary_tokens, "head")
+        del angel.evicted[:folded]
 
 class Lucifer:
     """Responsible for killing angels."""
-    def __init__(self, goal: str, global_info: str):
+    def __init__(self, goal: str, global_info: digest.Digest):
         self.goal = goal
         self.global_info = global_info
         self.examine_angels_task_id: Id = ''
         self.evaluate_angel_pleas_task_id: Id = ''
 
-    def examine_angels(self, angels: list[Angel]) -> PipelineTask:
-        prompt=f"Our goal is to {self.goal}. Carefully review each angel's thoughts and respond with a list of names. Which should be examined if they aren't aligned with our goal. Your list should be a space seprated list of names, e.g. 'Michael Gabriel Raphael'"
-        for angel in angels:
-            if angel.in_danger == False:
-                prompt = prompt + '\n' + str(angel)
+    def examine_angels(self, angels: AngelRegistry) -> PipelineTask:
+        prompt = budget.ContextBudget(model=LLM.model)
+        prompt.add(self.global_info.render(), priority=3, policy="drop", label="Information: ")
+        prompt.add(self.goal, priority=1, label="\nOur goal is to ")
+        prompt.add(". Carefully review each angel's thoughts and respond with a list of names. Which should be examined if they aren't aligned with our goal. Your list should be a space seprated list of names, e.g. 'Michael Gabriel Raphael'")
+        prompt.add(''.join('\n' + str(angel) for angel in angels.safe()), priority=2)
+        prompt = prompt.render()
         task_id = utils.get_random_id()
         self.examine_angels_id = task_id
         return (task_id,prompt)
     
-    def mark_angels_for_danger(self, angels: list[Angel], angels_to_mark: list[str]):
-        for angel in angels:
-            if angel.name in angels_to_mark:
-                angel.in_danger = True
+    def mark_angels_for_danger(self, angels: AngelRegistry, angels_to_mark: list[str]):
+        angels.mark(angels_to_mark)
         
-    def evaluate_angel_pleas(self, angels: list[Angel]) -> PipelineTask:
-        prompt = f"Our goal is to {self.goal}. Review each angel's plea for life and provide a list of angels who's pleas are insufficient given our goal, these angels will be destroyed. Your list should be a space seprated list of names, e.g. 'Michael Gabriel Raphael'"
-        for angel in angels:
-            if angel.in_danger == True:
-                prompt = prompt + '\n' + str(angel)
+    def evaluate_angel_pleas(self, angels: AngelRegistry, pleaded: set[str] | None = None) -> PipelineTask:
+        """pleaded limits the review to endangered angels that have already had a chance to plead."""
+        prompt = budget.ContextBudget(model=LLM.model)
+        prompt.add(self.global_info.render(), priority=3, policy="drop", label="Information: ")
+        prompt.add(self.goal, priority=1, label="\nOur goal is to ")
+        prompt.add(". Review each angel's plea for life and provide a list of angels who's pleas are insufficient given our goal, these angels will be destroyed. Your list should be a space seprated list of names, e.g. 'Michael Gabriel Raphael'")
+        prompt.add(''.join('\n' + str(angel) for angel in angels.endangered() if pleaded is None or angel.name in pleaded), priority=2)
+        prompt = prompt.render()
         task_id = utils.get_random_id()
         self.evaluate_angel_pleas_task_id = task_id
         return (task_id,prompt)
     
-    def destroy_angels(self, angels: list[Angel], angels_to_destroy: list[str]):
-        for angel in angels:
-            if angel.name in angels_to_destroy:
-                angels.remove(angel)
+    def destroy_angels(self, angels: AngelRegistry, angels_to_destroy: list[str]):
+        angels.destroy(angels_to_destroy)
 
 class Jack:
     """Responsible for creating angels."""
-    def __init__(self, goal: str, global_info: str):
+    def __init__(self, goal: str, global_info: digest.Digest, name_generator: utils.NameGenerator | None = None):
         self.goal = goal
         self.global_info = global_info
+        self.name_generator = name_generator or utils.NameGenerator()
         self.create_angels_task_id: Id = ''
 
-    def decide_to_create_angels(self, angels: list[Angel]) -> PipelineTask:
+    def decide_to_create_angels(self, angels: AngelRegistry) -> PipelineTask:
         example= [{
             "name": "Castiel",
             "goal": "Save Dean",
@@ -168,23 +628,38 @@ class Jack:
             }
             ]
 
-        prompt = f"Our goal is to {self.goal}. Carefully review each angel's thoughts and decide if we need more angels to tackle our goal. If you decide we need more angels, provide a dictionary of the following format: \n {example}. Response must be json compliant and fit the format. Angel names must be unique"
-        for angel in angels:
-            prompt = prompt + '\n' + str(angel)
+        prompt = budget.ContextBudget(model=LLM.model)
+        prompt.add(self.global_info.render(), priority=3, policy="drop", label="Information: ")
+        prompt.add(self.goal, priority=1, label="\nOur goal is to ")
+        prompt.add(f". Carefully review each angel's thoughts and decide if we need more angels to tackle our goal. If you decide we need more angels, provide a dictionary of the following format: \n {example}. Response must be json compliant and fit the format. Angel names must be unique")
+        prompt.add(''.join('\n' + str(angel) for angel in angels), priority=2)
+        prompt = prompt.render()
         
         task_id = utils.get_random_id()
         self.create_angels_task_id = task_id
         return (task_id,prompt)
     
-    def create_angels(self, angels_info, angels: list[Angel]):
+    def parse_angels_info(self, response: str) -> list[dict]:
+        response = response.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        try:
+            angels_info = json.loads(response)
+        except json.JSONDecodeError:
+            logging.warning("Could not parse angels to create: %s", response)
+            return []
+        return angels_info if isinstance(angels_info, list) else [angels_info]
+
+    def create_angels(self, angels_info, angels: AngelRegistry) -> list[Angel]:
+        """Angels without a name, or with one that is taken, get one from the name generator."""
+        if isinstance(angels_info, str):
+            angels_info = self.parse_angels_info(angels_info)
+        taken = set()
         for angel_info in angels_info:
-            angel = Angel(
-                narrow_goal=angel_info['goal'],
-                name=angel_info['name'],
-                goal=self.goal,
-                global_info=self.global_info
-                )
-            angels.append(angel)
+            if not isinstance(angel_info, dict) or not angel_info.get('goal'):
+                continue
+            if not angel_info.get('name') or angel_info['name'] in angels or angel_info['name'] in taken:
+                angel_info['name'] = self.name_generator.generate_name()
+            taken.add(angel_info['name'])
+        return angels.create(angels_info, goal=self.goal, global_info=self.global_info)
 
 
 
@@ -193,8 +668,244 @@ class Castiel:
     pass
 
 
+class Kernel:
+    """
+    Runs Chuck, Jack, Lucifer and Metatron on one event loop for the life of the process.
+
+    Each tick the angels think through Chuck's pipeline. Jack's and Lucifer's reviews of that tick's thoughts are
+    started when it ends and run on while the next tick's angels think, a tick only waits for the previous tick's
+    reviews before starting its own. Marked angels plead in their next think, and only angels that have pleaded
+    are judged.
+
+    mode is interval (a tick every interval seconds), fast (back to back) or manual (only when stepped).
+    The kernel is steered with commands, from stdin or a unix socket: pause, resume, step [n], inspect [angel],
+    summary <path>, find <name>, stats and quit.
+    """
+    MODES = ("interval", "fast", "manual")
+
+    def __init__(self,
+                 goal: str,
+                 global_info: str,
+                 chuck: Chuck,
+                 shell: Terminal | None = None,
+                 mode: str = "fast",
+                 interval: float = 0.0,
+                 deadline: float | None = None,
+                 info_source: Callable[[], str] | None = None,
+                 digest_path: str | None = None,
+                 digest_tokens: int = 1500,
+                 root: str = ".",
+                 mirror_dir: str | None = None,
+                 index_symbols: bool = False):
+        """
+        global_info reaches prompts as a digest, summarized once and then only where it changes.
+        With info_source, global_info is re-read from it at the start of every tick.
+        With mirror_dir, the mirror of the repository at root (built by src/main.py) is open as a Mirror device.
+        With index_symbols, so is a Symbols index of root, brought up to date every tick and kept next to the mirror if there is one.
+        Both answer the summary and find commands.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown tick mode {mode}, expected one of {self.MODES}")
+        self.chuck = chuck
+        self.global_info = global_info
+        self.info_source = info_source
+        self.digest = digest.Digest(lambda prompt: LLM.prompt(prompt, scheduler.PRIORITY_KERNEL), max_tokens=digest_tokens, path=digest_path)
+        self.jack = Jack(goal=goal, global_info=self.digest)
+        self.lucifer = Lucifer(goal=goal, global_info=self.digest)
+        self.metatron = Metatron()
+        self.shell = shell or Terminal()
+        self.root = root
+        self.mirror = Mirror(mirror.MirrorStore(root, mirror_dir)) if mirror_dir else None
+        self.symbols = Symbols(symbols.SymbolIndex(root, os.path.join(mirror_dir, 'symbols.index') if mirror_dir else None)) if index_symbols else None
+        self.mirror_dir = mirror_dir
+        self.scanner = file_classifier.Scanner(root, file_classifier.default_cache_path(root)) if index_symbols else None
+        self.angels = AngelRegistry()
+        self.angels.subscribe(self.on_angel_event)
+        self.mode = mode
+        self.interval = interval
+        self.deadline = deadline
+        self.paused = mode == "manual"
+        self.steps = 0
+        self.stopping = False
+        self.wake = asyncio.Event()
+        self.reviews: list[asyncio.Task] = []
+        # Angels whose latest think included the plea, Lucifer only judges these.
+        self.pleaded: set[str] = set()
+        self.ticks = 0
+        self.started = time.monotonic()
+        self.tick_seconds = 0.0
+
+    def on_angel_event(self, event: str, angel: Angel):
+        if event == AngelRegistry.DESTROYED:
+            self.jack.name_generator.release(angel.name)
+            self.shell.close_session(angel.name)
+            self.pleaded.discard(angel.name)
+            self.metatron.forget(angel.name)
+        elif event == AngelRegistry.SPARED:
+            self.pleaded.discard(angel.name)
+
+    def on_thought(self, angel: Angel, pleading: bool):
+        def callback(thought: str):
+            angel.add_thoughts(thought)
+            if self.angels.get(angel.name) is not angel:
+                # Destroyed since it was asked to think, nothing left to condense for.
+                return
+            if pleading:
+                self.pleaded.add(angel.name)
+            mpt = self.metatron.condense(angel)
+            if mpt is not None:
+                self.chuck.add(mpt[0], mpt[1], scheduler.PRIORITY_THINK, callback=lambda summary: self.metatron.absorb(angel, mpt[0], summary),
+                               errback=lambda error: self.metatron.abandon(angel, mpt[0], error))
+        return callback
+
+    def review(self, task: PipelineTask, apply: Callable[[str], None]) -> asyncio.Task:
+        """A kernel prompt that runs outside the tick barrier, its result is applied whenever it lands."""
+        async def run():
+            try:
+                apply(await LLM.prompt(task[1], scheduler.PRIORITY_KERNEL))
+            except Exception as e:
+                logging.error("Kernel task %s failed: %r", task[0], e)
+        return asyncio.ensure_future(run())
+
+    def judge(self, result: str, pleaded: set[str]):
+        doomed = set(result.split()) & pleaded
+        self.lucifer.destroy_angels(self.angels, doomed)
+        self.angels.spare(pleaded - doomed)
+
+    def start_reviews(self):
+        self.reviews = [self.review(self.jack.decide_to_create_angels(self.angels), lambda result: self.jack.create_angels(result, self.angels))]
+        if not len(self.angels):
+            logging.info("No angels to evaluate.")
+            return
+        self.reviews.append(self.review(self.lucifer.examine_angels(self.angels), lambda result: self.lucifer.mark_angels_for_danger(self.angels, result.split())))
+        pleaded = set(self.pleaded)
+        if pleaded:
+            self.reviews.append(self.review(self.lucifer.evaluate_angel_pleas(self.angels, pleaded), lambda result: self.judge(result, pleaded)))
+
+    def update_symbols(self) -> int:
+        """Scan root (honouring its ignores) and re-parse the code files that changed. Blocking, run it in a thread."""
+        return self.symbols.index.update(file_classifier.code_paths(file_classifier.model_files(self.scanner, self.mirror_dir)))
+
+    async def tick(self):
+        print(f"year {self.chuck.time}")
+        start = time.monotonic()
+        if self.info_source is not None:
+            self.global_info = self.info_source()
+        try:
+            await self.digest.update(self.global_info)
+        except Exception as e:
+            # The digest is left unready, so prompts carry the truncated raw info this tick and the next tick tries again.
+            logging.error("Could not update the global info digest: %r", e)
+        if self.symbols is not None:
+            # Only files whose size or mtime changed are parsed again, off the event loop.
+            await asyncio.to_thread(self.update_symbols)
+        for angel in self.angels:
+            apt = angel.think()
+            self.chuck.add(apt[0], apt[1], scheduler.PRIORITY_THINK, callback=self.on_thought(angel, angel.in_danger), prefix=angel.think_prefix())
+        thinking = asyncio.ensure_future(self.chuck.run(self.deadline))
+        # The previous tick's reviews finish while this tick's angels think.
+        await asyncio.gather(*self.reviews)
+        await thinking
+        self.start_reviews()
+        self.ticks += 1
+        self.tick_seconds = time.monotonic() - start
+
+    async def wait_turn(self):
+        while not self.stopping and self.paused and self.steps == 0:
+            self.wake.clear()
+            await self.wake.wait()
+        if self.steps:
+            self.steps -= 1
+
+    async def serve(self, control_socket: str | None = None, stdin: bool = True):
+        if stdin:
+            self.read_stdin(asyncio.get_running_loop())
+        server = await asyncio.start_unix_server(self.handle_client, control_socket) if control_socket else None
+        try:
+            while True:
+                await self.wait_turn()
+                if self.stopping:
+                    break
+                start = time.monotonic()
+                await self.tick()
+                if self.mode == "interval":
+                    await asyncio.sleep(max(self.interval - (time.monotonic() - start), 0))
+        finally:
+            for task in self.reviews:
+                task.cancel()
+            await asyncio.gather(*self.reviews, return_exceptions=True)
+            if server is not None:
+                server.close()
+            self.shell.pool.close()
+            await self.shell.pool.wait_closed()
+
+    def control(self, line: str) -> str:
+        command, *args = line.split() or [""]
+        if command == "pause":
+            self.paused = True
+            return "paused"
+        if command == "resume":
+            self.paused = self.mode == "manual"
+            self.wake.set()
+            return "paused, use step" if self.paused else "running"
+        if command in ("step", ""):
+            self.steps += int(args[0]) if args else 1
+            self.wake.set()
+            return f"{self.steps} steps queued"
+        if command == "inspect":
+            if args:
+                angel = self.angels.get(args[0])
+                return f"{angel}\nSummary: {angel.summary}" if angel else f"No angel named {args[0]}"
+            return "\n".join(f"{angel.name}{' (in danger)' if angel.in_danger else ''}: {angel.narrow_goal}" for angel in self.angels) or "No angels"
+        if command == "summary" and args:
+            if self.mirror is None:
+                return "No mirror, start with --mirror-dir"
+            return self.mirror.summary(args[0]) or f"No summary of {args[0]}"
+        if command == "find" and args:
+            if self.symbols is None:
+                return "No symbol index, start with --symbols"
+            return "\n".join(f"{d['path']}:{d['line']} {d['signature']}" for d in self.symbols.find(args[0])) or f"{args[0]} is not defined anywhere"
+        if command == "stats":
+            return json.dumps(self.stats())
+        if command == "quit":
+            self.stopping = True
+            self.wake.set()
+            return "stopping after this tick"
+        return f"Unknown command {command}, expected pause, resume, step [n], inspect [angel], summary <path>, find <name>, stats or quit"
+
+    def stats(self) -> dict:
+        minutes = (time.monotonic() - self.started) / 60
+        stats = {"tick": self.chuck.time, "ticks": self.ticks, "ticks_per_minute": round(self.ticks / minutes, 2) if minutes else 0.0,
+                 "last_tick_seconds": round(self.tick_seconds, 3), "angels": len(self.angels), "in_danger": len(self.angels.endangered_names),
+                 "carried_over": self.chuck.carried_over, "reviews_running": sum(not task.done() for task in self.reviews),
+                 "paused": self.paused, "mode": self.mode}
+        if not self.chuck.carry_over:
+            stats["timed_out"] = len(self.chuck.timed_out)
+        if LLM.response_cache is not None:
+            stats["cache"] = LLM.response_cache.stats()
+        if LLM.hedger is not None:
+            stats["hedging"] = LLM.hedger.stats()
+        if metrics.get_metrics().enabled:
+            stats["metrics"] = metrics.get_metrics().snapshot(spans=0)
+        return stats
+
+    def read_stdin(self, loop: asyncio.AbstractEventLoop):
+        # A daemon thread rather than the default executor, so a pending readline doesn't hold up shutdown.
+        def read():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(lambda line=line: print(self.control(line)))
+        threading.Thread(target=read, name="kernel-stdin", daemon=True).start()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                writer.write((self.control(line.decode()) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+
 def get_current_file_source():
-    import sys
     current_file = sys.modules[__name__].__file__
     with open(current_file, 'r') as file:
         return file.read()
@@ -203,35 +914,52 @@ def get_current_file_source():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Register script with logging.")
     parser.add_argument('--log-level', default='WARNING', help='Set the logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)')
+    backends.add_backend_arguments(parser)
+    scheduler.add_scheduler_arguments(parser)
+    cache.add_cache_arguments(parser)
+    budget.add_budget_arguments(parser)
+    parser.add_argument('--packing', action='store_true', help='Pack angel think prompts that share a prefix into one request')
+    parser.add_argument('--pack-tokens', type=int, default=30000, help='Token budget for one packed request')
+    terminal.add_terminal_arguments(parser)
+    parser.add_argument('--tick-deadline', type=float, default=None, help='Seconds before unfinished prompts are carried over to the next tick')
+    parser.add_argument('--drop-late', action='store_true', help='Fail prompts that miss the tick deadline as timed out instead of carrying them over')
+    hedging.add_hedging_arguments(parser)
+    digest.add_digest_arguments(parser)
+    parser.add_argument('--tick-mode', default='manual', choices=Kernel.MODES, help='Tick every --tick-interval seconds, back to back, or only when stepped')
+    parser.add_argument('--tick-interval', type=float, default=10.0, help='Seconds between tick starts in interval mode')
+    parser.add_argument('--control-socket', default=None, help='Unix socket to accept control commands on, as well as stdin')
+    parser.add_argument('--mirror-dir', default=None, help='Mirror of the working directory built by src/main.py, for the summary command')
+    parser.add_argument('--symbols', action='store_true', help='Index the symbols of the working directory every tick, for the find command')
+    retrieval.add_retrieval_arguments(parser)
+    metrics.add_metrics_arguments(parser)
     args = parser.parse_args()
 
     logging.basicConfig(level=getattr(logging, args.log_level.upper(), None))
-    goal=f"Review your own source code: {get_current_file_source()}"
+    backends.set_backend(backends.backend_from_args(args))
+    LLM.task_scheduler = scheduler.scheduler_from_args(args)
+    LLM.response_cache = cache.cache_from_args(args)
+    LLM.hedger = hedging.hedger_from_args(args)
+    metrics.set_metrics(metrics.metrics_from_args(args))
+    budget.budget_from_args(args)
+    Angel.knowledge = retrieval.knowledge_from_args(args)
+    Angel.knowledge_tokens = args.knowledge_tokens
+    goal="Review your own source code, summarized under Information."
 
 
     global_info=get_current_file_source()
 
 
-    chuck = Chuck()
-
-    jack = Jack(goal=goal, global_info=global_info)
-    lucifer = Lucifer(goal=goal, global_info=global_info)
-
-    angels :list[Angel] = []
-    while True:
-        input("Press enter to continue")
-        print(f"year {chuck.time}")
-        jpt1 = jack.decide_to_create_angels(angels)
-        chuck.add(jpt1[0],jpt1[1])
-        
-        if len(angels) == 0:
-            logging.info("No angels to evaluate.")
-            asyncio.run(chuck.run())
-            angel_task=chuck.lookup(jack.create_angels_task_id)
-            jack.create_angels(angel_task,angels)
-            continue
-
-        if len(angels) > 0:
-            lpt1 = lucifer.examine_angels(angels)
-            chuck.add(lpt1[0],lpt1[1])
-
+    kernel = Kernel(goal=goal,
+                    global_info=global_info,
+                    chuck=Chuck(packing=args.packing, pack_tokens=args.pack_tokens, carry_over=not args.drop_late),
+                    shell=Terminal(terminal.pool_from_args(args)),
+                    mode=args.tick_mode,
+                    interval=args.tick_interval,
+                    deadline=args.tick_deadline,
+                    info_source=get_current_file_source,
+                    digest_path=args.digest_path,
+                    digest_tokens=args.digest_tokens,
+                    mirror_dir=args.mirror_dir,
+                    index_symbols=args.symbols)
+    print("Commands: step [n] (or enter), pause, resume, inspect [angel], summary <path>, find <name>, stats, quit")
+    asyncio.run(kernel.serve(args.control_socket))
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import AsyncIterator, Callable
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+
+def config_key(generation_config: dict | None) -> str:
+    """Stable key for a generation config so equal configs share a client."""
+    if not generation_config:
+        return ""
+    return json.dumps(generation_config, sort_keys=True, default=str)
+
+
+class Backend:
+    """
+    Backends turn a prompt into text. The LLM classes route every call through one.
+    One client is created per (model, generation config) and reused for every call after that.
+    """
+    name = "base"
+    # Whether generation_config=JSON_CONFIG makes the backend return JSON.
+    supports_json = False
+
+    def __init__(self):
+        self.clients: dict[tuple[str, str], object] = {}
+
+    def client(self, model: str = DEFAULT_MODEL, generation_config: dict | None = None):
+        key = (model, config_key(generation_config))
+        client = self.clients.get(key)
+        if client is None:
+            logging.debug("Creating %s client for %s", self.name, model)
+            client = self.create_client(model, generation_config)
+            self.clients[key] = client
+        return client
+
+    def create_client(self, model: str, generation_config: dict | None):
+        raise NotImplementedError
+
+    async def generate(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> AsyncIterator[str]:
+        """Yield text chunks as they arrive. Backends that can't stream yield the whole response once."""
+        yield await self.generate(prompt, model, generation_config)
+
+
+class GeminiBackend(Backend):
+    name = "gemini"
+    supports_json = True
+
+    def __init__(self, api_key: str | None = None):
+        super().__init__()
+        import google.generativeai as ai
+        self.ai = ai
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.ai.configure(api_key=self.api_key)
+
+    def __getstate__(self):
+        # Sent to worker processes without the module and clients, they configure their own.
+        return {"api_key": self.api_key}
+
+    def __setstate__(self, state):
+        self.__init__(state["api_key"])
+
+    def create_client(self, model: str, generation_config: dict | None):
+        return self.ai.GenerativeModel(model, generation_config=generation_config)
+
+    async def generate(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> str:
+        response = await self.client(model, generation_config).generate_content_async(prompt)
+        return response.candidates[0].content.parts[0].text
+
+    async def stream(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> AsyncIterator[str]:
+        response = await self.client(model, generation_config).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+class Latency:
+    """
+    Latency distribution for the stub backend, in seconds.
+    kind is one of fixed, uniform, normal, lognormal or exponential.
+    """
+    # How many parameters each kind takes: the delay, low and high, mu and sigma, or the mean.
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, kind: str = "fixed", *params: float, seed: int | None = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution {kind}, expected one of {tuple(self.KINDS)}")
+        if kind == "fixed" and not params:
+            params = (0.0,)
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"{kind} latency takes {self.KINDS[kind]} parameters, got {len(params)}")
+        self.kind = kind
+        self.params = params
+        self.random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Latency':
+        """Parse a spec such as 'fixed:0.2', 'uniform:0.5,2' or 'lognormal:-0.5,0.6'."""
+        kind, _, params = spec.partition(":")
+        return cls(kind, *[float(p) for p in params.split(",") if p])
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            delay = p[0]
+        elif self.kind == "uniform":
+            delay = self.random.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            delay = self.random.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            delay = self.random.lognormvariate(p[0], p[1])
+        else:
+            delay = self.random.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        return max(delay, 0.0)
+
+
+class StubClient:
+    def __init__(self, model: str, generation_config: dict | None):
+        self.model = model
+        self.generation_config = generation_config
+        self.calls = 0
+
+
+class StubBackend(Backend):
+    """
+    Offline backend for load testing. Sleeps for a sampled latency and answers with scripted responses.
+
+    responses can be:
+    - a list, answered in order (and cycled when cycle=True, otherwise default is used once it runs out)
+    - a dict of substring: response, the first substring found in the prompt wins
+    - a callable taking the prompt and returning the response
+
+    When streaming, the first chunk arrives after the sampled latency and the rest every chunk_delay seconds.
+    """
+    name = "stub"
+
+    def __init__(self,
+                 latency: Latency | None = None,
+                 responses: list[str] | dict[str, str] | Callable[[str], str] | None = None,
+                 default: str = "OK",
+                 cycle: bool = False,
+                 supports_json: bool = False,
+                 chunk_size: int = 32,
+                 chunk_delay: float = 0.0):
+        super().__init__()
+        self.supports_json = supports_json
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.latency = latency or Latency()
+        self.responses = responses
+        self.default = default
+        self.cycle = cycle
+        self.script_position = 0
+        self.calls = 0
+
+    def create_client(self, model: str, generation_config: dict | None):
+        return StubClient(model, generation_config)
+
+    def respond(self, prompt: str) -> str:
+        if callable(self.responses):
+            return self.responses(prompt)
+        if isinstance(self.responses, dict):
+            for needle, response in self.responses.items():
+                if needle in prompt:
+                    return response
+            return self.default
+        if self.responses:
+            if self.script_position >= len(self.responses):
+                if not self.cycle:
+                    return self.default
+                self.script_position = 0
+            response = self.responses[self.script_position]
+            self.script_position += 1
+            return response
+        return self.default
+
+    async def generate(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> str:
+        client = self.client(model, generation_config)
+        client.calls += 1
+        self.calls += 1
+        response = self.respond(prompt)
+        await asyncio.sleep(self.latency.sample())
+        return response
+
+    async def stream(self, prompt: str, model: str = DEFAULT_MODEL, generation_config: dict | None = None) -> AsyncIterator[str]:
+        client = self.client(model, generation_config)
+        client.calls += 1
+        self.calls += 1
+        response = self.respond(prompt)
+        await asyncio.sleep(self.latency.sample())
+        for start in range(0, len(response), self.chunk_size):
+            if start:
+                await asyncio.sleep(self.chunk_delay)
+            yield response[start:start + self.chunk_size]
+
+
+BACKENDS: dict[str, type[Backend]] = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+_backend: Backend | None = None
+
+
+def create_backend(name: str, **kwargs) -> Backend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def set_backend(backend: Backend):
+    global _backend
+    _backend = backend
+    logging.info("Using %s backend", backend.name)
+
+
+def get_backend() -> Backend:
+    """The backend picked at startup. Falls back to $LLM_BACKEND, then gemini."""
+    if _backend is None:
+        set_backend(create_backend(os.getenv("LLM_BACKEND", "gemini")))
+    return _backend
+
+
+def add_backend_arguments(parser):
+    parser.add_argument('--backend', default=os.getenv("LLM_BACKEND", "gemini"), choices=list(BACKENDS), help='LLM backend to route prompts through')
+    parser.add_argument('--stub-latency', default='fixed:0', help='Latency distribution for the stub backend (e.g. fixed:0.2, uniform:0.5,2, lognormal:-0.5,0.6)')
+
+
+def backend_from_args(args) -> Backend:
+    if args.backend == "stub":
+        return create_backend("stub", latency=Latency.parse(args.stub_latency))
+    return create_backend(args.backend)
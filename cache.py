@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import backends
+
+
+def cache_key(model: str, generation_config: dict | None, prompt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, backends.config_key(generation_config), prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Content addressed cache of LLM responses, keyed by (model, generation config, prompt hash).
+    Entries live in a bounded in-memory LRU and, when a path is given, in a sqlite file that survives restarts.
+    Entries older than ttl seconds are treated as missing.
+    Identical prompts that are already in flight share one call.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None, path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, response TEXT)")
+            self.db.commit()
+
+    def __getstate__(self):
+        # Sent to worker processes as its settings only, each opens its own memory LRU and connection to the shared file.
+        return {"max_entries": self.max_entries, "ttl": self.ttl, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_entries"], state["ttl"], state["path"])
+
+    def expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str) -> str | None:
+        entry = self.entries.get(key)
+        if entry is not None:
+            if not self.expired(entry[0]):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        if self.db is not None:
+            row = self.db.execute("SELECT created, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self.expired(row[0]):
+                self.remember(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[1]
+        self.misses += 1
+        return None
+
+    def remember(self, key: str, created: float, response: str):
+        self.entries[key] = (created, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def put(self, key: str, response: str):
+        created = time.time()
+        self.remember(key, created, response)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, created, response))
+            self.db.commit()
+
+    async def fetch(self, model: str, generation_config: dict | None, prompt: str,
+                    call: Callable[[], Awaitable[str]], fresh: bool = False) -> str:
+        """Return the cached response for this prompt, or make the call and cache it. fresh=True always calls."""
+        key = cache_key(model, generation_config, prompt)
+        if fresh:
+            self.bypassed += 1
+        else:
+            response = self.get(key)
+            if response is not None:
+                return response
+            if key in self.in_flight:
+                return await asyncio.shield(self.in_flight[key])
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            response = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting on it, don't warn about an unretrieved exception.
+            future.exception()
+            raise
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+        self.put(key, response)
+        future.set_result(response)
+        return response
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "entries": len(self.entries),
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        logging.info("Response cache stats: %s", self.stats())
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--no-cache', action='store_true', help='Disable the prompt response cache')
+    parser.add_argument('--cache-path', default=None, help='sqlite file that persists cached responses across restarts')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Maximum responses kept in memory')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='Seconds before a cached response goes stale')
+
+
+def cache_from_args(args) -> ResponseCache | None:
+    if args.no_cache:
+        return None
+    return ResponseCache(max_entries=args.cache_size, ttl=args.cache_ttl, path=args.cache_path)
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Awaitable, Callable
+
+import budget
+
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def terms(text: str) -> list[str]:
+    """Lowercased words, with snake_case and CamelCase identifiers also split into their parts."""
+    words = []
+    for word in WORD.findall(text):
+        words.append(word.lower())
+        parts = [part.lower() for part in re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", word)]
+        if len(parts) > 1:
+            words.extend(parts)
+    return words
+
+
+def split_blocks(text: str) -> list[str]:
+    """Top level blocks: a block starts at a non indented line that follows a blank line."""
+    blocks, current, blank = [], [], False
+    for line in text.split("\n"):
+        if blank and current and line and not line[0].isspace():
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+        blank = not line.strip()
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def chunk(text: str, max_tokens: int = 800) -> list[str]:
+    """Greedily merge top level blocks into chunks of at most max_tokens. Oversized blocks are split by lines."""
+    pieces = []
+    for block in split_blocks(text):
+        if budget.count_tokens(block) <= max_tokens:
+            pieces.append(block)
+            continue
+        lines, used = [], 0
+        for line in block.split("\n"):
+            cost = budget.count_tokens(line) + 1
+            if lines and used + cost > max_tokens:
+                pieces.append("\n".join(lines))
+                lines, used = [], 0
+            lines.append(line)
+            used += cost
+        if lines:
+            pieces.append("\n".join(lines))
+    chunks, current, used = [], [], 0
+    for piece in pieces:
+        cost = budget.count_tokens(piece) + 1
+        if current and used + cost > max_tokens:
+            chunks.append("\n".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class Digest:
+    """
+    Compact, hierarchical summary of a large document, for prompts that would otherwise carry all of it.
+
+    The document is split into chunks, each chunk is summarized, then every fanout summaries are summarized again
+    until one summary is left at the root. Every summary is keyed by the hash of what it covers (a chunk's text,
+    or its children's hashes), so update only summarizes chunks whose text changed and the nodes above them.
+    render() gives the root and chunk summaries within a token budget, relevant() the raw chunks closest to a query.
+    """
+    def __init__(self,
+                 summarize: Callable[[str], Awaitable[str]],
+                 chunk_tokens: int = 800,
+                 fanout: int = 8,
+                 summary_words: int = 120,
+                 max_tokens: int = 1500,
+                 path: str | None = None):
+        self.summarize = summarize
+        self.chunk_tokens = chunk_tokens
+        self.fanout = fanout
+        self.summary_words = summary_words
+        self.max_tokens = max_tokens
+        self.path = path
+        self.summaries: dict[str, str] = {}
+        self.text = ""
+        self.chunks: list[str] = []
+        self.hashes: list[str] = []
+        # Hashes of each level of the tree, chunk summaries first and the root last.
+        self.levels: list[list[str]] = []
+        self.chunk_terms: list[Counter] = []
+        self.idf: dict[str, float] = {}
+        self.rendered: dict[int, str] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.summaries = json.load(file)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.levels) and all(h in self.summaries for h in self.levels[-1])
+
+    def index(self, text: str):
+        self.text = text
+        self.chunks = chunk(text, self.chunk_tokens)
+        self.hashes = [content_hash(c) for c in self.chunks]
+        self.levels = [self.hashes]
+        while len(self.levels[-1]) > 1:
+            below = self.levels[-1]
+            self.levels.append([content_hash("\0".join(below[i:i + self.fanout])) for i in range(0, len(below), self.fanout)])
+        self.chunk_terms = [Counter(terms(c)) for c in self.chunks]
+        document_frequency = Counter(term for counts in self.chunk_terms for term in counts)
+        self.idf = {term: math.log(1 + len(self.chunks) / frequency) for term, frequency in document_frequency.items()}
+        self.rendered = {}
+
+    def leaf_prompt(self, text: str) -> str:
+        return (f"Summarize this part of a larger document in under {self.summary_words} words. "
+                f"Keep the names of classes, functions and other key terms, and any decisions or facts.\n{text}")
+
+    def group_prompt(self, summaries: list[str]) -> str:
+        parts = "\n".join(f"- {summary}" for summary in summaries)
+        return (f"These summarize consecutive parts of one document. Combine them into one summary of the whole in "
+                f"under {self.summary_words * 2} words, keeping the names of key terms.\n{parts}")
+
+    async def update(self, text: str) -> int:
+        """Bring the digest up to date with text. Returns how many summaries had to be generated."""
+        if text == self.text and self.ready:
+            return 0
+        self.index(text)
+        generated = 0
+        level_texts = {h: c for h, c in zip(self.hashes, self.chunks)}
+        missing = [h for h in dict.fromkeys(self.hashes) if h not in self.summaries]
+        generated += await self.fill(missing, lambda h: self.leaf_prompt(level_texts[h]))
+        for depth in range(1, len(self.levels)):
+            below = self.levels[depth - 1]
+            children = {self.levels[depth][i // self.fanout]: below[i:i + self.fanout] for i in range(0, len(below), self.fanout)}
+            missing = [h for h in dict.fromkeys(self.levels[depth]) if h not in self.summaries]
+            generated += await self.fill(missing, lambda h: self.group_prompt([self.summaries[child] for child in children[h]]))
+        if generated:
+            logging.info("Digest: summarized %s parts, %s chunks in total", generated, len(self.chunks))
+            self.save()
+        return generated
+
+    async def fill(self, hashes: list[str], prompt_for: Callable[[str], str]) -> int:
+        results = await asyncio.gather(*(self.summarize(prompt_for(h)) for h in hashes))
+        for h, summary in zip(hashes, results):
+            self.summaries[h] = summary.strip()
+        return len(hashes)
+
+    def save(self):
+        if not self.path:
+            return
+        # Only what the current document needs, so the file doesn't grow with every edit.
+        live = {h for level in self.levels for h in level}
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({h: s for h, s in self.summaries.items() if h in live}, file, separators=(",", ":"))
+        os.replace(temporary, self.path)
+
+    def render(self, max_tokens: int | None = None) -> str:
+        """Root summary, then the chunk summaries in document order, cut to max_tokens."""
+        max_tokens = max_tokens or self.max_tokens
+        if max_tokens in self.rendered:
+            return self.rendered[max_tokens]
+        if not self.ready:
+            # Not summarized yet, fall back to the document itself.
+            return budget.truncate(self.text, max_tokens, "middle")
+        root = self.summaries[self.levels[-1][0]]
+        parts = budget.ContextBudget(max_tokens).add(root, priority=0, label="Overview: ")
+        if len(self.hashes) > 1:
+            sections = "\n".join(f"[{i + 1}] {self.summaries[h]}" for i, h in enumerate(self.hashes))
+            parts.add(sections, priority=1, label="\nSections:\n")
+        self.rendered[max_tokens] = parts.render()
+        return self.rendered[max_tokens]
+
+    def relevant(self, query: str, max_tokens: int | None = None, k: int = 3) -> list[str]:
+        """Up to k raw chunks sharing the most (idf weighted) terms with query, in document order, within max_tokens."""
+        max_tokens = max_tokens or self.max_tokens
+        query_terms = set(terms(query))
+        scores = [(sum(self.idf[t] for t in query_terms if t in counts), i) for i, counts in enumerate(self.chunk_terms)]
+        best = sorted((s for s in scores if s[0] > 0), reverse=True)[:k]
+        picked, used = [], 0
+        for _, i in best:
+            cost = budget.count_tokens(self.chunks[i])
+            if used + cost > max_tokens:
+                continue
+            picked.append(i)
+            used += cost
+        return [self.chunks[i] for i in sorted(picked)]
+
+    def __str__(self):
+        return self.render()
+
+
+def add_digest_arguments(parser):
+    parser.add_argument('--digest-path', default=None, help='JSON file to keep global info summaries in between runs')
+    parser.add_argument('--digest-tokens', type=int, default=1500, help='Token budget for the global info digest in each prompt')
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Latencies of the last window successful calls per model."""
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.samples: dict[str, deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        samples = self.samples.get(model)
+        if samples is None:
+            samples = self.samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self.samples.get(model, ()))
+
+    def percentile(self, model: str, q: float) -> float | None:
+        samples = self.samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {model: {"samples": len(samples), "p50": self.percentile(model, 0.5), "p95": self.percentile(model, 0.95)}
+                for model, samples in self.samples.items() if samples}
+
+
+class Hedger:
+    """
+    Hedged requests: when a call has run longer than the percentile of recent latency for its model, a duplicate is
+    started and whichever answers first wins, the other is cancelled. Nothing is hedged until min_samples latencies
+    are known, and hedges are capped at budget times the number of calls so a slow provider doesn't get twice the load.
+    The caller is already running inside whatever admits it (a scheduler slot), so the duplicate is started through
+    launch, which should admit it the same way, e.g. Scheduler.attempt.
+    """
+    def __init__(self,
+                 percentile: float = 0.95,
+                 budget: float = 0.1,
+                 min_samples: int = 20,
+                 tracker: LatencyTracker | None = None):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.tracker = tracker or LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def threshold(self, model: str) -> float | None:
+        if self.tracker.count(model) < self.min_samples:
+            return None
+        return self.tracker.percentile(model, self.percentile)
+
+    def can_hedge(self) -> bool:
+        return self.hedges + 1 <= self.budget * self.calls
+
+    async def timed(self, model: str, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        result = await call()
+        self.tracker.record(model, time.monotonic() - start)
+        return result
+
+    async def run(self, model: str, call: Callable[[], Awaitable[T]],
+                  launch: Callable[[Callable[[], Awaitable[T]]], Awaitable[T]] | None = None) -> T:
+        self.calls += 1
+        primary = asyncio.ensure_future(self.timed(model, call))
+        threshold = self.threshold(model)
+        running = {primary}
+        try:
+            if threshold is not None:
+                done, _ = await asyncio.wait(running, timeout=threshold)
+                if not done and self.can_hedge():
+                    self.hedges += 1
+                    logging.debug("Hedging a %s call after %.2fs", model, threshold)
+                    hedge = lambda: self.timed(model, call)
+                    running.add(asyncio.ensure_future(launch(hedge) if launch else hedge()))
+            while True:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is not primary:
+                        self.hedge_wins += 1
+                    return winner.result()
+                running -= done
+                if not running:
+                    # Both failed, surface the primary's error.
+                    return primary.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "latency": self.tracker.stats()}
+
+
+def add_hedging_arguments(parser):
+    parser.add_argument('--hedge-percentile', type=float, default=None, help='Send a duplicate request once a call passes this percentile of recent latency (e.g. 0.95), off by default')
+    parser.add_argument('--hedge-budget', type=float, default=0.1, help='Most hedged requests as a fraction of all requests')
+    parser.add_argument('--hedge-min-samples', type=int, default=20, help='Latencies to observe per model before hedging')
+
+
+def hedger_from_args(args) -> Hedger | None:
+    if args.hedge_percentile is None:
+        return None
+    return Hedger(percentile=args.hedge_percentile, budget=args.hedge_budget, min_samples=args.hedge_min_samples)
@@ -0,0 +1,252 @@
+import asyncio
+import itertools
+import logging
+import marshal
+import multiprocessing
+import os
+import struct
+import tempfile
+import zlib
+from typing import Callable
+
+# Frames are tuples of plain values (str, int, float, bool, None, list, tuple, dict), op name first.
+# On the wire: 4 byte big endian length, then the marshal encoding. Both ends run the same interpreter.
+HEADER = struct.Struct("!I")
+MAX_FRAME = 64 * 1024 * 1024
+
+PLACEMENTS = ("least-loaded", "round-robin", "hash")
+
+
+def encode(frame: tuple) -> bytes:
+    payload = marshal.dumps(frame)
+    if len(payload) > MAX_FRAME:
+        raise ValueError(f"{frame[0]} frame is {len(payload)} bytes, over the {MAX_FRAME} byte limit")
+    return HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple | None:
+    """The next frame, or None once the other end has gone away."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+        (length,) = HEADER.unpack(header)
+        return marshal.loads(await reader.readexactly(length))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class RemoteError(Exception):
+    pass
+
+
+class Connection:
+    """
+    One end of a worker link. send writes a frame without waiting, call sends ("call", id, ...) and waits for the
+    matching ("reply", id, value, error). Every other frame goes to handler, and whatever handler returns for a
+    call frame (awaited if it's a coroutine) is sent back as the reply.
+    """
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 handler: Callable[['Connection', tuple], object] | None = None):
+        self.reader = reader
+        self.writer = writer
+        self.handler = handler
+        self.pending: dict[int, asyncio.Future] = {}
+        self.counter = itertools.count()
+
+    def send(self, *frame):
+        if self.writer.is_closing():
+            logging.warning("Dropping %s frame, connection is closed", frame[0])
+            return
+        self.writer.write(encode(frame))
+
+    async def call(self, *payload):
+        request_id = next(self.counter)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.send("call", request_id, *payload)
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def answer(self, request_id: int, result: object):
+        try:
+            if asyncio.iscoroutine(result):
+                result = await result
+            self.send("reply", request_id, result, None)
+        except Exception as e:
+            logging.exception("Call %s failed", request_id)
+            self.send("reply", request_id, None, repr(e))
+
+    async def serve(self):
+        """Read frames until the other end closes. Outstanding calls fail when it does."""
+        try:
+            while (frame := await read_frame(self.reader)) is not None:
+                if frame[0] == "reply":
+                    _, request_id, value, error = frame
+                    future = self.pending.get(request_id)
+                    if future is None or future.done():
+                        continue
+                    if error is None:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(RemoteError(error))
+                    continue
+                if self.handler is None:
+                    continue
+                if frame[0] == "call":
+                    try:
+                        result = self.handler(self, frame[2:])
+                    except Exception as e:
+                        logging.exception("Call %s failed", frame[1])
+                        self.send("reply", frame[1], None, repr(e))
+                        continue
+                    asyncio.ensure_future(self.answer(frame[1], result))
+                    continue
+                result = self.handler(self, frame)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(RemoteError("connection closed"))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+
+async def connect(path: str, index: int, handler: Callable[[Connection, tuple], object]) -> Connection:
+    """Worker side: dial the coordinator and say which worker this is."""
+    reader, writer = await asyncio.open_unix_connection(path)
+    connection = Connection(reader, writer, handler)
+    connection.send("hello", index, os.getpid())
+    return connection
+
+
+def place(placement: str, name: str, load: list[int], counter: int) -> int:
+    if placement == "round-robin":
+        return counter % len(load)
+    if placement == "hash":
+        # Stable across runs, so the same name always lands on the same worker.
+        return zlib.crc32(name.encode()) % len(load)
+    return min(range(len(load)), key=load.__getitem__)
+
+
+class WorkerPool:
+    """
+    Coordinator side of a pool of worker processes connected over a unix socket.
+    Each worker runs target(path, index, *args) and dials back with ipc.connect. Work is pinned to a worker by
+    name through the placement strategy: least-loaded, round-robin or hash.
+    """
+    def __init__(self,
+                 workers: int,
+                 target: Callable[..., None],
+                 args: tuple = (),
+                 placement: str = "least-loaded",
+                 handler: Callable[[Connection, tuple], object] | None = None,
+                 start_timeout: float = 30.0):
+        if placement not in PLACEMENTS:
+            raise ValueError(f"Unknown placement {placement}, expected one of {PLACEMENTS}")
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.placement = placement
+        self.handler = handler
+        self.start_timeout = start_timeout
+        self.connections: dict[int, Connection] = {}
+        self.processes: list[multiprocessing.Process] = []
+        self.load = [0] * workers
+        self.placed: dict[str, int] = {}
+        self.placements = itertools.count()
+        self.directory: tempfile.TemporaryDirectory | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.ready: asyncio.Future | None = None
+        self.stopping = False
+
+    async def start(self):
+        self.directory = tempfile.TemporaryDirectory(prefix="kernel-ipc-")
+        path = os.path.join(self.directory.name, "coordinator.sock")
+        self.ready = asyncio.get_running_loop().create_future()
+        self.server = await asyncio.start_unix_server(self.accept, path)
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.workers):
+            process = context.Process(target=self.target, args=(path, index, *self.args), name=f"kernel-worker-{index}", daemon=True)
+            process.start()
+            self.processes.append(process)
+        await asyncio.wait_for(self.ready, self.start_timeout)
+        logging.info("%s workers up: %s", self.workers, [p.pid for p in self.processes])
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = await read_frame(reader)
+        if hello is None or hello[0] != "hello":
+            writer.close()
+            return
+        connection = Connection(reader, writer, self.handler)
+        self.connections[hello[1]] = connection
+        logging.debug("Worker %s connected from pid %s", hello[1], hello[2])
+        if len(self.connections) == self.workers and not self.ready.done():
+            self.ready.set_result(None)
+        await connection.serve()
+        if self.connections.get(hello[1]) is connection:
+            if not self.stopping:
+                logging.error("Worker %s disconnected", hello[1])
+            del self.connections[hello[1]]
+
+    def place(self, name: str) -> int:
+        if name in self.placed:
+            return self.placed[name]
+        index = place(self.placement, name, self.load, next(self.placements))
+        self.placed[name] = index
+        self.load[index] += 1
+        return index
+
+    def forget(self, name: str):
+        index = self.placed.pop(name, None)
+        if index is not None:
+            self.load[index] -= 1
+
+    def send(self, name: str, *frame):
+        """Send a frame to the worker name is placed on."""
+        connection = self.connections.get(self.placed[name])
+        if connection is None:
+            logging.error("Worker %s for %s is gone, dropping %s", self.placed[name], name, frame[0])
+            return
+        connection.send(*frame)
+
+    def broadcast(self, *frame):
+        for connection in self.connections.values():
+            connection.send(*frame)
+
+    async def gather(self, *payload) -> list:
+        """Call every worker at once and return their replies. A worker that fails to answer is logged and skipped."""
+        replies = await asyncio.gather(*(connection.call(*payload) for connection in self.connections.values()), return_exceptions=True)
+        for reply in replies:
+            if isinstance(reply, BaseException):
+                logging.error("Worker failed to answer %s: %r", payload[0], reply)
+        return [reply for reply in replies if not isinstance(reply, BaseException)]
+
+    async def stop(self, timeout: float = 5.0):
+        self.stopping = True
+        self.broadcast("shutdown")
+        await asyncio.gather(*(connection.drain() for connection in self.connections.values()), return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logging.warning("Worker %s did not stop, terminating it", process.name)
+                process.terminate()
+        for connection in self.connections.values():
+            connection.close()
+        if self.server is not None:
+            self.server.close()
+        if self.directory is not None:
+            self.directory.cleanup()
+
+
+def add_ipc_arguments(parser):
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes to shard child processes over, 0 runs everything in this process')
+    parser.add_argument('--placement', default='least-loaded', choices=PLACEMENTS, help='How child processes are assigned to workers')
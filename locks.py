@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+GRANT = "grant"
+ESCALATE = "escalate"
+DENY = "deny"
+
+
+class DeadlockError(Exception):
+    pass
+
+
+class Lease:
+    def __init__(self, owner: str, duration: float | None):
+        self.owner = owner
+        self.granted = time.monotonic()
+        self.expires = None if duration is None else self.granted + duration
+
+    def expired(self, now: float) -> bool:
+        return self.expires is not None and now >= self.expires
+
+
+class Waiter:
+    def __init__(self, owner: str, reason: str, future: asyncio.Future | None):
+        self.owner = owner
+        self.reason = reason
+        self.future = future
+
+
+def default_policy(manager: 'LockManager', resource: str, owner: str, reason: str) -> str:
+    """Free locks are granted on the spot. Contended locks, and owners hoarding locks, go to the manager prompt."""
+    if manager.held_by(owner) and len(manager.held_by(owner)) >= manager.max_held:
+        return ESCALATE
+    if manager.holder(resource) is None and not manager.waiters.get(resource):
+        return GRANT
+    return ESCALATE
+
+
+class LockManager:
+    """
+    Owns a set of named locks (registers or channels).
+    Each lock has one holder on a lease, and a FIFO queue of waiters who get it in order when it is released.
+    A policy decides whether a request is granted straight away or escalated (queued, and on_escalate is told so
+    the manager prompt can weigh in). Requests that would close a wait-for cycle are refused with DeadlockError.
+    """
+    def __init__(self,
+                 kind: str,
+                 lease: float | None = 120.0,
+                 max_held: int = 4,
+                 policy: Callable[['LockManager', str, str, str], str] = default_policy,
+                 on_grant: Callable[[str, str], None] | None = None,
+                 on_release: Callable[[str, str], None] | None = None,
+                 on_escalate: Callable[[str, str, str], None] | None = None):
+        self.kind = kind
+        self.lease = lease
+        self.max_held = max_held
+        self.policy = policy
+        self.on_grant = on_grant
+        self.on_release = on_release
+        self.on_escalate = on_escalate
+        self.leases: dict[str, Lease] = {}
+        self.waiters: dict[str, deque[Waiter]] = {}
+
+    def reap(self):
+        """Release every expired lease."""
+        now = time.monotonic()
+        for resource in [r for r, lease in self.leases.items() if lease.expired(now)]:
+            logging.warning("Lease on %s %s held by %s expired", self.kind, resource, self.leases[resource].owner)
+            self.release(resource)
+
+    def holder(self, resource: str) -> str | None:
+        lease = self.leases.get(resource)
+        if lease is not None and lease.expired(time.monotonic()):
+            self.reap()
+            lease = self.leases.get(resource)
+        return lease.owner if lease else None
+
+    def holders(self) -> dict[str, str]:
+        self.reap()
+        return {resource: lease.owner for resource, lease in self.leases.items()}
+
+    def held_by(self, owner: str) -> list[str]:
+        return [resource for resource, lease in self.leases.items() if lease.owner == owner]
+
+    def would_deadlock(self, resource: str, owner: str) -> bool:
+        """Would owner waiting on resource close a cycle in the wait-for graph?"""
+        waiting_on: dict[str, set[str]] = {}
+        for queued, waiters in self.waiters.items():
+            for waiter in waiters:
+                waiting_on.setdefault(waiter.owner, set()).add(queued)
+        seen, current = set(), self.holder(resource)
+        frontier = [current] if current else []
+        while frontier:
+            current = frontier.pop()
+            if current == owner:
+                return True
+            if current in seen:
+                continue
+            seen.add(current)
+            for queued in waiting_on.get(current, ()):
+                holder = self.holder(queued)
+                if holder:
+                    frontier.append(holder)
+        return False
+
+    def assign(self, resource: str, owner: str):
+        self.leases[resource] = Lease(owner, self.lease)
+        logging.info("%s %s locked to %s", self.kind.capitalize(), resource, owner)
+        if self.on_grant:
+            self.on_grant(resource, owner)
+
+    def request(self, resource: str, owner: str, reason: str = "", future: asyncio.Future | None = None) -> str:
+        """Ask for a lock without waiting. Returns GRANT, ESCALATE (queued) or DENY."""
+        holder = self.holder(resource)
+        if holder == owner:
+            return GRANT
+        decision = self.policy(self, resource, owner, reason)
+        if decision == GRANT and holder is None:
+            self.assign(resource, owner)
+            return GRANT
+        if decision == DENY:
+            return DENY
+        if self.would_deadlock(resource, owner):
+            logging.error("%s waiting on %s %s would deadlock", owner, self.kind, resource)
+            raise DeadlockError(f"{owner} waiting on {self.kind} {resource} held by {holder} would deadlock")
+        self.waiters.setdefault(resource, deque()).append(Waiter(owner, reason, future))
+        if self.on_escalate:
+            self.on_escalate(resource, owner, reason)
+        return ESCALATE
+
+    async def acquire(self, resource: str, owner: str, reason: str = "", timeout: float | None = None) -> bool:
+        """Wait for a lock. Uncontended requests return without yielding to the event loop."""
+        future = asyncio.get_running_loop().create_future()
+        decision = self.request(resource, owner, reason, future)
+        if decision != ESCALATE:
+            return decision == GRANT
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.cancel(resource, owner)
+            return False
+
+    def cancel(self, resource: str, owner: str):
+        waiters = self.waiters.get(resource)
+        if waiters:
+            self.waiters[resource] = deque(w for w in waiters if w.owner != owner)
+
+    def release(self, resource: str, owner: str | None = None):
+        """Release a lock (only if owner holds it, when given) and hand it to the next waiter."""
+        lease = self.leases.get(resource)
+        if lease is None or (owner is not None and lease.owner != owner):
+            return
+        del self.leases[resource]
+        logging.info("%s %s released by %s", self.kind.capitalize(), resource, lease.owner)
+        if self.on_release:
+            self.on_release(resource, lease.owner)
+        self.hand_over(resource)
+
+    def hand_over(self, resource: str):
+        waiters = self.waiters.get(resource)
+        while waiters:
+            waiter = waiters.popleft()
+            if waiter.future is not None and waiter.future.done():
+                continue
+            self.assign(resource, waiter.owner)
+            if waiter.future is not None:
+                waiter.future.set_result(True)
+            break
+        if not waiters:
+            self.waiters.pop(resource, None)
+
+    def grant(self, resource: str, owner: str):
+        """The manager's decision: give a free lock to owner, ahead of anyone queued."""
+        holder = self.holder(resource)
+        if holder == owner:
+            return
+        if holder is not None:
+            raise ValueError(f"{self.kind.capitalize()} {resource} is locked by {holder}, release it first")
+        waiting = [w for w in self.waiters.get(resource, ()) if w.owner == owner]
+        self.cancel(resource, owner)
+        self.assign(resource, owner)
+        for waiter in waiting:
+            if waiter.future is not None and not waiter.future.done():
+                waiter.future.set_result(True)
+
+    def discard(self, resource: str):
+        """The resource is gone: drop its holder without handing it over, and tell its waiters they won't get it."""
+        lease = self.leases.pop(resource, None)
+        if lease is not None and self.on_release:
+            self.on_release(resource, lease.owner)
+        for waiter in self.waiters.pop(resource, ()):
+            if waiter.future is not None and not waiter.future.done():
+                waiter.future.set_result(False)
+
+    def release_all(self, owner: str):
+        for resource in self.held_by(owner):
+            self.release(resource)
+        for resource in list(self.waiters):
+            self.cancel(resource, owner)
@@ -0,0 +1,269 @@
+import bisect
+import json
+import math
+import os
+import re
+import time
+from collections import deque
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def label_key(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q quantile, the last finite bound for the overflow bucket."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != math.inf else BUCKETS[-2]
+        return BUCKETS[-2]
+
+    def merge(self, counts: list[int], count: int, total: float):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": round(self.sum, 6), "p50": self.quantile(0.5), "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99)}
+
+
+class Span:
+    """
+    One timed operation. Use as a context manager or call end(). Until it ends, set() attaches attributes
+    (kept with the span) and add() amounts (kept with the span and summed into counters).
+    Spans from a disabled Metrics are NULL_SPAN, which is falsy, so callers can skip computing them:
+    if span: span.add(prompt_tokens=...)
+    """
+    __slots__ = ("metrics", "name", "labels", "started", "wall", "attributes", "amounts")
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.attributes: dict = {}
+        self.amounts: dict[str, float] = {}
+        self.wall = time.time()
+        self.started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, **amounts: float):
+        for name, amount in amounts.items():
+            self.amounts[name] = self.amounts.get(name, 0) + amount
+        return self
+
+    def end(self, error: BaseException | None = None):
+        self.metrics.finish(self, time.perf_counter() - self.started, error)
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        self.end(error)
+        return False
+
+    def __bool__(self):
+        return True
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        return self
+
+    def add(self, **amounts: float):
+        return self
+
+    def end(self, error: BaseException | None = None):
+        pass
+
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        return False
+
+    def __bool__(self):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Metrics:
+    """
+    Counters, latency histograms and the most recent spans, kept in process.
+    A finished span feeds the histogram <name>_seconds and the counter <name>_total (with a status label). Its amounts
+    are summed into <name>_<amount>_total, so e.g. token estimates add up per model, and each attribute that is True
+    counts once in <name>_<attribute>_total.
+    snapshot() gives everything as a dict, export() writes it to path as JSON (.json) or Prometheus text (anything else).
+    When disabled every method returns straight away and span() hands out NULL_SPAN.
+    """
+    def __init__(self, enabled: bool = True, path: str | None = None, span_limit: int = 1000):
+        self.enabled = enabled
+        self.path = path
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.spans: deque[dict] = deque(maxlen=span_limit)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def span(self, name: str, **labels) -> Span | NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, labels)
+
+    def finish(self, span: Span, duration: float, error: BaseException | None):
+        self.observe(f"{span.name}_seconds", duration, **span.labels)
+        self.count(f"{span.name}_total", status="error" if error is not None else "ok", **span.labels)
+        for attribute, value in span.attributes.items():
+            if value is True:
+                self.count(f"{span.name}_{attribute}_total", **span.labels)
+        for amount, value in span.amounts.items():
+            self.count(f"{span.name}_{amount}_total", value, **span.labels)
+        record = {"name": span.name, "start": round(span.wall, 6), "seconds": round(duration, 6), **span.labels,
+                  **span.attributes, **span.amounts}
+        if error is not None:
+            record["error"] = repr(error)
+        self.spans.append(record)
+
+    def drain(self) -> dict:
+        """Hand over everything recorded so far and start afresh. A worker process drains, its coordinator merges."""
+        # Plain containers only, it crosses the IPC link.
+        histograms = {name: {key: [histogram.counts, histogram.count, histogram.sum] for key, histogram in series.items()}
+                      for name, series in self.histograms.items()}
+        data = {"counters": self.counters, "histograms": histograms, "spans": list(self.spans)}
+        self.counters, self.histograms = {}, {}
+        self.spans.clear()
+        return data
+
+    def merge(self, data: dict):
+        """Add what another Metrics drained to this one."""
+        if not self.enabled:
+            return
+        for name, series in data["counters"].items():
+            mine = self.counters.setdefault(name, {})
+            for key, value in series.items():
+                mine[key] = mine.get(key, 0) + value
+        for name, series in data["histograms"].items():
+            mine = self.histograms.setdefault(name, {})
+            for key, (counts, count, total) in series.items():
+                mine.setdefault(key, Histogram()).merge(counts, count, total)
+        self.spans.extend(data["spans"])
+
+    def snapshot(self, spans: int = 50) -> dict:
+        """Counters, histograms and the most recent spans, at most spans of them."""
+        return {
+            "counters": {name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                         for name, series in self.counters.items()},
+            "histograms": {name: [{"labels": dict(key), **histogram.to_dict()} for key, histogram in series.items()]
+                           for name, series in self.histograms.items()},
+            "spans": list(self.spans)[-spans:] if spans else [],
+        }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            name = metric_name(name)
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{format_labels(key)} {value:g}")
+        for name, series in sorted(self.histograms.items()):
+            name = metric_name(name)
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(key)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str | None = None):
+        """Write the metrics to path (or the path given at creation), atomically. Does nothing without a path."""
+        path = path or self.path
+        if not self.enabled or not path:
+            return
+        if path.endswith(".json"):
+            data = json.dumps(self.snapshot(spans=len(self.spans)), separators=(",", ":"))
+        else:
+            data = self.to_prometheus()
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+
+def metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{metric_name(name)}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+_metrics = Metrics(enabled=False)
+
+
+def set_metrics(metrics: Metrics):
+    global _metrics
+    _metrics = metrics
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics', action='store_true', help='Record spans, counters and latency histograms for LLM calls, ticks and syscalls')
+    parser.add_argument('--metrics-path', default=None, help='File to export metrics to after every tick, JSON when it ends in .json, Prometheus text otherwise')
+
+
+def metrics_from_args(args) -> Metrics:
+    return Metrics(enabled=args.metrics or args.metrics_path is not None, path=args.metrics_path)
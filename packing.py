@@ -0,0 +1,59 @@
+import logging
+import re
+
+import scheduler
+
+SECTION_HEADER = "=== {label} ==="
+SECTION_PATTERN = re.compile(r"^\s*=+\s*([A-Z]\d+)\s*=+\s*$", re.MULTILINE)
+
+
+def plan_packs(prefix: str, bodies: list[tuple[str, str]], max_tokens: int, max_size: int) -> list[list[tuple[str, str]]]:
+    """
+    Greedily group (id, body) pairs that share prefix so each packed prompt stays under max_tokens.
+    A body that doesn't fit with anything else ends up in a group of one.
+    """
+    budget = max_tokens - scheduler.estimate_tokens(prefix)
+    packs: list[list[tuple[str, str]]] = []
+    current: list[tuple[str, str]] = []
+    used = 0
+    for task_id, body in bodies:
+        cost = scheduler.estimate_tokens(body) + 8
+        if current and (used + cost > budget or len(current) >= max_size):
+            packs.append(current)
+            current, used = [], 0
+        current.append((task_id, body))
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def labels_for(count: int) -> list[str]:
+    # Short labels keep the model from mangling 48 character task ids.
+    return [f"S{i + 1}" for i in range(count)]
+
+
+def pack_prompt(prefix: str, bodies: list[str]) -> str:
+    sections = "\n".join(f"{SECTION_HEADER.format(label=label)}\n{body}" for label, body in zip(labels_for(len(bodies)), bodies))
+    return (f"{prefix}\n"
+            f"The shared information above applies to {len(bodies)} separate requests below. Answer each one independently. "
+            f"Start each answer with its header line exactly as given (e.g. {SECTION_HEADER.format(label='S1')}) and write nothing before the first header.\n"
+            f"{sections}")
+
+
+def split_packed(response: str, count: int) -> list[str] | None:
+    """Answers in section order, or None if the response doesn't have exactly one non empty answer per section."""
+    labels = labels_for(count)
+    matches = list(SECTION_PATTERN.finditer(response))
+    found = [m.group(1) for m in matches]
+    if sorted(found) != sorted(labels):
+        logging.warning("Packed response has sections %s, expected %s", found, labels)
+        return None
+    answers = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(response)
+        answers[match.group(1)] = response[match.end():end].strip()
+    if not all(answers.values()):
+        logging.warning("Packed response has an empty section")
+        return None
+    return [answers[label] for label in labels]
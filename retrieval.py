@@ -0,0 +1,286 @@
+import array
+import json
+import logging
+import math
+import mmap
+import os
+import zlib
+from collections import Counter
+from typing import Callable
+
+import budget
+import digest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+# Weight of embedding similarity against BM25 when an index has both.
+EMBEDDING_WEIGHT = 0.3
+KNOWLEDGE_DIRECTORIES = ("self_research", "provided")
+
+
+class HashingEmbedder:
+    """
+    Local embeddings without a model: each term is hashed (crc32) into one of dim buckets with a hashed sign,
+    weighted 1 + log(count), and the vector is normalized. Texts sharing terms end up close. Needs numpy.
+    """
+    def __init__(self, dim: int = 256):
+        if np is None:
+            raise RuntimeError("Embeddings need numpy, install it or index with BM25 only")
+        self.dim = dim
+
+    def embed(self, texts: list[str]):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(digest.terms(text)).items():
+                h = zlib.crc32(term.encode("utf-8"))
+                vectors[row, h % self.dim] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+class Hit:
+    def __init__(self, score: float, source: str, text: str):
+        self.score = score
+        self.source = source
+        self.text = text
+
+    def __repr__(self):
+        return f"Hit({self.score:.3f}, {self.source!r})"
+
+
+def mapped(path: str, typecode: str):
+    """The array in path, memory mapped. Empty files can't be mapped, they give an empty array."""
+    if os.path.getsize(path) == 0:
+        return memoryview(array.array(typecode))
+    with open(path, "rb") as file:
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).cast(typecode)
+
+
+def write_atomic(path: str, data: bytes):
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class Index:
+    """
+    BM25 over chunks of a set of documents, with an optional hashing embedding of each chunk.
+
+    On disk (save/load) an index is a directory: postings.bin holds (chunk, term count) uint32 pairs grouped by term,
+    lengths.bin the term count of each chunk, offsets.bin and texts.bin the chunk texts, embeddings.npy the vectors,
+    and meta.json the vocabulary (term -> first posting, document frequency), sources and the stat of every indexed file.
+    Everything but meta.json is memory mapped, so opening an index reads almost nothing until it is queried.
+    """
+    def __init__(self, vocabulary: dict[str, list[int]], postings, lengths, offsets, texts, sources: list[str],
+                 chunk_sources, embeddings=None, embedder: HashingEmbedder | None = None, files: dict | None = None):
+        self.vocabulary = vocabulary
+        self.postings = postings
+        self.lengths = lengths
+        self.offsets = offsets
+        self.texts = texts
+        self.sources = sources
+        self.chunk_sources = chunk_sources
+        self.embeddings = embeddings
+        self.embedder = embedder
+        self.files = files or {}
+        self.count = len(lengths)
+        self.average_length = (sum(lengths) / self.count) if self.count else 0.0
+
+    @classmethod
+    def build(cls, documents: dict[str, str], chunk_tokens: int | None = 200, embedder: HashingEmbedder | None = None,
+              files: dict | None = None) -> 'Index':
+        """Index documents (source: text). chunk_tokens=None keeps each document as one chunk."""
+        sources = list(documents)
+        chunks, chunk_sources = [], array.array("I")
+        for i, source in enumerate(sources):
+            for piece in (digest.chunk(documents[source], chunk_tokens) if chunk_tokens else [documents[source]]):
+                if piece.strip():
+                    chunks.append(piece)
+                    chunk_sources.append(i)
+        by_term: dict[str, list[tuple[int, int]]] = {}
+        lengths = array.array("I")
+        for chunk_id, text in enumerate(chunks):
+            counts = Counter(digest.terms(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                by_term.setdefault(term, []).append((chunk_id, count))
+        vocabulary, postings = {}, array.array("I")
+        for term in sorted(by_term):
+            vocabulary[term] = [len(postings) // 2, len(by_term[term])]
+            for chunk_id, count in by_term[term]:
+                postings.extend((chunk_id, count))
+        encoded = [text.encode("utf-8") for text in chunks]
+        offsets = array.array("Q", [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        embeddings = embedder.embed(chunks) if embedder is not None and chunks else None
+        return cls(vocabulary, memoryview(postings), memoryview(lengths), memoryview(offsets), b"".join(encoded),
+                   sources, memoryview(chunk_sources), embeddings, embedder, files)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(os.path.join(directory, "postings.bin"), self.postings.tobytes())
+        write_atomic(os.path.join(directory, "lengths.bin"), self.lengths.tobytes())
+        write_atomic(os.path.join(directory, "offsets.bin"), self.offsets.tobytes())
+        write_atomic(os.path.join(directory, "texts.bin"), bytes(self.texts))
+        write_atomic(os.path.join(directory, "chunk_sources.bin"), self.chunk_sources.tobytes())
+        embeddings = os.path.join(directory, "embeddings.npy")
+        if self.embeddings is not None:
+            with open(f"{embeddings}.tmp", "wb") as file:
+                np.save(file, np.asarray(self.embeddings, dtype=np.float32))
+            os.replace(f"{embeddings}.tmp", embeddings)
+        elif os.path.exists(embeddings):
+            os.remove(embeddings)
+        meta = {"vocabulary": self.vocabulary, "sources": self.sources, "files": self.files,
+                "dim": self.embedder.dim if self.embedder else None}
+        # Last, an index is only picked up once all of its files are in place.
+        write_atomic(os.path.join(directory, "meta.json"), json.dumps(meta, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def load(cls, directory: str) -> 'Index':
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        texts_path = os.path.join(directory, "texts.bin")
+        texts = mapped(texts_path, "B")
+        embeddings, embedder = None, None
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        if meta.get("dim") and os.path.exists(embeddings_path):
+            if np is None:
+                logging.warning("%s has embeddings but numpy is not installed, using BM25 only", directory)
+            else:
+                embeddings = np.load(embeddings_path, mmap_mode="r")
+                embedder = HashingEmbedder(meta["dim"])
+        return cls(meta["vocabulary"], mapped(os.path.join(directory, "postings.bin"), "I"),
+                   mapped(os.path.join(directory, "lengths.bin"), "I"), mapped(os.path.join(directory, "offsets.bin"), "Q"),
+                   texts, meta["sources"], mapped(os.path.join(directory, "chunk_sources.bin"), "I"),
+                   embeddings, embedder, meta.get("files"))
+
+    def text(self, chunk_id: int) -> str:
+        return bytes(self.texts[self.offsets[chunk_id]:self.offsets[chunk_id + 1]]).decode("utf-8")
+
+    def bm25(self, query: str) -> dict[int, float]:
+        scores: dict[int, float] = {}
+        for term in set(digest.terms(query)):
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            start, frequency = entry
+            idf = math.log(1 + (self.count - frequency + 0.5) / (frequency + 0.5))
+            for i in range(start * 2, (start + frequency) * 2, 2):
+                chunk_id, count = self.postings[i], self.postings[i + 1]
+                norm = K1 * (1 - B + B * self.lengths[chunk_id] / self.average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (K1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5) -> list[Hit]:
+        """The k chunks most relevant to query, best first."""
+        if not self.count:
+            return []
+        scores = self.bm25(query)
+        if self.embeddings is not None:
+            # Blend the two, BM25 scaled to [0, 1] so the weight means the same for every query.
+            similarity = np.asarray(self.embeddings @ self.embedder.embed([query])[0])
+            top = max(scores.values(), default=0.0) or 1.0
+            candidates = set(scores) | set(np.argpartition(-similarity, min(k, self.count - 1))[:k].tolist())
+            scores = {c: (1 - EMBEDDING_WEIGHT) * scores.get(c, 0.0) / top + EMBEDDING_WEIGHT * float(similarity[c])
+                      for c in candidates}
+        best = sorted(((score, c) for c, score in scores.items() if score > 0), reverse=True)[:k]
+        return [Hit(score, self.sources[self.chunk_sources[c]], self.text(c)) for score, c in best]
+
+    def rank(self, query: str, k: int) -> list[str]:
+        """Up to k sources ordered by their best chunk's relevance to query."""
+        ranked = []
+        for hit in self.search(query, k * 4):
+            if hit.source not in ranked:
+                ranked.append(hit.source)
+        return ranked[:k]
+
+    def context(self, query: str, max_tokens: int = 1500, k: int = 5) -> str:
+        """The most relevant chunks for query, labelled with their source, within max_tokens."""
+        picked, used = [], 0
+        for hit in self.search(query, k):
+            text = f"[{hit.source}]\n{hit.text}"
+            cost = budget.count_tokens(text)
+            if used + cost > max_tokens:
+                continue
+            picked.append(text)
+            used += cost
+        return "\n...\n".join(picked)
+
+
+def relevant(query: str, items: dict[str, object], k: int, describe: Callable[[object], str] = repr) -> dict[str, object]:
+    """
+    The k items whose name and description are most relevant to query, or all of them when there are no more than k.
+    When fewer than k match query at all, the rest are filled in the order items were added.
+    """
+    if len(items) <= k:
+        return items
+    names = Index.build({name: f"{name} {describe(item)}" for name, item in items.items()}, chunk_tokens=None).rank(query, k)
+    names += [name for name in items if name not in names][:k - len(names)]
+    return {name: items[name] for name in names}
+
+
+def knowledge_files(root: str, directories=KNOWLEDGE_DIRECTORIES) -> dict[str, list[int]]:
+    """Relative path: [size, mtime] of every text file in the knowledge directories under root."""
+    files = {}
+    for directory in directories:
+        for parent, _, names in os.walk(os.path.join(root, directory)):
+            for name in names:
+                path = os.path.join(parent, name)
+                if not is_text(path):
+                    continue
+                stat = os.stat(path)
+                files[os.path.relpath(path, root)] = [stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def is_text(path: str) -> bool:
+    """Binary files (NUL bytes in the first 4KB) stay out of the index."""
+    try:
+        with open(path, "rb") as file:
+            head = file.read(4096)
+    except OSError:
+        return False
+    return b"\0" not in head
+
+
+def open_knowledge(root: str, index_directory: str, embeddings: bool = False, directories=KNOWLEDGE_DIRECTORIES) -> Index | None:
+    """
+    The index of the knowledge base under root, rebuilt only when a file in it was added, removed or changed.
+    None when the knowledge base is empty.
+    """
+    files = knowledge_files(root, directories)
+    if not files:
+        return None
+    try:
+        index = Index.load(index_directory)
+        if index.files == files and (index.embedder is not None) == embeddings:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    documents = {}
+    for path in files:
+        with open(os.path.join(root, path), encoding="utf-8", errors="replace") as file:
+            documents[path] = file.read()
+    index = Index.build(documents, embedder=HashingEmbedder() if embeddings else None, files=files)
+    index.save(index_directory)
+    logging.info("Indexed %s knowledge files into %s chunks", len(files), index.count)
+    return Index.load(index_directory)
+
+
+def add_retrieval_arguments(parser):
+    parser.add_argument('--knowledge-root', default='.', help=f'Directory holding the knowledge base ({", ".join(KNOWLEDGE_DIRECTORIES)})')
+    parser.add_argument('--knowledge-index', default='.knowledge_index', help='Directory to keep the knowledge index in')
+    parser.add_argument('--embeddings', action='store_true', help='Also rank knowledge with local hashing embeddings, needs numpy')
+    parser.add_argument('--knowledge-tokens', type=int, default=1500, help='Token budget for retrieved knowledge in each prompt')
+
+
+def knowledge_from_args(args) -> Index | None:
+    return open_knowledge(args.knowledge_root, os.path.join(args.knowledge_root, args.knowledge_index), args.embeddings)
@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import budget
+import metrics
+
+T = TypeVar("T")
+
+# Lower runs first.
+PRIORITY_KERNEL = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_THINK = 10
+
+
+def estimate_tokens(text: str) -> int:
+    return budget.count_tokens(text)
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holds at most capacity (defaults to one minute's worth)."""
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount: float = 1):
+        # A request bigger than the whole bucket would wait forever, so it only waits for a full bucket.
+        amount = min(amount, self.capacity)
+        self.refill()
+        while self.tokens < amount:
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+            self.refill()
+        self.tokens -= amount
+
+
+class Scheduler:
+    """
+    Runs LLM calls with a concurrency cap, request/token rate limits, priorities and retries.
+    Waiting calls are started in priority order, ties are broken first come first served.
+    Failed calls are retried with full-jitter exponential backoff.
+    """
+    def __init__(self,
+                 max_concurrency: int = 8,
+                 requests_per_minute: float | None = None,
+                 tokens_per_minute: float | None = None,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30.0,
+                 retry_on: tuple[type[BaseException], ...] = (Exception,)):
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_on = retry_on
+        self.active = 0
+        self.waiting: list[tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def acquire(self, priority: int):
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+        slot = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.counter), slot))
+        try:
+            await slot
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before we were cancelled.
+            if slot.done() and not slot.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Hand the slot to the highest priority waiter, or free it."""
+        while self.waiting:
+            _, _, slot = heapq.heappop(self.waiting)
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.active -= 1
+
+    async def attempt(self, call: Callable[[], Awaitable[T]], priority: int = PRIORITY_DEFAULT, tokens: int = 0) -> T:
+        """One try at call, holding a slot and taken from the rate limits like any other request."""
+        await self.acquire(priority)
+        try:
+            if self.request_bucket:
+                await self.request_bucket.take(1)
+            if self.token_bucket and tokens:
+                await self.token_bucket.take(tokens)
+            return await call()
+        finally:
+            self.release()
+
+    async def run(self, call: Callable[[], Awaitable[T]], priority: int = PRIORITY_DEFAULT, tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await self.attempt(call, priority, tokens)
+            except self.retry_on as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logging.error("Giving up after %s retries: %s", self.max_retries, e)
+                    raise
+                delay = self.backoff(attempt)
+                metrics.get_metrics().count("llm_retries_total")
+                logging.warning("Call failed (%s), retry %s/%s in %.2fs", e, attempt, self.max_retries, delay)
+            await asyncio.sleep(delay)
+
+    def submit(self, call: Callable[[], Awaitable[T]], priority: int = PRIORITY_DEFAULT, tokens: int = 0) -> asyncio.Task:
+        return asyncio.ensure_future(self.run(call, priority, tokens))
+
+
+def add_scheduler_arguments(parser):
+    parser.add_argument('--max-concurrency', type=int, default=8, help='Maximum LLM requests in flight')
+    parser.add_argument('--rpm', type=float, default=None, help='Requests per minute limit')
+    parser.add_argument('--tpm', type=float, default=None, help='Tokens per minute limit')
+    parser.add_argument('--max-retries', type=int, default=3, help='Retries per failed LLM request')
+
+
+def scheduler_from_args(args) -> Scheduler:
+    return Scheduler(max_concurrency=args.max_concurrency,
+                     requests_per_minute=args.rpm,
+                     tokens_per_minute=args.tpm,
+                     max_retries=args.max_retries)
@@ -1,5 +1,24 @@
+import codecs
+import json
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal
+
+file_type = Literal['ignore', 'code', 'data', 'knowledge']
+
+# Only this much of each file is read to tell text from binary.
+SNIFF_BYTES = 4096
+
+ALWAYS_IGNORED = {'.git', '__pycache__', 'node_modules', '.venv', 'venv', '.mypy_cache', '.pytest_cache'}
+
+CODE_EXTENSIONS = {'.py', '.pyi', '.go', '.js', '.jsx', '.ts', '.tsx', '.java', '.kt', '.c', '.h', '.cc', '.cpp', '.hpp',
+                   '.cs', '.rs', '.rb', '.php', '.swift', '.scala', '.sh', '.bash', '.zsh', '.ps1', '.lua', '.r', '.sql',
+                   '.html', '.css', '.scss', '.vue', '.svelte', '.m', '.mm', '.pl', '.ex', '.exs', '.erl', '.hs', '.clj'}
+CODE_NAMES = {'Dockerfile', 'Makefile', 'CMakeLists.txt', 'Jenkinsfile', 'Rakefile', 'Gemfile'}
+DATA_EXTENSIONS = {'.json', '.jsonl', '.csv', '.tsv', '.yaml', '.yml', '.toml', '.xml', '.ini', '.cfg', '.conf', '.lock',
+                   '.env', '.properties', '.proto', '.graphql'}
+
 
 def get_git_ignored_files(directory):
     try:
@@ -13,38 +32,198 @@ def get_git_ignored_files(directory):
         )
         ignored_files = result.stdout.splitlines()
         return ignored_files
-    except subprocess.CalledProcessError as e:
-        print(f"Error: {e.stderr}")
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Error: {getattr(e, 'stderr', e)}")
         return []
 
+
+class IgnoreMatcher:
+    """
+    Ignored paths from git: files go in a set, directories (listed with a trailing /) in a trie of path components,
+    so a path is matched in one walk down its components however many entries there are.
+    """
+    def __init__(self, ignored: list[str]):
+        self.files: set[str] = set()
+        self.directories: dict = {}
+        for path in ignored:
+            if path.endswith('/'):
+                node = self.directories
+                for part in path.rstrip('/').split('/'):
+                    node = node.setdefault(part, {})
+                node[None] = True
+            else:
+                self.files.add(path)
+
+    def matches(self, relative_path: str) -> bool:
+        relative_path = relative_path.replace(os.sep, '/')
+        if relative_path in self.files:
+            return True
+        node = self.directories
+        for part in relative_path.split('/'):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+
+def sniff(filepath: str) -> tuple[bool, bytes]:
+    """(is text, first SNIFF_BYTES bytes). NUL bytes or invalid UTF-8 in the head mean binary."""
+    with open(filepath, 'rb') as file:
+        head = file.read(SNIFF_BYTES)
+    if b'\0' in head:
+        return False, head
+    try:
+        # Not final, a multi-byte character cut off at the end of the head is fine.
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return False, head
+    return True, head
+
+
 def is_text_file(filepath):
     try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            file.read()
-        return True
-    except:
+        return sniff(filepath)[0]
+    except OSError:
         return False
 
-def classify_files(directory):
-    ignored_files = get_git_ignored_files(directory)
-    classified_files = {'text_files': [], 'ignored_files': []}
 
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            filepath = os.path.join(root, file)
-            relative_path = os.path.relpath(filepath, directory)
+def categorize(filepath: str) -> file_type:
+    try:
+        text, head = sniff(filepath)
+    except OSError:
+        return 'ignore'
+    if not text:
+        return 'ignore'
+    name = os.path.basename(filepath)
+    extension = os.path.splitext(name)[1].lower()
+    if extension in CODE_EXTENSIONS or name in CODE_NAMES or head.startswith(b'#!'):
+        return 'code'
+    if extension in DATA_EXTENSIONS:
+        return 'data'
+    return 'knowledge'
 
-            if relative_path in ignored_files:
-                classified_files['ignored_files'].append(relative_path)
-            elif is_text_file(filepath):
-                classified_files['text_files'].append(relative_path)
+
+class Scanner:
+    """
+    Finds and categorizes every file under a directory.
+    Walks with os.scandir, skipping ignored directories without entering them, sniffs new or changed files on a
+    thread pool, and remembers (size, mtime) and the category of every file in cache_path so a re-scan only
+    reads files that changed.
+    """
+    def __init__(self, directory: str, cache_path: str | None = None, max_workers: int | None = None):
+        self.directory = directory
+        self.cache_path = cache_path
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self.cache: dict[str, list] = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding='utf-8') as file:
+                    self.cache = json.load(file)
+            except (OSError, ValueError):
+                self.cache = {}
+        self.inspected = 0
+
+    def walk(self, matcher: IgnoreMatcher) -> tuple[list[tuple[str, os.stat_result]], list[str]]:
+        """(relative path, stat) of every file to categorize, and the relative paths of ignored files and directories."""
+        files, ignored = [], []
+        stack = ['']
+        while stack:
+            relative_directory = stack.pop()
+            try:
+                entries = os.scandir(os.path.join(self.directory, relative_directory))
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    relative_path = f"{relative_directory}{entry.name}"
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in ALWAYS_IGNORED or matcher.matches(relative_path + '/'):
+                            ignored.append(relative_path + '/')
+                        else:
+                            stack.append(relative_path + '/')
+                    elif entry.is_file(follow_symlinks=False):
+                        if matcher.matches(relative_path):
+                            ignored.append(relative_path)
+                        else:
+                            files.append((relative_path, entry.stat(follow_symlinks=False)))
+        return files, ignored
+
+    def scan(self) -> dict[str, file_type]:
+        matcher = IgnoreMatcher(get_git_ignored_files(self.directory))
+        files, ignored = self.walk(matcher)
+        categories: dict[str, file_type] = {path: 'ignore' for path in ignored}
+        cache: dict[str, list] = {}
+        stale = []
+        for relative_path, stat in files:
+            cached = self.cache.get(relative_path)
+            if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                categories[relative_path] = cached[2]
+                cache[relative_path] = cached
             else:
-                classified_files['ignored_files'].append(relative_path)
+                stale.append((relative_path, stat))
+        if stale:
+            with ThreadPoolExecutor(self.max_workers) as pool:
+                found = pool.map(categorize, [os.path.join(self.directory, path) for path, _ in stale])
+                for (relative_path, stat), category in zip(stale, found):
+                    categories[relative_path] = category
+                    cache[relative_path] = [stat.st_size, stat.st_mtime_ns, category]
+        self.inspected = len(stale)
+        # Files that disappeared drop out of the cache here.
+        self.cache = cache
+        self.save()
+        return categories
+
+    def save(self):
+        if not self.cache_path:
+            return
+        temporary = f"{self.cache_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.cache, file, separators=(',', ':'))
+        os.replace(temporary, self.cache_path)
+
+
+def default_cache_path(directory: str) -> str | None:
+    """Inside .git when there is one, so the cache never shows up as a change in the repo being scanned."""
+    git = os.path.join(directory, '.git')
+    return os.path.join(git, 'file_classifier_cache.json') if os.path.isdir(git) else None
+
+
+def scan(directory: str, cache_path: str | None = None) -> dict[str, file_type]:
+    return Scanner(directory, cache_path or default_cache_path(directory)).scan()
 
+
+def model_files(scanner: Scanner, mirror_dir: str | None = None) -> dict[str, file_type]:
+    """
+    What the mental model of the scanner's directory is built from: every scanned file except the mirror itself.
+    build_mental_model and the kernel's symbol index both use it, so they agree on which files symbols.index holds.
+    """
+    files = scanner.scan()
+    if mirror_dir is None:
+        return files
+    inside = os.path.relpath(mirror_dir, scanner.directory).replace(os.sep, '/') + '/'
+    return {path: category for path, category in files.items() if not (path + '/').startswith(inside)}
+
+
+def code_paths(files: dict[str, file_type]) -> list[str]:
+    return [path for path, category in files.items() if category == 'code']
+
+
+def classify_files(directory):
+    categories = scan(directory)
+    classified_files = {'text_files': [], 'ignored_files': []}
+    for relative_path, category in categories.items():
+        if category == 'ignore':
+            classified_files['ignored_files'].append(relative_path)
+        else:
+            classified_files['text_files'].append(relative_path)
     return classified_files
 
-# Example usage
-directory = '.'
-classified_files = classify_files(directory)
-print("Text files:", classified_files['text_files'])
-#print("Ignored files:", classified_files['ignored_files'])
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Example usage
+    directory = '.'
+    classified_files = classify_files(directory)
+    print("Text files:", classified_files['text_files'])
+    #print("Ignored files:", classified_files['ignored_files'])
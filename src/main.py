@@ -1,11 +1,79 @@
+import asyncio
+import os
+
 from pydantic_ai import Agent
 from pydantic import BaseModel
-from typing import Literal
+from file_classifier import Scanner, code_paths, default_cache_path, file_type, model_files, scan
+from mirror import MirrorStore
+from symbols import SymbolIndex
 
 
-file_type = Literal['ignore', 'code', 'data', 'knowledge']
 def classify_files(directory: str)-> dict[str, file_type]:
-    pass
-#class 
+    return scan(directory)
+
+
+class Definition(BaseModel):
+    name: str
+    summary: str
+
+
+class FileAnalysis(BaseModel):
+    path: str
+    summary: str
+    definitions: list[Definition] = []
+    key_points: list[str] = []
+    relevance: float = 0.0
+    context: str = ""
+
+
+class BatchAnalysis(BaseModel):
+    files: list[FileAnalysis]
+
+
+SYSTEM_PROMPT = """You analyze files of a repository. For every file you are given, answer with its path and a short summary.
+For code files also list its definitions (classes, functions, constants) with a one line summary each.
+For knowledge files list its key points and rate its relevance to understanding the repository from 0 to 1.
+For data files describe in context what the data is and what uses it."""
+
+_agent: Agent | None = None
+
+
+def get_agent() -> Agent:
+    # Created on first use, so the mirror can be queried without a model configured.
+    global _agent
+    if _agent is None:
+        _agent = Agent(model="gemini-1.5-flash", result_type=BatchAnalysis, system_prompt=SYSTEM_PROMPT)
+    return _agent
+
+
+async def analyze(items: list[tuple[str, file_type, str]]) -> list[dict]:
+    prompt = "\n\n".join(f"=== {path} ({category}) ===\n{text}" for path, category, text in items)
+    result = await get_agent().run(prompt)
+    analyses = {analysis.path: analysis.model_dump(exclude={'path'}) for analysis in result.data.files}
+    missing = [path for path, _, _ in items if path not in analyses]
+    if missing:
+        raise ValueError(f"No analysis for {missing}")
+    return [analyses[path] for path, _, _ in items]
+
+
+def default_mirror_dir(directory: str) -> str:
+    return os.path.join(directory, '.mirror')
+
+
+async def build_mental_model(directory: str, mirror_dir: str | None = None, analyzer=analyze) -> tuple[MirrorStore, SymbolIndex]:
+    """
+    Classify the files of directory, bring their mirror up to date, analyzing only files that changed,
+    and update the symbol index of its code files.
+    """
+    store = MirrorStore(directory, mirror_dir or default_mirror_dir(directory))
+    os.makedirs(store.mirror_dir, exist_ok=True)
+    index = SymbolIndex(directory, os.path.join(store.mirror_dir, 'symbols.index'))
+    files = model_files(Scanner(directory, default_cache_path(directory)), store.mirror_dir)
+    parsed = index.update(code_paths(files))
+    stats = await store.refresh(files, analyzer)
+    print(f"Mirror: {stats}, symbols: {parsed} files parsed")
+    return store, index
+
 
-#agent: Agent = Agent(model="gemini-1.5-flash")
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(build_mental_model('.'))
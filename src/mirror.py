@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Awaitable, Callable
+
+# What an analyzer is handed per file: (relative path, file type, text), and returns one dict per file with at least
+# a summary, plus definitions ([{"name", "summary"}]) for code, key_points and relevance for knowledge,
+# and context for data.
+Analyzer = Callable[[list[tuple[str, str, str]]], Awaitable[list[dict]]]
+
+# Files bigger than this are analyzed from their first MAX_ANALYZED_BYTES.
+MAX_ANALYZED_BYTES = 64 * 1024
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MirrorStore:
+    """
+    The mirror repo: every analyzed file has a JSON counterpart under mirror_dir (main.go -> main.go.json) holding
+    its analysis and the content hash it was made from.
+    refresh re-analyzes only files whose hash changed, in batches with a few batches in flight at once, so re-running
+    on an unchanged repo makes no LLM calls. Files whose size and mtime match the mirror aren't even read.
+    Records are written atomically (temporary file, then rename) as compact JSON.
+    """
+    def __init__(self, root: str, mirror_dir: str):
+        self.root = root
+        self.mirror_dir = mirror_dir
+        self.records: dict[str, dict] | None = None
+
+    def path_for(self, relative_path: str) -> str:
+        return os.path.join(self.mirror_dir, relative_path + '.json')
+
+    def load(self, relative_path: str) -> dict | None:
+        if self.records is not None:
+            return self.records.get(relative_path)
+        try:
+            with open(self.path_for(relative_path), encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, relative_path: str, record: dict):
+        path = self.path_for(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(record, file, separators=(',', ':'))
+        os.replace(temporary, path)
+        if self.records is not None:
+            self.records[relative_path] = record
+
+    def remove(self, relative_path: str):
+        try:
+            os.remove(self.path_for(relative_path))
+        except FileNotFoundError:
+            pass
+        if self.records is not None:
+            self.records.pop(relative_path, None)
+
+    def mirrored(self) -> list[str]:
+        paths = []
+        for directory, _, files in os.walk(self.mirror_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    paths.append(os.path.relpath(os.path.join(directory, name), self.mirror_dir)[:-len('.json')].replace(os.sep, '/'))
+        return paths
+
+    def changed(self, files: dict[str, str]) -> list[tuple[str, str, str]]:
+        """(relative path, file type, hash) of every file whose analysis is missing or out of date."""
+        stale = []
+        for relative_path, category in files.items():
+            if category == 'ignore':
+                continue
+            path = os.path.join(self.root, relative_path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            record = self.load(relative_path)
+            if record and record.get('size') == stat.st_size and record.get('mtime_ns') == stat.st_mtime_ns and record.get('type') == category:
+                continue
+            content = file_hash(path)
+            if record and record.get('hash') == content and record.get('type') == category:
+                # Touched but not changed, only the stat needs updating.
+                self.write(relative_path, {**record, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+                continue
+            stale.append((relative_path, category, content))
+        return stale
+
+    def read(self, relative_path: str) -> str:
+        with open(os.path.join(self.root, relative_path), 'rb') as file:
+            return file.read(MAX_ANALYZED_BYTES).decode('utf-8', errors='replace')
+
+    async def refresh(self, files: dict[str, str], analyze: Analyzer, batch_size: int = 8, concurrency: int = 4) -> dict[str, int]:
+        """
+        Bring the mirror up to date with files (relative path: file type, as from file_classifier.scan).
+        Mirror records of files that are gone or now ignored are deleted.
+        """
+        stale = self.changed(files)
+        batches = [stale[i:i + batch_size] for i in range(0, len(stale), batch_size)]
+        slots = asyncio.Semaphore(concurrency)
+        failed = 0
+
+        async def run(batch: list[tuple[str, str, str]]):
+            nonlocal failed
+            async with slots:
+                items = [(relative_path, category, self.read(relative_path)) for relative_path, category, _ in batch]
+                try:
+                    analyses = await analyze(items)
+                except Exception as e:
+                    logging.error("Analysis of %s failed: %r", [item[0] for item in batch], e)
+                    failed += len(batch)
+                    return
+            for (relative_path, category, content), analysis in zip(batch, analyses):
+                stat = os.stat(os.path.join(self.root, relative_path))
+                self.write(relative_path, {**analysis, 'path': relative_path, 'type': category, 'hash': content,
+                                           'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+        await asyncio.gather(*(run(batch) for batch in batches))
+        live = {path for path, category in files.items() if category != 'ignore'}
+        removed = [path for path in self.mirrored() if path not in live]
+        for relative_path in removed:
+            self.remove(relative_path)
+        return {'analyzed': len(stale) - failed, 'failed': failed, 'batches': len(batches), 'removed': len(removed)}
+
+    # Queries. The first one loads every record into memory, later ones are answered from there.
+
+    def all(self) -> dict[str, dict]:
+        if self.records is None:
+            records = {}
+            for relative_path in self.mirrored():
+                record = self.load(relative_path)
+                if record is not None:
+                    records[relative_path] = record
+            self.records = records
+        return self.records
+
+    def get(self, relative_path: str) -> dict | None:
+        return self.all().get(relative_path)
+
+    def summary(self, relative_path: str) -> str | None:
+        record = self.get(relative_path)
+        return record.get('summary') if record else None
+
+    def files(self, category: str | None = None) -> list[str]:
+        return sorted(path for path, record in self.all().items() if category is None or record.get('type') == category)
+
+    def defining(self, symbol: str) -> list[str]:
+        """Files with a definition named symbol."""
+        return sorted(path for path, record in self.all().items()
+                      if any(definition.get('name') == symbol for definition in record.get('definitions', ())))
+
+    def search(self, text: str) -> list[str]:
+        """Files whose path, summary, definitions or key points mention text, case insensitive."""
+        text = text.lower()
+        def mentions(path: str, record: dict) -> bool:
+            fields = [path, record.get('summary', ''), record.get('context', '')] + list(record.get('key_points', ()))
+            fields += [f"{d.get('name', '')} {d.get('summary', '')}" for d in record.get('definitions', ())]
+            return any(text in str(field).lower() for field in fields)
+        return sorted(path for path, record in self.all().items() if mentions(path, record))
+
+    def overview(self, category: str | None = None) -> str:
+        """One line per file: path, type and summary."""
+        return "\n".join(f"{path} ({self.all()[path].get('type')}): {self.all()[path].get('summary', '')}" for path in self.files(category))
@@ -0,0 +1,274 @@
+import ast
+import json
+import logging
+import os
+from typing import Callable
+
+# A parser turns (source, path) into a file entry:
+#   definitions: [[qualified name, kind, first line, last line, signature, first docstring line]]
+#   references: names used, imports: [[module, name or None, alias or None]], calls: [[caller, callee]]
+# The caller of module level code is "<module>".
+Parser = Callable[[str, str], dict]
+
+PARSERS: dict[str, Parser] = {}
+
+
+def register_parser(extension: str, parser: Parser):
+    """Index files with extension using parser. Python is built in, other languages plug in here."""
+    PARSERS[extension] = parser
+
+
+class PythonVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.scope: list[str] = []
+        # 'class' or 'function' for each entry of scope.
+        self.kinds: list[str] = []
+        self.functions: list[str] = []
+        self.definitions: list[list] = []
+        self.references: set[str] = set()
+        self.imports: list[list] = []
+        self.calls: set[tuple[str, str]] = set()
+
+    def qualify(self, name: str) -> str:
+        return ".".join(self.scope + [name])
+
+    def define(self, node: ast.AST, name: str, kind: str, signature: str = "", doc: str = ""):
+        self.definitions.append([self.qualify(name), kind, node.lineno, getattr(node, 'end_lineno', node.lineno), signature, doc])
+
+    def visit_function(self, node: ast.FunctionDef | ast.AsyncFunctionDef):
+        kind = 'method' if self.kinds and self.kinds[-1] == 'class' else 'function'
+        prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        self.define(node, node.name, kind, f"{prefix} {node.name}({ast.unparse(node.args)}){returns}", first_line(ast.get_docstring(node)))
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.enter(node.name, 'function', node.body + node.args.defaults + node.args.kw_defaults)
+
+    visit_FunctionDef = visit_function
+    visit_AsyncFunctionDef = visit_function
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        self.define(node, node.name, 'class', f"class {node.name}({bases})" if bases else f"class {node.name}", first_line(ast.get_docstring(node)))
+        for expression in node.bases + node.decorator_list:
+            self.visit(expression)
+        self.enter(node.name, 'class', node.body)
+
+    def enter(self, name: str, kind: str, body: list):
+        self.scope.append(name)
+        self.kinds.append(kind)
+        if kind == 'function':
+            self.functions.append(".".join(self.scope))
+        for child in body:
+            if child is not None:
+                self.visit(child)
+        if kind == 'function':
+            self.functions.pop()
+        self.kinds.pop()
+        self.scope.pop()
+
+    def visit_Assign(self, node: ast.Assign | ast.AnnAssign):
+        if not self.functions:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    self.define(node, target.id, 'variable')
+        self.generic_visit(node)
+
+    visit_AnnAssign = visit_Assign
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.imports.append([alias.name, None, alias.asname])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.imports.append([module, alias.name, alias.asname])
+
+    def visit_Name(self, node: ast.Name):
+        self.references.add(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self.references.add(node.attr)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        function = node.func
+        callee = function.id if isinstance(function, ast.Name) else function.attr if isinstance(function, ast.Attribute) else None
+        if callee is not None:
+            self.calls.add((self.functions[-1] if self.functions else '<module>', callee))
+        self.generic_visit(node)
+
+
+def first_line(doc: str | None) -> str:
+    return doc.strip().split("\n", 1)[0] if doc else ""
+
+
+def parse_python(source: str, path: str) -> dict:
+    visitor = PythonVisitor()
+    visitor.visit(ast.parse(source, path))
+    return {'definitions': visitor.definitions, 'references': sorted(visitor.references),
+            'imports': visitor.imports, 'calls': sorted(visitor.calls)}
+
+
+register_parser('.py', parse_python)
+
+
+class SymbolIndex:
+    """
+    Definitions, references, imports and calls of every source file under root, with inverted indexes so each
+    lookup is a dict access. update re-parses only files whose size or mtime changed and patches the indexes
+    file by file. The per file entries are persisted to path (compact JSON, written atomically), the inverted
+    indexes are rebuilt from them on load.
+    """
+    def __init__(self, root: str, path: str | None = None):
+        self.root = root
+        self.path = path
+        self.files: dict[str, dict] = {}
+        # Last name component -> [(file, qualified name)], e.g. "run" -> [("a.py", "Chuck.run")]
+        self.by_name: dict[str, list[tuple[str, str]]] = {}
+        self.by_qualname: dict[str, list[tuple[str, int]]] = {}
+        self.referenced_in: dict[str, set[str]] = {}
+        self.importers: dict[str, set[str]] = {}
+        self.callers_of: dict[str, set[tuple[str, str]]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    files = json.load(file)
+            except (OSError, ValueError):
+                files = {}
+            for relative_path, entry in files.items():
+                self.add(relative_path, entry)
+
+    def add(self, relative_path: str, entry: dict):
+        self.files[relative_path] = entry
+        for i, (qualname, *_) in enumerate(entry['definitions']):
+            self.by_name.setdefault(qualname.rsplit(".", 1)[-1], []).append((relative_path, qualname))
+            self.by_qualname.setdefault(qualname, []).append((relative_path, i))
+        for name in entry['references']:
+            self.referenced_in.setdefault(name, set()).add(relative_path)
+        for module, _, _ in entry['imports']:
+            self.importers.setdefault(module, set()).add(relative_path)
+        for caller, callee in entry['calls']:
+            self.callers_of.setdefault(callee, set()).add((relative_path, caller))
+
+    def remove(self, relative_path: str):
+        entry = self.files.pop(relative_path, None)
+        if entry is None:
+            return
+        def discard(index: dict, key, value):
+            values = index.get(key)
+            if values is None:
+                return
+            if isinstance(values, set):
+                values.discard(value)
+            else:
+                values[:] = [v for v in values if v[0] != relative_path]
+            if not values:
+                del index[key]
+        for qualname, *_ in entry['definitions']:
+            discard(self.by_name, qualname.rsplit(".", 1)[-1], None)
+            discard(self.by_qualname, qualname, None)
+        for name in entry['references']:
+            discard(self.referenced_in, name, relative_path)
+        for module, _, _ in entry['imports']:
+            discard(self.importers, module, relative_path)
+        for caller, callee in entry['calls']:
+            discard(self.callers_of, callee, (relative_path, caller))
+
+    def update(self, paths: list[str]) -> int:
+        """
+        Bring the index up to date with paths (relative to root), skipping files no parser handles.
+        Files no longer in paths are dropped. Returns how many files were parsed.
+        """
+        parsed = 0
+        live = set()
+        for relative_path in paths:
+            parser = PARSERS.get(os.path.splitext(relative_path)[1])
+            if parser is None:
+                continue
+            live.add(relative_path)
+            full_path = os.path.join(self.root, relative_path)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            entry = self.files.get(relative_path)
+            if entry is not None and entry['stat'] == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            try:
+                with open(full_path, encoding='utf-8') as file:
+                    new_entry = parser(file.read(), relative_path)
+            except (OSError, UnicodeDecodeError, SyntaxError, ValueError) as e:
+                logging.warning("Could not index %s: %s", relative_path, e)
+                new_entry = {'definitions': [], 'references': [], 'imports': [], 'calls': []}
+            new_entry['stat'] = [stat.st_size, stat.st_mtime_ns]
+            self.remove(relative_path)
+            self.add(relative_path, new_entry)
+            parsed += 1
+        for relative_path in [path for path in self.files if path not in live]:
+            self.remove(relative_path)
+        if parsed:
+            self.save()
+        return parsed
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.files, file, separators=(',', ':'))
+        os.replace(temporary, self.path)
+
+    # Lookups.
+
+    def definition(self, relative_path: str, i: int) -> dict:
+        qualname, kind, line, end_line, signature, doc = self.files[relative_path]['definitions'][i]
+        return {'path': relative_path, 'name': qualname, 'kind': kind, 'line': line, 'end_line': end_line,
+                'signature': signature, 'doc': doc}
+
+    def find(self, name: str) -> list[dict]:
+        """Definitions of name, either qualified (Chuck.run) or just its last part (run)."""
+        if "." in name:
+            return [self.definition(path, i) for path, i in self.by_qualname.get(name, ())]
+        return [definition for path, qualname in dict.fromkeys(self.by_name.get(name, ())) for definition in self.find_qualified(path, qualname)]
+
+    def find_qualified(self, relative_path: str, qualname: str) -> list[dict]:
+        return [self.definition(path, i) for path, i in self.by_qualname.get(qualname, ()) if path == relative_path]
+
+    def references(self, name: str) -> list[str]:
+        """Files using name."""
+        return sorted(self.referenced_in.get(name.rsplit(".", 1)[-1], ()))
+
+    def callers(self, name: str) -> list[tuple[str, str]]:
+        """(file, caller) of every call to name. Calls are matched by the last part of the name only."""
+        return sorted(self.callers_of.get(name.rsplit(".", 1)[-1], ()))
+
+    def callees(self, relative_path: str, caller: str) -> list[str]:
+        """Names called from caller, a qualified function name or "<module>"."""
+        entry = self.files.get(relative_path)
+        return sorted({callee for c, callee in entry['calls'] if c == caller}) if entry else []
+
+    def imports(self, relative_path: str) -> list[tuple[str, str | None, str | None]]:
+        entry = self.files.get(relative_path)
+        return [tuple(i) for i in entry['imports']] if entry else []
+
+    def importers_of(self, module: str) -> list[str]:
+        return sorted(self.importers.get(module, ()))
+
+    def outline(self, relative_path: str) -> list[dict]:
+        entry = self.files.get(relative_path)
+        return [self.definition(relative_path, i) for i in range(len(entry['definitions']))] if entry else []
+
+    def source(self, name: str) -> list[str]:
+        """The source of each definition of name, so a prompt can carry just that symbol instead of its whole file."""
+        sources = []
+        for definition in self.find(name):
+            try:
+                with open(os.path.join(self.root, definition['path']), encoding='utf-8') as file:
+                    lines = file.read().split("\n")
+            except OSError:
+                continue
+            sources.append("\n".join(lines[definition['line'] - 1:definition['end_line']]))
+        return sources
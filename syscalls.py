@@ -0,0 +1,264 @@
+import json
+import logging
+from typing import AsyncIterator, Callable
+
+
+class Syscall:
+    """Declared shape of a syscall: its name and (arg name, type) pairs. Types are str or list."""
+    def __init__(self, name: str, *args: tuple[str, type]):
+        self.name = name
+        self.args = args
+
+    def signature(self) -> str:
+        return f"{self.name}({', '.join(f'{arg}: {t.__name__}' for arg, t in self.args)})"
+
+
+class SyscallCall:
+    def __init__(self, name: str, args: list, line: int, text: str):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.text = text
+
+    def __repr__(self):
+        return f"{self.name}({', '.join(json.dumps(a) for a in self.args)})"
+
+
+class SyscallError:
+    """A line that could not be turned into a call. column is 0 based."""
+    def __init__(self, line: int, column: int, text: str, message: str):
+        self.line = line
+        self.column = column
+        self.text = text
+        self.message = message
+
+    def __str__(self):
+        return f"line {self.line}, column {self.column}: {self.message}: {self.text}"
+
+
+class ParseFailure(Exception):
+    def __init__(self, column: int, message: str):
+        super().__init__(message)
+        self.column = column
+        self.message = message
+
+
+KERNEL_SYSCALLS: dict[str, Syscall] = {s.name: s for s in [
+    Syscall("__spawn_process", ("goal", str)),
+    Syscall("__kill_process", ("name", str)),
+    Syscall("__create_register", ("name", str), ("description", str)),
+    Syscall("__consolidate_registers", ("list_of_registers", list), ("new_register_name", str)),
+    Syscall("__delete_register", ("name", str)),
+    Syscall("__grant_register_lock", ("register_name", str), ("child", str)),
+    Syscall("__force_release_register_lock", ("register_name", str)),
+    Syscall("__send_message", ("name", str), ("message", str)),
+]}
+
+# Lines the model likes to wrap calls in, none of them are calls.
+IGNORED_LINES = {"", "```", "```python", "```json", "```text"}
+
+ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"', "'": "'"}
+
+
+class Parser:
+    """Single pass parser for one line: name(arg, ...) where args are quoted strings, bare words or [lists]."""
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def fail(self, message: str):
+        raise ParseFailure(self.pos, message)
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def expect(self, char: str):
+        self.skip_space()
+        if self.peek() != char:
+            self.fail(f"expected {char!r}, found {self.peek() or 'end of line'!r}")
+        self.pos += 1
+
+    def word(self) -> str:
+        start = self.pos
+        while self.pos < len(self.text) and (self.text[self.pos].isalnum() or self.text[self.pos] in "_-."):
+            self.pos += 1
+        if start == self.pos:
+            self.fail(f"unexpected {self.peek() or 'end of line'!r}")
+        return self.text[start:self.pos]
+
+    def string(self) -> str:
+        quote = self.text[self.pos]
+        self.pos += 1
+        out = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == "\\" and self.pos + 1 < len(self.text):
+                out.append(ESCAPES.get(self.text[self.pos + 1], self.text[self.pos + 1]))
+                self.pos += 2
+                continue
+            if char == quote:
+                self.pos += 1
+                return "".join(out)
+            out.append(char)
+            self.pos += 1
+        self.fail("unterminated string")
+
+    def value(self):
+        self.skip_space()
+        char = self.peek()
+        if char in ('"', "'"):
+            return self.string()
+        if char == "[":
+            self.pos += 1
+            return self.sequence("]")
+        return self.word()
+
+    def sequence(self, close: str) -> list:
+        values = []
+        self.skip_space()
+        if self.peek() == close:
+            self.pos += 1
+            return values
+        while True:
+            values.append(self.value())
+            self.skip_space()
+            if self.peek() == close:
+                self.pos += 1
+                return values
+            self.expect(",")
+
+    def call(self) -> tuple[str, list]:
+        self.skip_space()
+        name = self.word()
+        self.expect("(")
+        args = self.sequence(")")
+        self.skip_space()
+        if self.peek() == ";":
+            self.pos += 1
+            self.skip_space()
+        if self.pos < len(self.text):
+            self.fail("unexpected text after call")
+        return name, args
+
+
+def check(name: str, args: list, schema: dict[str, Syscall]) -> str | None:
+    """Problem with a call against the schema, or None if it's fine."""
+    syscall = schema.get(name)
+    if syscall is None:
+        return f"unknown syscall {name}"
+    if len(args) != len(syscall.args):
+        return f"{syscall.signature()} takes {len(syscall.args)} arguments, got {len(args)}"
+    for value, (arg, t) in zip(args, syscall.args):
+        if not isinstance(value, t) or (t is list and not all(isinstance(v, str) for v in value)):
+            return f"{arg} of {name} must be {t.__name__}"
+    return None
+
+
+def parse_line(text: str, line: int, schema: dict[str, Syscall] = KERNEL_SYSCALLS) -> SyscallCall | SyscallError | None:
+    stripped = text.strip()
+    if stripped in IGNORED_LINES:
+        return None
+    offset = len(text) - len(text.lstrip())
+    try:
+        name, args = Parser(stripped).call()
+    except ParseFailure as e:
+        return SyscallError(line, offset + e.column, stripped, e.message)
+    problem = check(name, args, schema)
+    if problem is not None:
+        return SyscallError(line, offset, stripped, problem)
+    return SyscallCall(name, args, line, stripped)
+
+
+def parse(text: str, schema: dict[str, Syscall] = KERNEL_SYSCALLS) -> tuple[list[SyscallCall], list[SyscallError]]:
+    """Parse one call per line. Returns the good calls and a precise error for every other non blank line."""
+    calls, errors = [], []
+    for number, line in enumerate(text.split("\n"), start=1):
+        parsed = parse_line(line, number, schema)
+        if isinstance(parsed, SyscallCall):
+            calls.append(parsed)
+        elif isinstance(parsed, SyscallError):
+            errors.append(parsed)
+    return calls, errors
+
+
+async def parse_stream(chunks: AsyncIterator[str], schema: dict[str, Syscall] = KERNEL_SYSCALLS) -> AsyncIterator[SyscallCall | SyscallError]:
+    """Parse streamed text, yielding each call (or error) as soon as its line is terminated."""
+    buffer = ""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            number += 1
+            parsed = parse_line(line, number, schema)
+            if parsed is not None:
+                yield parsed
+    parsed = parse_line(buffer, number + 1, schema)
+    if parsed is not None:
+        yield parsed
+
+
+def parse_json(text: str, schema: dict[str, Syscall] = KERNEL_SYSCALLS) -> tuple[list[SyscallCall], list[SyscallError]]:
+    """Parse structured output: a JSON list of {"name": ..., "args": [...]} objects."""
+    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError as e:
+        return [], [SyscallError(e.lineno, e.colno - 1, text, f"invalid JSON: {e.msg}")]
+    if isinstance(items, dict):
+        items = items.get("calls", [items])
+    if not isinstance(items, list):
+        return [], [SyscallError(1, 0, text, "expected a list of calls")]
+    calls, errors = [], []
+    for index, item in enumerate(items, start=1):
+        raw = json.dumps(item)
+        if not isinstance(item, dict) or not isinstance(item.get("name"), str):
+            errors.append(SyscallError(index, 0, raw, "expected an object with a name"))
+            continue
+        args = item.get("args", [])
+        if isinstance(args, dict):
+            syscall = schema.get(item["name"])
+            args = [args.get(arg) for arg, _ in syscall.args] if syscall else list(args.values())
+        if not isinstance(args, list):
+            errors.append(SyscallError(index, 0, raw, "args must be a list or an object"))
+            continue
+        problem = check(item["name"], args, schema)
+        if problem is not None:
+            errors.append(SyscallError(index, 0, raw, problem))
+            continue
+        calls.append(SyscallCall(item["name"], args, index, raw))
+    return calls, errors
+
+
+def json_instructions(schema: dict[str, Syscall]) -> str:
+    return ('Respond with a JSON list of calls, each {"name": <syscall name>, "args": [<arguments in order>]}, '
+            f'using these syscalls: {", ".join(s.signature() for s in schema.values())}')
+
+
+def subset(*names: str) -> dict[str, Syscall]:
+    return {name: KERNEL_SYSCALLS[name] for name in names}
+
+
+class DispatchTable:
+    """Maps syscall names straight to handlers. on_error is told about calls whose handler rejected them."""
+    def __init__(self, handlers: dict[str, Callable], on_error: Callable[[SyscallCall, Exception], None] | None = None):
+        self.handlers = handlers
+        self.on_error = on_error
+
+    def dispatch(self, call: SyscallCall) -> bool:
+        handler = self.handlers.get(call.name)
+        if handler is None:
+            logging.error("No handler for %s", call.name)
+            return False
+        try:
+            handler(*call.args)
+        except (KeyError, ValueError) as e:
+            logging.error("%r failed: %r", call, e)
+            if self.on_error is not None:
+                self.on_error(call, e)
+            return False
+        return True
@@ -0,0 +1,249 @@
+import asyncio
+import codecs
+import logging
+import os
+import secrets
+import signal
+import time
+from typing import AsyncIterator, Callable
+
+CHUNK = 4096
+SHELL = "/bin/sh"
+
+
+class CommandResult:
+    """exit_code is None when the command was killed for running past its timeout, or when it exited its session's shell."""
+    def __init__(self, command: str, exit_code: int | None, stdout: str, stderr: str, duration: float, truncated: bool, timed_out: bool):
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.truncated = truncated
+        self.timed_out = timed_out
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+    def to_dict(self) -> dict:
+        return {"command": self.command, "exit_code": self.exit_code, "stdout": self.stdout, "stderr": self.stderr,
+                "duration": round(self.duration, 3), "truncated": self.truncated, "timed_out": self.timed_out}
+
+    def __str__(self):
+        status = f"timed out after {self.duration:.1f}s" if self.timed_out else f"exit code {self.exit_code} in {self.duration:.1f}s"
+        if self.truncated:
+            status += ", output truncated"
+        text = f"$ {self.command}\n({status})\n{self.stdout}"
+        if self.stderr:
+            text += f"\nstderr:\n{self.stderr}"
+        return text
+
+
+class Output:
+    """Collects one stream of a command, keeping at most cap bytes and passing every chunk on to on_output."""
+    def __init__(self, name: str, cap: int, on_output: Callable[[str, str], None] | None):
+        self.name = name
+        self.cap = cap
+        self.on_output = on_output
+        self.parts: list[bytes] = []
+        self.size = 0
+        self.truncated = False
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        if self.on_output is not None:
+            text = self.decoder.decode(data)
+            if text:
+                self.on_output(self.name, text)
+        room = self.cap - self.size
+        if len(data) > room:
+            self.truncated = True
+            data = data[:max(room, 0)]
+        self.parts.append(data)
+        self.size += len(data)
+
+    def text(self) -> str:
+        return b"".join(self.parts).decode("utf-8", errors="replace")
+
+
+async def pump(stream: asyncio.StreamReader, output: Output, marker: bytes | None = None) -> bytes | None:
+    """
+    Feed stream into output until EOF, or until marker when given. Returns whatever followed the marker
+    in the last chunk, or None at EOF. The tail of each chunk is held back in case it starts the marker.
+    """
+    pending = b""
+    while True:
+        chunk = await stream.read(CHUNK)
+        if not chunk:
+            output.feed(pending)
+            return None
+        pending += chunk
+        if marker is not None:
+            index = pending.find(marker)
+            if index >= 0:
+                output.feed(pending[:index])
+                return pending[index + len(marker):]
+        keep = len(marker) - 1 if marker else 0
+        output.feed(pending[:len(pending) - keep])
+        pending = pending[len(pending) - keep:]
+
+
+def kill(process: asyncio.subprocess.Process):
+    """Kill the command and anything it started, they share its process group."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class Shell:
+    """
+    A long lived shell for one session, so commands don't pay shell startup and keep cwd and variables between calls.
+    Commands run one at a time. Each is followed by a unique marker carrying the exit code, so output is split
+    without waiting for EOF. A command that times out takes the shell down with it, the next one gets a new shell.
+    """
+    def __init__(self, session: str, cwd: str | None, env: dict[str, str] | None, reaping: set[asyncio.Task]):
+        self.session = session
+        self.cwd = cwd
+        self.env = env
+        self.reaping = reaping
+        self.process: asyncio.subprocess.Process | None = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(SHELL, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE, cwd=self.cwd, env=self.env,
+                                                            start_new_session=True)
+        logging.debug("Started shell %d for %s", self.process.pid, self.session)
+
+    async def run(self, command: str, stdout: Output, stderr: Output) -> int | None:
+        async with self.lock:
+            if self.process is None or self.process.returncode is not None:
+                await self.start()
+            token = f"__END_{secrets.token_hex(8)}__"
+            # Braces rather than a subshell so cd and variables stick, stdin closed so the command can't eat the markers.
+            self.process.stdin.write(f"{{ {command}\n}} </dev/null\nprintf '\\n{token} %d\\n' $?\nprintf '{token}\\n' >&2\n".encode())
+            try:
+                await self.process.stdin.drain()
+                rest, _ = await asyncio.gather(pump(self.process.stdout, stdout, f"\n{token} ".encode()),
+                                               pump(self.process.stderr, stderr, f"{token}\n".encode()))
+                while rest is not None and b"\n" not in rest:
+                    more = await self.process.stdout.read(CHUNK)
+                    if not more:
+                        break
+                    rest += more
+            except (asyncio.CancelledError, ConnectionError):
+                self.close()
+                raise
+            if rest is None:
+                # The command ended the shell, e.g. with exit.
+                self.process = None
+                return None
+            return int(rest.split(b"\n", 1)[0])
+
+    def close(self):
+        if self.process is not None and self.process.returncode is None:
+            kill(self.process)
+            # Its pipes stay open until it has been waited for, the wait goes in reaping.
+            task = asyncio.ensure_future(self.process.wait())
+            self.reaping.add(task)
+            task.add_done_callback(self.reaping.discard)
+        self.process = None
+
+
+class TerminalPool:
+    """
+    Runs shell commands as asyncio subprocesses so they never block the event loop.
+    At most max_concurrency commands run at once, each is killed (with its process group) after timeout seconds,
+    and at most max_output bytes of each stream are kept. Output can be followed live through on_output.
+    Commands with a session run in that session's persistent Shell, others in a fresh shell each.
+    Closed sessions are killed at once and reaped in the background, wait_closed waits for them.
+    """
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 timeout: float | None = 30.0,
+                 max_output: int = 64 * 1024,
+                 cwd: str | None = None,
+                 env: dict[str, str] | None = None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_output = max_output
+        self.cwd = cwd
+        self.env = env
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.shells: dict[str, Shell] = {}
+        self.reaping: set[asyncio.Task] = set()
+
+    async def run(self,
+                  command: str,
+                  timeout: float | None = None,
+                  session: str | None = None,
+                  on_output: Callable[[str, str], None] | None = None) -> CommandResult:
+        timeout = timeout or self.timeout
+        stdout = Output("stdout", self.max_output, on_output)
+        stderr = Output("stderr", self.max_output, on_output)
+        async with self.slots:
+            start = time.monotonic()
+            timed_out = False
+            if session is not None:
+                shell = self.shells.get(session)
+                if shell is None:
+                    shell = self.shells[session] = Shell(session, self.cwd, self.env, self.reaping)
+                try:
+                    exit_code = await asyncio.wait_for(shell.run(command, stdout, stderr), timeout)
+                except asyncio.TimeoutError:
+                    exit_code, timed_out = None, True
+            else:
+                process = await asyncio.create_subprocess_shell(command, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                                                                stderr=asyncio.subprocess.PIPE, cwd=self.cwd, env=self.env,
+                                                                start_new_session=True)
+                try:
+                    await asyncio.wait_for(asyncio.gather(pump(process.stdout, stdout), pump(process.stderr, stderr)), timeout)
+                    exit_code = await process.wait()
+                except asyncio.TimeoutError:
+                    exit_code, timed_out = None, True
+                finally:
+                    if process.returncode is None:
+                        kill(process)
+                        await process.wait()
+            duration = time.monotonic() - start
+        if timed_out:
+            logging.warning("Command timed out after %ss: %s", timeout, command)
+        return CommandResult(command, exit_code, stdout.text(), stderr.text(), duration, stdout.truncated or stderr.truncated, timed_out)
+
+    async def stream(self, command: str, timeout: float | None = None, session: str | None = None) -> AsyncIterator[tuple[str, str] | CommandResult]:
+        """Yield (stream name, text) chunks as the command writes them, then its CommandResult."""
+        chunks: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.run(command, timeout, session, lambda name, text: chunks.put_nowait((name, text))))
+        task.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            yield task.result()
+        finally:
+            task.cancel()
+
+    def end_session(self, session: str):
+        shell = self.shells.pop(session, None)
+        if shell is not None:
+            shell.close()
+
+    def close(self):
+        for session in list(self.shells):
+            self.end_session(session)
+
+    async def wait_closed(self):
+        await asyncio.gather(*self.reaping)
+
+
+def add_terminal_arguments(parser):
+    parser.add_argument('--terminal-concurrency', type=int, default=4, help='Shell commands allowed to run at once')
+    parser.add_argument('--command-timeout', type=float, default=30.0, help='Seconds before a shell command is killed')
+    parser.add_argument('--max-output', type=int, default=64 * 1024, help='Bytes of stdout and stderr kept per command')
+
+
+def pool_from_args(args) -> TerminalPool:
+    return TerminalPool(max_concurrency=args.terminal_concurrency, timeout=args.command_timeout, max_output=args.max_output)
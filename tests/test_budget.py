@@ -0,0 +1,64 @@
+import pytest
+
+import budget
+
+
+def test_count_tokens_charges_per_four_characters_and_punctuation():
+    assert budget.count_tokens("") == 0
+    assert budget.count_tokens("abcd abcde") == 3
+    assert budget.count_tokens("f(x);") == 5
+
+
+def test_short_text_is_left_alone():
+    assert budget.truncate("short", 10) == "short"
+
+
+@pytest.mark.parametrize("policy", ["head", "tail", "middle"])
+def test_truncate_fits_the_budget(policy):
+    text = " ".join(f"word{i}" for i in range(500))
+    cut = budget.truncate(text, 100, policy)
+    assert budget.count_tokens(cut) <= 100
+    assert "tokens truncated" in cut
+
+
+def test_truncate_keeps_the_right_end():
+    text = " ".join(f"word{i}" for i in range(500))
+    assert budget.truncate(text, 100, "head").startswith("word0 ")
+    assert budget.truncate(text, 100, "tail").endswith(" word499")
+    middle = budget.truncate(text, 100, "middle")
+    assert middle.startswith("word0 ") and middle.endswith(" word499")
+
+
+def test_under_budget_renders_sections_in_order():
+    prompt = budget.ContextBudget(1000).add("one", label="A: ").add("two", priority=5, label=" B: ").render()
+    assert prompt == "A: one B: two"
+
+
+def test_least_important_section_is_cut_first():
+    important = "keep " * 50
+    extra = "spare " * 200
+    context = budget.ContextBudget(150).add(important, priority=0).add(extra, priority=1, policy="tail")
+    texts = context.fit()
+    assert texts[0] == important
+    assert budget.count_tokens(texts[1]) < budget.count_tokens(extra)
+    assert budget.count_tokens(context.render()) <= 150
+
+
+def test_drop_and_summarize_policies():
+    big = "detail " * 300
+    texts = (budget.ContextBudget(100)
+             .add("goal", priority=0)
+             .add(big, priority=2, policy="drop")
+             .add(big, priority=1, policy="summarize", summary="in short")
+             .fit())
+    assert texts == ["goal", "", "in short"]
+
+
+def test_budget_never_exceeds_the_model_ceiling():
+    context = budget.ContextBudget(10_000_000, "gemini-1.0-pro")
+    assert context.max_tokens == budget.MODEL_CEILINGS["gemini-1.0-pro"] - budget.OUTPUT_RESERVE
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        budget.ContextBudget().add("text", policy="shuffle")
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from cache import ResponseCache
+
+
+def test_identical_prompts_in_flight_share_one_call():
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        cache = ResponseCache()
+        results = await asyncio.gather(*(cache.fetch("model", None, "prompt", call) for _ in range(5)))
+        assert results == ["answer"] * 5
+        assert await cache.fetch("model", None, "prompt", call) == "answer"
+        assert not cache.in_flight
+        return cache
+    cache = asyncio.run(main())
+    assert calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_different_configs_are_different_entries():
+    async def main():
+        cache = ResponseCache()
+        first = await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "plain"))
+        second = await cache.fetch("model", {"temperature": 0}, "prompt", lambda: asyncio.sleep(0, "cold"))
+        return first, second
+    assert asyncio.run(main()) == ("plain", "cold")
+
+
+def test_fresh_bypasses_the_cache():
+    async def main():
+        cache = ResponseCache()
+        await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "old"))
+        assert await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "new"), fresh=True) == "new"
+        assert await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "unused")) == "new"
+    asyncio.run(main())
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        cache = ResponseCache()
+        results = await asyncio.gather(*(cache.fetch("model", None, "prompt", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not cache.in_flight
+        assert await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "ok")) == "ok"
+    asyncio.run(main())
+
+
+def test_cancelling_the_caller_frees_the_key():
+    async def main():
+        cache = ResponseCache()
+        running = asyncio.Event()
+
+        async def slow():
+            running.set()
+            await asyncio.sleep(10)
+            return "late"
+
+        owner = asyncio.ensure_future(cache.fetch("model", None, "prompt", slow))
+        await running.wait()
+        follower = asyncio.ensure_future(cache.fetch("model", None, "prompt", slow))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        assert not cache.in_flight
+        assert await cache.fetch("model", None, "prompt", lambda: asyncio.sleep(0, "again")) == "again"
+    asyncio.run(main())
+
+
+def test_cancelled_follower_does_not_cancel_the_call():
+    async def main():
+        cache = ResponseCache()
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        owner = asyncio.ensure_future(cache.fetch("model", None, "prompt", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.fetch("model", None, "prompt", slow))
+        await asyncio.sleep(0)
+        follower.cancel()
+        assert await owner == "answer"
+    asyncio.run(main())
+
+
+def test_lru_and_ttl(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl=5)
+    now = 1000.0
+    monkeypatch.setattr("cache.time.time", lambda: now)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    now += 6
+    assert cache.get("a") is None
+
+
+def test_sqlite_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path=path)
+    cache.put("key", "value")
+    cache.close()
+    reopened = ResponseCache(path=path)
+    assert reopened.get("key") == "value"
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
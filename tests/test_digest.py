@@ -0,0 +1,69 @@
+import asyncio
+
+import digest
+
+
+class Summarizer:
+    """Summarizes anything as "summary N", counting the calls."""
+    def __init__(self):
+        self.prompts: list[str] = []
+
+    async def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+
+def document(blocks: int, change: int | None = None) -> str:
+    return "\n\n".join(f"def function_{i}():\n    return {'changed' if i == change else i}" for i in range(blocks))
+
+
+def test_terms_split_identifiers():
+    assert digest.terms("parseHTTPResponse snake_case") == ["parsehttpresponse", "parse", "http", "response", "snake_case", "snake", "case"]
+
+
+def test_chunks_follow_top_level_blocks():
+    text = document(6)
+    chunks = digest.chunk(text, max_tokens=12)
+    assert len(chunks) == 6
+    assert chunks[1].startswith("def function_1")
+    assert "\n".join(chunks) == text
+
+
+def test_update_builds_a_tree_and_renders_the_root_first():
+    summarizer = Summarizer()
+    tree = digest.Digest(summarizer, chunk_tokens=12, fanout=2)
+    assert asyncio.run(tree.update(document(4))) == 4 + 2 + 1
+    assert tree.ready
+    assert [len(level) for level in tree.levels] == [4, 2, 1]
+    assert tree.render().startswith("Overview: summary 7\nSections:\n[1] summary")
+
+
+def test_only_changed_chunks_and_their_parents_are_summarized_again():
+    summarizer = Summarizer()
+    tree = digest.Digest(summarizer, chunk_tokens=12, fanout=2)
+    asyncio.run(tree.update(document(4)))
+    assert asyncio.run(tree.update(document(4))) == 0
+    assert asyncio.run(tree.update(document(4, change=3))) == 3
+
+
+def test_unready_digest_falls_back_to_the_text():
+    tree = digest.Digest(Summarizer(), max_tokens=20)
+    tree.index(document(40))
+    rendered = tree.render()
+    assert rendered.startswith("def func") and rendered.endswith("39")
+    assert "tokens truncated" in rendered
+
+
+def test_summaries_persist_between_runs(tmp_path):
+    path = str(tmp_path / "digest.json")
+    asyncio.run(digest.Digest(Summarizer(), chunk_tokens=12, path=path).update(document(3)))
+    summarizer = Summarizer()
+    assert asyncio.run(digest.Digest(summarizer, chunk_tokens=12, path=path).update(document(3))) == 0
+    assert summarizer.prompts == []
+
+
+def test_relevant_picks_chunks_sharing_terms():
+    tree = digest.Digest(Summarizer(), chunk_tokens=12)
+    tree.index(document(5))
+    assert tree.relevant("function_3", k=1) == ["def function_3():\n    return 3\n"]
+    assert tree.relevant("unrelated") == []
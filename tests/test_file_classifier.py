@@ -0,0 +1,75 @@
+import os
+import subprocess
+
+from src import file_classifier
+
+
+def write(root, relative: str, content: bytes | str):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(content, str):
+        content = content.encode()
+    path.write_bytes(content)
+    return path
+
+
+def test_categorize_by_name_and_content(tmp_path):
+    assert file_classifier.categorize(str(write(tmp_path, "a.py", "x = 1"))) == "code"
+    assert file_classifier.categorize(str(write(tmp_path, "run", "#!/bin/sh\necho"))) == "code"
+    assert file_classifier.categorize(str(write(tmp_path, "Makefile", "all:"))) == "code"
+    assert file_classifier.categorize(str(write(tmp_path, "c.yaml", "a: 1"))) == "data"
+    assert file_classifier.categorize(str(write(tmp_path, "notes.md", "# notes"))) == "knowledge"
+    assert file_classifier.categorize(str(write(tmp_path, "blob.py", b"\x00\x01"))) == "ignore"
+    assert file_classifier.categorize(str(write(tmp_path, "latin.txt", "café au lait".encode("latin-1")))) == "ignore"
+
+
+def test_sniff_accepts_a_character_cut_at_the_head(tmp_path):
+    path = write(tmp_path, "cut.txt", b"a" * (file_classifier.SNIFF_BYTES - 1) + "é".encode())
+    assert file_classifier.is_text_file(str(path))
+
+
+def test_ignore_matcher_handles_files_and_directories():
+    matcher = file_classifier.IgnoreMatcher(["build/", "docs/out/", "secret.txt"])
+    assert matcher.matches("build/lib/a.py")
+    assert matcher.matches("docs/out/index.html")
+    assert not matcher.matches("docs/index.md")
+    assert matcher.matches("secret.txt")
+    assert not matcher.matches("src/secret.txt")
+
+
+def test_scan_skips_ignored_directories(tmp_path):
+    write(tmp_path, "src/a.py", "x = 1")
+    write(tmp_path, "node_modules/lib/b.js", "x")
+    write(tmp_path, "build/out.py", "x")
+    write(tmp_path, ".gitignore", "build/\n")
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    categories = file_classifier.Scanner(str(tmp_path)).scan()
+    assert categories["src/a.py"] == "code"
+    assert categories["node_modules/"] == "ignore"
+    assert categories["build/"] == "ignore"
+    assert not any(path.startswith(("node_modules/", "build/", ".git/")) and path.count("/") > 1 for path in categories)
+
+
+def test_rescan_only_reads_changed_files(tmp_path):
+    root = tmp_path / "repo"
+    write(root, "a.py", "x = 1")
+    write(root, "b.md", "notes")
+    cache_path = str(tmp_path / "cache.json")
+    file_classifier.Scanner(str(root), cache_path).scan()
+    scanner = file_classifier.Scanner(str(root), cache_path)
+    scanner.scan()
+    assert scanner.inspected == 0
+    write(root, "b.md", b"\x00binary now")
+    os.utime(root / "b.md", ns=(1, 1))
+    categories = scanner.scan()
+    assert categories["b.md"] == "ignore"
+    assert scanner.inspected == 1
+
+
+def test_model_files_leave_out_the_mirror(tmp_path):
+    write(tmp_path, "a.py", "x = 1")
+    write(tmp_path, "mirror/a.py.json", "{}")
+    scanner = file_classifier.Scanner(str(tmp_path))
+    files = file_classifier.model_files(scanner, str(tmp_path / "mirror"))
+    assert file_classifier.code_paths(files) == ["a.py"]
+    assert "mirror/a.py.json" not in files
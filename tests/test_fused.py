@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import attempt1
+import backends
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(respond):
+        stub = backends.StubBackend(responses=respond)
+        monkeypatch.setattr(backends, "_backend", stub)
+        return stub
+    monkeypatch.setattr(attempt1.LLM, "response_cache", None)
+    return install
+
+
+def is_fused(prompt: str) -> bool:
+    return f"Finish with a line containing only {attempt1.Chuck.FUSED_END}" in prompt
+
+
+def test_fused_tick_is_one_call_dispatched_in_syscall_order(backend):
+    stub = backend(lambda prompt: '__consolidate_registers(["a", "b"], "merged")\n__create_register("b", "second")\nEND')
+    chuck = attempt1.Chuck(goal="test", fused=True)
+    chuck._Chuck__create_register("a", "first")
+    asyncio.run(chuck.chuck_lifecycle())
+    assert stub.calls == 1
+    # The create is listed second but runs before the consolidate that needs it.
+    assert list(chuck.memory) == ["merged"]
+
+
+def test_fused_prompt_carries_every_option_set(backend):
+    chuck = attempt1.Chuck(goal="test", fused=True)
+    prompt = chuck.fused_prompt()
+    for options in (chuck.CHILD_OPTIONS, chuck.REGISTER_OPTIONS, chuck.COMMUNICATION_OPTIONS):
+        assert options in prompt
+    assert prompt.count("GOAL: ") == 1
+
+
+def test_missing_end_falls_back_to_three_phases(backend):
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt)
+        return '__create_register("fused", "skipped")' if is_fused(prompt) else ""
+    backend(respond)
+    chuck = attempt1.Chuck(goal="test", fused=True)
+    asyncio.run(chuck.chuck_lifecycle())
+    assert [is_fused(prompt) for prompt in prompts] == [True, False, False, False]
+    assert chuck.memory == {}
+
+
+def test_unfused_tick_runs_three_phases(backend):
+    stub = backend(lambda prompt: "")
+    asyncio.run(attempt1.Chuck(goal="test").chuck_lifecycle())
+    assert stub.calls == 3
@@ -0,0 +1,93 @@
+import asyncio
+
+import hedging
+import scheduler
+
+
+class Backend:
+    """Counts calls in flight, the first call of each prompt is slow."""
+    def __init__(self, slow: float = 0.05, fast: float = 0.001):
+        self.slow = slow
+        self.fast = fast
+        self.active = 0
+        self.peak = 0
+        self.seen: set[int] = set()
+
+    async def call(self, prompt: int) -> str:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            first = prompt not in self.seen
+            self.seen.add(prompt)
+            await asyncio.sleep(self.slow if first else self.fast)
+            return f"answer {prompt}"
+        finally:
+            self.active -= 1
+
+
+def warmed_hedger() -> hedging.Hedger:
+    hedger = hedging.Hedger(percentile=0.5, budget=1.0, min_samples=1)
+    hedger.tracker.record("model", 0.005)
+    return hedger
+
+
+def test_slow_call_is_hedged_and_the_duplicate_wins():
+    backend = Backend()
+    hedger = warmed_hedger()
+
+    async def main():
+        return await hedger.run("model", lambda: backend.call(1))
+    assert asyncio.run(main()) == "answer 1"
+    assert hedger.hedges == 1
+    assert hedger.hedge_wins == 1
+
+
+def test_no_hedging_before_min_samples():
+    backend = Backend()
+    hedger = hedging.Hedger(percentile=0.5, budget=1.0, min_samples=5)
+
+    async def main():
+        return await hedger.run("model", lambda: backend.call(1))
+    asyncio.run(main())
+    assert hedger.hedges == 0
+
+
+def test_hedges_stay_within_the_budget():
+    hedger = warmed_hedger()
+    hedger.budget = 0.5
+    backend = Backend()
+
+    async def main():
+        for prompt in range(4):
+            await hedger.run("model", lambda prompt=prompt: backend.call(prompt))
+    asyncio.run(main())
+    assert hedger.hedges == 2
+
+
+def test_hedges_take_their_own_scheduler_slot():
+    backend = Backend()
+    hedger = warmed_hedger()
+    limits = scheduler.Scheduler(max_concurrency=2, max_retries=0)
+
+    async def prompt(number: int) -> str:
+        call = lambda: backend.call(number)
+        return await limits.run(lambda: hedger.run("model", call, lambda hedge: limits.attempt(hedge)))
+
+    async def main():
+        return await asyncio.gather(*(prompt(number) for number in range(4)))
+    assert asyncio.run(main()) == [f"answer {number}" for number in range(4)]
+    assert backend.peak <= 2
+    assert limits.active == 0
+
+
+def test_hedges_take_from_the_request_bucket():
+    hedger = warmed_hedger()
+    limits = scheduler.Scheduler(max_concurrency=4, requests_per_minute=60, max_retries=0)
+    backend = Backend()
+
+    async def main():
+        call = lambda: backend.call(1)
+        await limits.run(lambda: hedger.run("model", call, lambda hedge: limits.attempt(hedge)))
+    asyncio.run(main())
+    assert hedger.hedges == 1
+    assert limits.request_bucket.tokens < limits.request_bucket.capacity - 1.5
@@ -0,0 +1,88 @@
+import asyncio
+import marshal
+import pickle
+
+import cache
+import ipc
+import metrics
+
+
+def test_response_cache_reaches_workers_as_its_settings(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    coordinator = cache.ResponseCache(max_entries=7, ttl=30, path=path)
+    coordinator.put("key", "value")
+    worker = pickle.loads(pickle.dumps(coordinator))
+    assert (worker.max_entries, worker.ttl, worker.path) == (7, 30, path)
+    assert worker.entries == {}
+    assert worker.get("key") == "value"
+    coordinator.close()
+    worker.close()
+
+
+def test_worker_metrics_merge_into_the_coordinator():
+    worker = metrics.Metrics()
+    with worker.span("llm_call", model="m") as span:
+        span.add(prompt_tokens=10)
+    worker.count("syscalls_total", syscall="spawn")
+    coordinator = metrics.Metrics()
+    coordinator.count("syscalls_total", syscall="spawn")
+    coordinator.merge(marshal.loads(marshal.dumps(worker.drain())))
+    snapshot = coordinator.snapshot()
+    assert snapshot["counters"]["syscalls_total"] == [{"labels": {"syscall": "spawn"}, "value": 2}]
+    assert snapshot["counters"]["llm_call_prompt_tokens_total"][0]["value"] == 10
+    assert snapshot["histograms"]["llm_call_seconds"][0]["count"] == 1
+    assert len(snapshot["spans"]) == 1
+    assert worker.snapshot()["counters"] == {}
+
+
+async def echo_serve(path: str, index: int):
+    stopped = asyncio.Event()
+
+    def handle(connection, frame):
+        if frame[0] == "shutdown":
+            stopped.set()
+            return None
+        return [index, *frame[1:]]
+    connection = await ipc.connect(path, index, handle)
+    serving = asyncio.ensure_future(connection.serve())
+    await stopped.wait()
+    serving.cancel()
+    connection.close()
+
+
+def echo_worker(path: str, index: int):
+    """Answers every call with its worker index and arguments, until shutdown."""
+    asyncio.run(echo_serve(path, index))
+
+
+def test_frames_round_trip():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(ipc.encode(("tell", "Ariel", [1, 2.5], {"a": None})))
+        reader.feed_eof()
+        return await ipc.read_frame(reader), await ipc.read_frame(reader)
+    assert asyncio.run(main()) == (("tell", "Ariel", [1, 2.5], {"a": None}), None)
+
+
+def test_placement_strategies():
+    assert ipc.place("least-loaded", "a", [2, 0, 1], 0) == 1
+    assert [ipc.place("round-robin", "a", [0, 0, 0], counter) for counter in range(4)] == [0, 1, 2, 0]
+    assert ipc.place("hash", "Ariel", [0, 0, 0], 0) == ipc.place("hash", "Ariel", [5, 5, 0], 7)
+
+
+def test_pool_pins_names_and_balances_load():
+    pool = ipc.WorkerPool(2, echo_worker)
+    assert [pool.place(name) for name in ("a", "b", "c", "a")] == [0, 1, 0, 0]
+    pool.forget("a")
+    assert pool.load == [1, 1]
+
+
+def test_pool_calls_every_worker():
+    async def main():
+        pool = ipc.WorkerPool(2, echo_worker, start_timeout=60)
+        await pool.start()
+        try:
+            return sorted(await pool.gather("echo", "hi"))
+        finally:
+            await pool.stop()
+    assert asyncio.run(main()) == [[0, "hi"], [1, "hi"]]
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+import attempt2
+import backends
+import scheduler
+
+
+def respond(prompt: str) -> str:
+    if "decide if we need more angels" in prompt:
+        return json.dumps([{"name": "Ariel", "goal": "write tests"}])
+    return "fine"
+
+
+@pytest.fixture(autouse=True)
+def llm(monkeypatch):
+    monkeypatch.setattr(backends, "_backend", backends.StubBackend(responses=respond))
+    monkeypatch.setattr(attempt2.LLM, "task_scheduler", scheduler.Scheduler(max_retries=0))
+    monkeypatch.setattr(attempt2.LLM, "response_cache", None)
+    monkeypatch.setattr(attempt2.LLM, "hedger", None)
+
+
+def make_kernel(mode: str = "manual") -> attempt2.Kernel:
+    return attempt2.Kernel(goal="ship it", global_info="info", chuck=attempt2.Chuck(), mode=mode)
+
+
+def test_manual_kernel_runs_only_the_steps_it_is_given():
+    kernel = make_kernel()
+
+    async def ticks(steps: int):
+        kernel.control(f"step {steps}")
+        target = kernel.ticks + steps
+        while kernel.ticks < target:
+            await asyncio.sleep(0.01)
+        # Give the last tick's reviews time to land, no further tick may start.
+        await asyncio.sleep(0.05)
+        assert kernel.ticks == target
+
+    async def main():
+        serving = asyncio.ensure_future(kernel.serve(stdin=False))
+        await ticks(2)
+        # Tick 0's review lands while tick 1's angels think, so Ariel exists but hasn't thought yet.
+        created = kernel.angels["Ariel"]
+        assert not created.thoughts
+        await ticks(1)
+        assert created.thoughts
+        assert kernel.control("quit") == "stopping after this tick"
+        await asyncio.wait_for(serving, 1)
+    asyncio.run(main())
+
+
+def test_pause_and_resume():
+    kernel = make_kernel(mode="fast")
+    assert not kernel.paused
+    assert kernel.control("pause") == "paused"
+    assert kernel.paused
+    assert kernel.control("resume") == "running"
+    assert not kernel.paused
+    assert make_kernel().control("resume") == "paused, use step"
+
+
+def test_inspect_lists_angels():
+    kernel = make_kernel()
+    assert kernel.control("inspect") == "No angels"
+    kernel.jack.create_angels([{"name": "Ariel", "goal": "write tests"}], kernel.angels)
+    kernel.angels.mark(["Ariel"])
+    assert kernel.control("inspect") == "Ariel (in danger): write tests"
+    assert kernel.control("inspect Nobody") == "No angel named Nobody"
+    assert kernel.control("inspect Ariel").endswith("Summary: ")
+
+
+def test_stats_and_unknown_commands():
+    kernel = make_kernel()
+    stats = json.loads(kernel.control("stats"))
+    assert (stats["ticks"], stats["angels"], stats["mode"], stats["paused"]) == (0, 0, "manual", True)
+    assert kernel.control("dance").startswith("Unknown command dance")
+    assert kernel.control("summary a.py") == "No mirror, start with --mirror-dir"
+    assert kernel.control("find Kernel") == "No symbol index, start with --symbols"
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        make_kernel(mode="slow")
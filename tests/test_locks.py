@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+import locks
+from locks import DeadlockError, LockManager
+
+
+def test_free_lock_is_granted_and_contended_lock_queues():
+    manager = LockManager("register")
+    assert manager.request("r", "a") == locks.GRANT
+    assert manager.request("r", "a") == locks.GRANT
+    assert manager.request("r", "b") == locks.ESCALATE
+    assert manager.holder("r") == "a"
+    assert [w.owner for w in manager.waiters["r"]] == ["b"]
+
+
+def test_waiters_get_the_lock_in_fifo_order():
+    granted = []
+    manager = LockManager("register", on_grant=lambda resource, owner: granted.append(owner))
+    manager.request("r", "a")
+    for owner in ("b", "c", "d"):
+        manager.request("r", owner)
+    for _ in range(3):
+        manager.release("r")
+    assert granted == ["a", "b", "c", "d"]
+    assert manager.holder("r") == "d"
+    assert "r" not in manager.waiters
+
+
+def test_release_by_someone_else_is_ignored():
+    manager = LockManager("register")
+    manager.request("r", "a")
+    manager.release("r", "b")
+    assert manager.holder("r") == "a"
+
+
+def test_acquire_waits_for_release():
+    async def main():
+        manager = LockManager("register")
+        assert await manager.acquire("r", "a")
+        waiting = asyncio.ensure_future(manager.acquire("r", "b"))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        manager.release("r", "a")
+        assert await waiting
+        assert manager.holder("r") == "b"
+    asyncio.run(main())
+
+
+def test_acquire_timeout_leaves_the_queue():
+    async def main():
+        manager = LockManager("register")
+        await manager.acquire("r", "a")
+        assert not await manager.acquire("r", "b", timeout=0.01)
+        assert not manager.waiters.get("r")
+        manager.release("r")
+        assert manager.holder("r") is None
+    asyncio.run(main())
+
+
+def test_expired_lease_goes_to_the_next_waiter(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    manager = LockManager("register", lease=10.0)
+    manager.request("r", "a")
+    manager.request("r", "b")
+    now += 11
+    manager.reap()
+    assert manager.holder("r") == "b"
+
+
+def test_lease_without_duration_never_expires(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    manager = LockManager("register", lease=None)
+    manager.request("r", "a")
+    now += 1e9
+    assert manager.holder("r") == "a"
+
+
+def test_wait_for_cycle_is_refused():
+    manager = LockManager("register")
+    manager.request("x", "a")
+    manager.request("y", "b")
+    assert manager.request("y", "a") == locks.ESCALATE
+    with pytest.raises(DeadlockError):
+        manager.request("x", "b")
+    assert [w.owner for w in manager.waiters.get("x", ())] == []
+
+
+def test_longer_cycle_is_refused():
+    manager = LockManager("register")
+    for resource, owner in (("x", "a"), ("y", "b"), ("z", "c")):
+        manager.request(resource, owner)
+    manager.request("y", "a")
+    manager.request("z", "b")
+    with pytest.raises(DeadlockError):
+        manager.request("x", "c")
+
+
+def test_grant_jumps_the_queue():
+    manager = LockManager("register", policy=lambda manager, resource, owner, reason: locks.ESCALATE)
+    assert manager.request("r", "a") == locks.ESCALATE
+    assert manager.request("r", "b") == locks.ESCALATE
+    manager.grant("r", "b")
+    assert manager.holder("r") == "b"
+    assert [w.owner for w in manager.waiters["r"]] == ["a"]
+    with pytest.raises(ValueError):
+        manager.grant("r", "a")
+    manager.release("r", "b")
+    assert manager.holder("r") == "a"
+
+
+def test_release_all():
+    manager = LockManager("register")
+    manager.request("x", "a")
+    manager.request("y", "b")
+    manager.request("y", "a")
+    manager.release_all("a")
+    assert manager.holder("x") is None
+    assert not manager.waiters.get("y")
+
+
+def test_discard_drops_holder_and_waiters_without_handover():
+    released = []
+    manager = LockManager("register", on_release=lambda resource, owner: released.append((resource, owner)))
+
+    async def main():
+        await manager.acquire("r", "a")
+        waiting = asyncio.ensure_future(manager.acquire("r", "b"))
+        await asyncio.sleep(0)
+        manager.discard("r")
+        assert await waiting is False
+    asyncio.run(main())
+    assert released == [("r", "a")]
+    assert manager.holder("r") is None
+    assert "r" not in manager.waiters
+    assert manager.request("r", "c") == locks.GRANT
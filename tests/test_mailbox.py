@@ -0,0 +1,18 @@
+import asyncio
+
+import attempt1
+
+
+def test_put_wakes_a_waiting_receiver_and_forgets_the_wake_up():
+    async def main():
+        box = attempt1.Mailbox("box", 2)
+        receiver = asyncio.ensure_future(box.receive(timeout=1))
+        await asyncio.sleep(0)
+        box.put_nowait(attempt1.Message("sender", "hello"))
+        assert len(box.wakers) == 1
+        message = await receiver
+        await asyncio.sleep(0)
+        return box, message
+    box, message = asyncio.run(main())
+    assert message.body == "hello"
+    assert not box.wakers
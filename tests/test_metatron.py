@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import attempt2
+import backends
+import digest
+import scheduler
+
+
+class FailingBackend(backends.Backend):
+    name = "failing"
+
+    async def generate(self, prompt, model=backends.DEFAULT_MODEL, generation_config=None):
+        raise RuntimeError("boom")
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(backends, "_backend", backends.StubBackend(default="the summary"))
+    monkeypatch.setattr(attempt2.LLM, "task_scheduler", scheduler.Scheduler(max_retries=0))
+    monkeypatch.setattr(attempt2.LLM, "response_cache", None)
+    monkeypatch.setattr(attempt2.LLM, "hedger", None)
+
+
+def angel_with_evicted_thoughts(name: str = "Ariel") -> attempt2.Angel:
+    angel = attempt2.Angel("goal", "narrow goal", digest.Digest(None), name, thought_depth=1)
+    angel.add_thoughts("first")
+    angel.add_thoughts("second")
+    return angel
+
+
+def run_condense(metatron: attempt2.Metatron, angel: attempt2.Angel):
+    task = metatron.condense(angel)
+    assert task is not None
+    chuck = attempt2.Chuck()
+    chuck.add(task[0], task[1], callback=lambda summary: metatron.absorb(angel, task[0], summary),
+              errback=lambda error: metatron.abandon(angel, task[0], error))
+    asyncio.run(chuck.run())
+
+
+def test_condense_folds_evicted_thoughts(llm):
+    metatron = attempt2.Metatron()
+    angel = angel_with_evicted_thoughts()
+    run_condense(metatron, angel)
+    assert angel.summary == "the summary"
+    assert angel.evicted == []
+    assert metatron.in_flight == {}
+    assert metatron.condense(angel) is None
+
+
+def test_condense_in_flight_is_not_asked_twice(llm):
+    metatron = attempt2.Metatron()
+    angel = angel_with_evicted_thoughts()
+    assert metatron.condense(angel) is not None
+    assert metatron.condense(angel) is None
+
+
+def test_failed_condense_frees_the_angel(llm, monkeypatch):
+    monkeypatch.setattr(backends, "_backend", FailingBackend())
+    metatron = attempt2.Metatron()
+    angel = angel_with_evicted_thoughts()
+    run_condense(metatron, angel)
+    assert metatron.in_flight == {}
+    assert angel.evicted == ["first"]
+    assert angel.summary == ""
+    assert metatron.condense(angel) is not None
+
+
+def test_late_result_for_a_forgotten_angel_is_dropped(llm):
+    metatron = attempt2.Metatron()
+    angel = angel_with_evicted_thoughts()
+    task = metatron.condense(angel)
+    metatron.forget(angel.name)
+    successor = angel_with_evicted_thoughts()
+    successor_task = metatron.condense(successor)
+    metatron.absorb(angel, task[0], "stale")
+    assert angel.summary == ""
+    assert metatron.in_flight[successor.name][1] == successor_task[0]
+
+
+def test_thought_of_a_destroyed_angel_is_not_condensed(llm):
+    kernel = attempt2.Kernel(goal="goal", global_info="info", chuck=attempt2.Chuck())
+    angel = angel_with_evicted_thoughts()
+    kernel.angels.add(angel)
+    callback = kernel.on_thought(angel, pleading=True)
+    kernel.angels.destroy([angel.name])
+    callback("third")
+    assert kernel.metatron.in_flight == {}
+    assert kernel.chuck.pipeline == []
+    assert angel.name not in kernel.pleaded
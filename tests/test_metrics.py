@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+import attempt1
+import attempt2
+import backends
+import cache
+import metrics
+import scheduler
+
+
+def test_span_feeds_histogram_and_counters():
+    recorder = metrics.Metrics()
+    with recorder.span("llm_call", model="m") as span:
+        span.set(cache_hit=True, day=3).add(prompt_tokens=10).add(prompt_tokens=5)
+    with pytest.raises(ValueError):
+        with recorder.span("llm_call", model="m"):
+            raise ValueError("bad")
+    snapshot = recorder.snapshot()
+    statuses = {entry["labels"]["status"]: entry["value"] for entry in snapshot["counters"]["llm_call_total"]}
+    assert statuses == {"ok": 1, "error": 1}
+    assert snapshot["counters"]["llm_call_cache_hit_total"] == [{"labels": {"model": "m"}, "value": 1}]
+    assert snapshot["counters"]["llm_call_prompt_tokens_total"][0]["value"] == 15
+    assert snapshot["histograms"]["llm_call_seconds"][0]["count"] == 2
+    assert snapshot["spans"][0]["day"] == 3
+    assert snapshot["spans"][1]["error"] == "ValueError('bad')"
+
+
+def test_disabled_metrics_record_nothing():
+    recorder = metrics.Metrics(enabled=False)
+    span = recorder.span("tick")
+    assert span is metrics.NULL_SPAN and not span
+    recorder.count("syscalls_total")
+    recorder.observe("tick_seconds", 1.0)
+    assert recorder.snapshot() == {"counters": {}, "histograms": {}, "spans": []}
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = metrics.Histogram()
+    for value in [0.001] * 90 + [0.3] * 9 + [100.0]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.95) == 0.5
+    assert histogram.quantile(1.0) == 60.0
+
+
+def test_prometheus_text():
+    recorder = metrics.Metrics()
+    recorder.count("syscalls_total", syscall='say "hi"')
+    recorder.observe("tick_seconds", 0.02)
+    text = recorder.to_prometheus()
+    assert '# TYPE syscalls_total counter\nsyscalls_total{syscall="say \\"hi\\""} 1\n' in text
+    assert 'tick_seconds_bucket{le="0.01"} 0\ntick_seconds_bucket{le="0.025"} 1\n' in text
+    assert 'tick_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "tick_seconds_count 1\n" in text
+
+
+def test_export_writes_json_or_prometheus(tmp_path):
+    recorder = metrics.Metrics(path=str(tmp_path / "metrics.json"))
+    recorder.count("ticks_total")
+    recorder.export()
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"]["ticks_total"][0]["value"] == 1
+    recorder.export(str(tmp_path / "metrics.prom"))
+    assert (tmp_path / "metrics.prom").read_text() == "# TYPE ticks_total counter\nticks_total 1\n"
+    metrics.Metrics(enabled=False, path=str(tmp_path / "off.json")).export()
+    assert not (tmp_path / "off.json").exists()
+
+
+class FlakyBackend(backends.Backend):
+    """Fails the first call."""
+    name = "flaky"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def generate(self, prompt, model=backends.DEFAULT_MODEL, generation_config=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError("reset")
+        return "answer"
+
+
+def test_llm_calls_count_retries_and_cache_hits(monkeypatch):
+    recorder = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", recorder)
+    monkeypatch.setattr(backends, "_backend", FlakyBackend())
+    monkeypatch.setattr(attempt2.LLM, "task_scheduler", scheduler.Scheduler(max_retries=1, backoff_base=0.001))
+    monkeypatch.setattr(attempt2.LLM, "response_cache", cache.ResponseCache())
+    monkeypatch.setattr(attempt2.LLM, "hedger", None)
+
+    async def main():
+        await attempt2.LLM.prompt("question")
+        await attempt2.LLM.prompt("question")
+    asyncio.run(main())
+    first, second = recorder.snapshot()["spans"]
+    assert (first["attempts"], first["retries"], first["hedges"], first["cache_hit"]) == (2, 1, 0, False)
+    assert (second["attempts"], second["cache_hit"]) == (0, True)
+    assert recorder.snapshot()["counters"]["llm_retries_total"][0]["value"] == 1
+
+
+def test_syscalls_count_only_once_they_succeed(monkeypatch):
+    recorder = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", recorder)
+    chuck = attempt1.Chuck(goal="test")
+    chuck._Chuck__spawn_process("write tests")
+    (name,) = chuck.children
+    inbox = chuck.children[name].inbox
+
+    async def main():
+        # Spawned outside a loop, the child isn't running and nothing empties its inbox.
+        while not inbox.full():
+            chuck._Chuck__send_message(name, "hello")
+        chuck._Chuck__send_message(name, "one too many")
+    asyncio.run(main())
+    delivered = len(inbox)
+    sent = {entry["labels"]["syscall"]: entry["value"] for entry in recorder.snapshot()["counters"]["syscalls_total"]}
+    assert sent == {"spawn": 1, "message": delivered}
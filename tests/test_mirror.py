@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from src import mirror
+
+
+class Analyzer:
+    """Summarizes each file by its first line, recording every batch it is handed."""
+    def __init__(self, fail: bool = False):
+        self.batches: list[list[str]] = []
+        self.fail = fail
+
+    async def __call__(self, items):
+        self.batches.append([path for path, _, _ in items])
+        if self.fail:
+            raise RuntimeError("model down")
+        analyses = []
+        for path, category, text in items:
+            analysis = {'summary': text.splitlines()[0]}
+            if category == 'code':
+                analysis['definitions'] = [{'name': text.split()[1].split('(')[0], 'summary': 'a function'}]
+            analyses.append(analysis)
+        return analyses
+
+
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def alpha(): pass\n")
+    (root / "notes.md").write_text("Deployment notes\n")
+    store = mirror.MirrorStore(str(root), str(tmp_path / "mirror"))
+    return root, store, {"a.py": "code", "notes.md": "knowledge", "blob.bin": "ignore"}
+
+
+def test_refresh_analyzes_in_batches_and_answers_queries(tmp_path):
+    root, store, files = repo(tmp_path)
+    analyzer = Analyzer()
+    stats = asyncio.run(store.refresh(files, analyzer, batch_size=1))
+    assert stats == {'analyzed': 2, 'failed': 0, 'batches': 2, 'removed': 0}
+    assert sorted(analyzer.batches) == [["a.py"], ["notes.md"]]
+    assert os.path.exists(tmp_path / "mirror" / "a.py.json")
+    assert store.summary("a.py") == "def alpha(): pass"
+    assert store.defining("alpha") == ["a.py"]
+    assert store.search("deployment") == ["notes.md"]
+    assert store.files("code") == ["a.py"]
+    assert store.overview("knowledge") == "notes.md (knowledge): Deployment notes"
+
+
+def test_unchanged_files_are_not_analyzed_again(tmp_path):
+    root, store, files = repo(tmp_path)
+    asyncio.run(store.refresh(files, Analyzer()))
+    analyzer = Analyzer()
+    # Touched but not changed: read and hashed, not analyzed.
+    os.utime(root / "a.py", ns=(1, 1))
+    assert asyncio.run(store.refresh(files, analyzer))['analyzed'] == 0
+    assert analyzer.batches == []
+    (root / "a.py").write_text("def beta(): pass\n")
+    assert asyncio.run(store.refresh(files, analyzer))['analyzed'] == 1
+    assert mirror.MirrorStore(str(root), store.mirror_dir).summary("a.py") == "def beta(): pass"
+
+
+def test_records_of_removed_files_are_deleted(tmp_path):
+    root, store, files = repo(tmp_path)
+    asyncio.run(store.refresh(files, Analyzer()))
+    del files["notes.md"]
+    assert asyncio.run(store.refresh(files, Analyzer()))['removed'] == 1
+    assert store.mirrored() == ["a.py"]
+
+
+def test_failed_batches_are_retried_on_the_next_refresh(tmp_path):
+    root, store, files = repo(tmp_path)
+    assert asyncio.run(store.refresh(files, Analyzer(fail=True)))['failed'] == 2
+    assert store.mirrored() == []
+    assert asyncio.run(store.refresh(files, Analyzer()))['analyzed'] == 2
@@ -0,0 +1,35 @@
+import utils
+
+
+def test_every_name_in_the_space_is_handed_out_once():
+    generator = utils.NameGenerator(seed=1)
+    names = [generator.generate_name() for _ in range(generator.possible_names)]
+    assert len(set(names)) == generator.possible_names
+    assert not any(name[-1].isdigit() for name in names)
+
+
+def test_used_up_space_is_reused_with_a_suffix():
+    generator = utils.NameGenerator(seed=1)
+    first = [generator.generate_name() for _ in range(generator.possible_names)]
+    assert generator.generate_name() == first[0] + "2"
+
+
+def test_released_names_are_reused_first():
+    generator = utils.NameGenerator(seed=2)
+    name = generator.generate_name()
+    generator.generate_name()
+    generator.release(name)
+    generator.release("NotOneOfOurs")
+    assert name not in generator.names
+    assert generator.generate_name() == name
+
+
+def test_personality_comes_from_the_name():
+    generator = utils.NameGenerator(seed=3)
+    name, personality = generator.generate_name_and_personality()
+    adverb, adjective = personality.split()
+    assert name.startswith(adverb.capitalize() + adjective.capitalize())
+
+
+def test_seed_fixes_the_order():
+    assert utils.NameGenerator(seed=4).generate_name() == utils.NameGenerator(seed=4).generate_name()
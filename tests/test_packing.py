@@ -0,0 +1,89 @@
+import asyncio
+import re
+
+import pytest
+
+import attempt2
+import backends
+import packing
+import scheduler
+
+
+def test_plan_packs_respects_size_and_token_limits():
+    bodies = [(f"t{i}", "word " * 10) for i in range(5)]
+    assert [len(pack) for pack in packing.plan_packs("prefix", bodies, 10_000, 2)] == [2, 2, 1]
+    assert [len(pack) for pack in packing.plan_packs("prefix", bodies, 1, 8)] == [1, 1, 1, 1, 1]
+
+
+def test_split_packed_returns_answers_in_section_order():
+    response = "=== S2 ===\nsecond\n=== S1 ===\nfirst\n"
+    assert packing.split_packed(response, 2) == ["first", "second"]
+
+
+@pytest.mark.parametrize("response", [
+    "=== S1 ===\nonly one",
+    "=== S1 ===\n\n=== S2 ===\nsecond",
+    "=== S1 ===\na\n=== S2 ===\nb\n=== S3 ===\nc",
+])
+def test_split_packed_rejects_responses_that_dont_match(response):
+    assert packing.split_packed(response, 2) is None
+
+
+def test_pack_prompt_labels_each_body():
+    prompt = packing.pack_prompt("shared", ["one", "two"])
+    assert prompt.startswith("shared\n")
+    assert packing.split_packed(prompt.split("\n", 2)[2], 2) == ["one", "two"]
+
+
+def answer_sections(prompt: str) -> str:
+    """Echoes each packed body back under its header, or a single prompt's last line."""
+    labels = re.findall(r"^=== (S\d+) ===$", prompt, re.MULTILINE)
+    if not labels:
+        return f"answer {prompt.splitlines()[-1]}"
+    bodies = re.split(r"^=== S\d+ ===$\n", prompt, flags=re.MULTILINE)[1:]
+    return "\n".join(f"=== {label} ===\nanswer {body.strip()}" for label, body in zip(labels, bodies))
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(respond):
+        stub = backends.StubBackend(responses=respond)
+        monkeypatch.setattr(backends, "_backend", stub)
+        return stub
+    monkeypatch.setattr(attempt2.LLM, "task_scheduler", scheduler.Scheduler(max_retries=0))
+    monkeypatch.setattr(attempt2.LLM, "response_cache", None)
+    monkeypatch.setattr(attempt2.LLM, "hedger", None)
+    return install
+
+
+def add_thinks(chuck: attempt2.Chuck, count: int):
+    for i in range(count):
+        chuck.add(f"angel{i}", f"shared prefix\nbody {i}", prefix="shared prefix\n")
+
+
+def test_tasks_sharing_a_prefix_go_in_one_request(backend):
+    stub = backend(answer_sections)
+    chuck = attempt2.Chuck(packing=True)
+    add_thinks(chuck, 3)
+    asyncio.run(chuck.run())
+    assert stub.calls == 1
+    assert [chuck.lookup(f"angel{i}") for i in range(3)] == ["answer body 0", "answer body 1", "answer body 2"]
+
+
+def test_unsplittable_pack_is_retried_one_by_one(backend):
+    stub = backend(lambda prompt: "no sections" if "=== S1 ===" in prompt else answer_sections(prompt))
+    chuck = attempt2.Chuck(packing=True)
+    add_thinks(chuck, 2)
+    asyncio.run(chuck.run())
+    assert stub.calls == 3
+    assert chuck.lookup("angel1") == "answer body 1"
+
+
+def test_fresh_tasks_are_not_packed(backend):
+    stub = backend(answer_sections)
+    chuck = attempt2.Chuck(packing=True)
+    add_thinks(chuck, 2)
+    chuck.add("fresh", "shared prefix\nbody fresh", fresh=True, prefix="shared prefix\n")
+    asyncio.run(chuck.run())
+    assert stub.calls == 2
+    assert chuck.lookup("fresh") == "answer body fresh"
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import attempt2
+import backends
+import scheduler
+
+
+class SleepyBackend(backends.Backend):
+    """Answers "<prompt> done" after the number of seconds in the prompt, fails on "fail"."""
+    name = "sleepy"
+
+    async def generate(self, prompt, model=backends.DEFAULT_MODEL, generation_config=None):
+        if prompt == "fail":
+            raise RuntimeError("boom")
+        await asyncio.sleep(float(prompt))
+        return f"{prompt} done"
+
+
+@pytest.fixture(autouse=True)
+def llm(monkeypatch):
+    monkeypatch.setattr(backends, "_backend", SleepyBackend())
+    monkeypatch.setattr(attempt2.LLM, "task_scheduler", scheduler.Scheduler(max_retries=0))
+    monkeypatch.setattr(attempt2.LLM, "response_cache", None)
+    monkeypatch.setattr(attempt2.LLM, "hedger", None)
+
+
+def collect(chuck: attempt2.Chuck, deadline: float | None = None) -> list[tuple[str, str]]:
+    async def main():
+        return [item async for item in chuck.stream(deadline)]
+    return asyncio.run(main())
+
+
+def test_stream_yields_results_as_they_complete():
+    chuck = attempt2.Chuck()
+    chuck.add("slow", "0.05")
+    chuck.add("fast", "0")
+    assert collect(chuck) == [("fast", "0 done"), ("slow", "0.05 done")]
+    assert chuck.lookup("slow") == "0.05 done"
+    assert chuck.time == 1
+
+
+def test_callback_runs_before_the_tick_ends():
+    chuck = attempt2.Chuck()
+    seen = []
+    chuck.add("fast", "0", callback=lambda result: seen.append((result, chuck.lookup("slow"))))
+    chuck.add("slow", "0.05")
+    asyncio.run(chuck.run())
+    assert seen == [("0 done", None)]
+
+
+def test_callback_can_queue_work_for_the_same_tick():
+    chuck = attempt2.Chuck()
+    chuck.add("first", "0", callback=lambda result: chuck.add("second", "0"))
+    assert [task_id for task_id, _ in collect(chuck)] == ["first", "second"]
+    assert chuck.pipeline == []
+
+
+def test_failed_task_does_not_abort_the_tick():
+    chuck = attempt2.Chuck()
+    errors = []
+    chuck.add("broken", "fail", errback=errors.append)
+    chuck.add("fine", "0")
+
+    async def main():
+        waiter = asyncio.ensure_future(chuck.lookup_async("broken"))
+        await chuck.run()
+        with pytest.raises(RuntimeError):
+            await waiter
+    asyncio.run(main())
+    assert chuck.lookup("fine") == "0 done"
+    assert [str(error) for error in errors] == ["boom"]
+
+
+def test_lookup_async_waits_for_one_task():
+    chuck = attempt2.Chuck()
+    chuck.add("fast", "0")
+    chuck.add("slow", "0.05")
+
+    async def main():
+        tick = asyncio.ensure_future(chuck.run())
+        result = await chuck.lookup_async("fast")
+        pending = chuck.lookup("slow")
+        await tick
+        return result, pending
+    assert asyncio.run(main()) == ("0 done", None)
+
+
+def test_tasks_past_the_deadline_are_carried_over():
+    chuck = attempt2.Chuck()
+    chuck.add("fast", "0")
+    chuck.add("slow", "1")
+    assert collect(chuck, deadline=0.05) == [("fast", "0 done")]
+    assert chuck.carried_over == 1
+    assert chuck.pipeline == [("slow", "1")]
+
+
+def test_without_carry_over_late_tasks_time_out():
+    chuck = attempt2.Chuck(carry_over=False)
+    errors = []
+    chuck.add("fast", "0")
+    chuck.add("slow", "1", errback=errors.append)
+    assert collect(chuck, deadline=0.05) == [("fast", "0 done")]
+    assert chuck.timed_out == ["slow"]
+    assert chuck.pipeline == []
+    assert chuck.carried_over == 0
+    assert [type(error) for error in errors] == [asyncio.TimeoutError]
@@ -0,0 +1,94 @@
+import pytest
+
+import attempt1
+from attempt1 import RegisterStorage
+
+
+def test_storage_appends_and_reads_back():
+    storage = RegisterStorage()
+    storage.append("hello ")
+    storage.append("")
+    storage.append("world")
+    assert len(storage) == 11
+    assert storage.materialize() == "hello world"
+    assert storage.tail(5) == "world"
+    assert storage.slice(2, 8) == "llo wo"
+
+
+def test_storage_reads_without_materializing():
+    storage = RegisterStorage()
+    storage.append("abc")
+    storage.append("def")
+    assert storage.text is None
+    assert storage.tail(4) == "cdef"
+    assert storage.slice(1, 5) == "bcde"
+    assert storage.text is None
+
+
+def test_storage_unicode_across_segments(monkeypatch):
+    monkeypatch.setattr(RegisterStorage, "SEGMENT_BYTES", 8)
+    storage = RegisterStorage()
+    for part in ("añb", "ü€", "xyz", "é"):
+        storage.append(part)
+    text = "añbü€xyzé"
+    assert len(storage.segments) > 1
+    assert len(storage) == len(text)
+    assert storage.nbytes == len(text.encode("utf-8"))
+    for chars in range(len(text) + 2):
+        assert storage.tail(chars) == (text[-chars:] if chars else "")
+    for start in range(len(text)):
+        for stop in range(start, len(text) + 1):
+            assert storage.slice(start, stop) == text[start:stop]
+    assert storage.materialize() == text
+
+
+def test_storage_clear():
+    storage = RegisterStorage()
+    storage.append("data")
+    storage.clear()
+    assert len(storage) == 0
+    assert storage.materialize() == ""
+    assert storage.tail(3) == ""
+    storage.append("new")
+    assert storage.materialize() == "new"
+
+
+def test_consolidate_refuses_to_overwrite_a_register():
+    chuck = attempt1.Chuck(goal="test")
+    create = chuck._Chuck__create_register
+    consolidate = chuck._Chuck__consolidate_registers
+    create("a", "first")
+    create("b", "second")
+    create("c", "third")
+    with pytest.raises(ValueError):
+        create("a", "again")
+    with pytest.raises(ValueError):
+        consolidate(["a", "b"], "c")
+    chuck.memory["a"].storage.append("x")
+    chuck.memory["b"].storage.append("y")
+    consolidate(["a", "b"], "a")
+    assert chuck.memory["a"].get() == "x\ny"
+    assert chuck.memory["a"].locked_to == ""
+
+
+def test_deleted_register_does_not_pass_its_lock_on():
+    chuck = attempt1.Chuck(goal="test")
+    chuck._Chuck__create_register("r", "scratch")
+    chuck.register_lock_manager.request("r", "a")
+    chuck.register_lock_manager.request("r", "b")
+    chuck._Chuck__delete_register("r")
+    assert chuck.memory_locks == {}
+    chuck._Chuck__create_register("r", "again")
+    assert chuck.memory["r"].locked_to == ""
+    assert chuck.register_lock_manager.request("r", "c") == "grant"
+    assert chuck.memory["r"].locked_to == "c"
+
+
+def test_consolidated_registers_drop_their_waiters():
+    chuck = attempt1.Chuck(goal="test")
+    chuck._Chuck__create_register("a", "first")
+    chuck._Chuck__create_register("b", "second")
+    chuck.register_lock_manager.policy = lambda manager, resource, owner, reason: "escalate"
+    chuck.register_lock_manager.request("a", "x")
+    chuck._Chuck__consolidate_registers(["a", "b"], "c")
+    assert "a" not in chuck.register_lock_manager.waiters
@@ -0,0 +1,63 @@
+import attempt2
+import digest
+
+
+def make(name: str, goal: str = "goal") -> attempt2.Angel:
+    return attempt2.Angel("big goal", goal, digest.Digest(None), name)
+
+
+def test_add_indexes_by_name_and_goal():
+    registry = attempt2.AngelRegistry()
+    ariel, uriel = make("Ariel", "tests"), make("Uriel", "tests")
+    assert registry.add(ariel) and registry.add(uriel)
+    assert not registry.add(make("Ariel", "docs"))
+    assert len(registry) == 2
+    assert registry["Ariel"] is ariel
+    assert registry.with_goal("tests") == [ariel, uriel]
+    assert registry.with_goal("docs") == []
+
+
+def test_create_skips_malformed_and_taken_names():
+    registry = attempt2.AngelRegistry()
+    registry.add(make("Ariel"))
+    created = registry.create([{"name": "Ariel", "goal": "again"}, {"name": "Uriel"}, "junk", {"name": "Raziel", "goal": "docs"}],
+                              "big goal", digest.Digest(None))
+    assert [angel.name for angel in created] == ["Raziel"]
+    assert "Uriel" not in registry
+
+
+def test_mark_spare_and_destroy_keep_the_indexes_in_step():
+    registry = attempt2.AngelRegistry()
+    for name in ("Ariel", "Uriel", "Raziel"):
+        registry.add(make(name))
+    assert [angel.name for angel in registry.mark(["Uriel", "Raziel", "Uriel", "Nobody"])] == ["Uriel", "Raziel"]
+    assert registry.mark(["Uriel"]) == []
+    assert [angel.name for angel in registry.endangered()] == ["Uriel", "Raziel"]
+    assert [angel.name for angel in registry.spare(["Raziel", "Ariel"])] == ["Raziel"]
+    assert registry["Raziel"].in_danger is False
+    assert [angel.name for angel in registry.safe()] == ["Ariel", "Raziel"]
+    registry.destroy(["Uriel", "Uriel"])
+    assert registry.endangered() == []
+    assert [angel.name for angel in registry.with_goal("goal")] == ["Ariel", "Raziel"]
+    registry.destroy(["Ariel", "Raziel"])
+    assert registry.by_goal == {}
+
+
+def test_destroying_while_iterating_is_safe():
+    registry = attempt2.AngelRegistry()
+    for name in ("Ariel", "Uriel", "Raziel"):
+        registry.add(make(name))
+    for angel in registry:
+        registry.destroy([angel.name])
+    assert len(registry) == 0
+
+
+def test_listeners_hear_every_change():
+    registry = attempt2.AngelRegistry()
+    events = []
+    registry.subscribe(lambda event, angel: events.append((event, angel.name)))
+    registry.add(make("Ariel"))
+    registry.mark(["Ariel"])
+    registry.spare(["Ariel"])
+    registry.destroy(["Ariel", "Nobody"])
+    assert events == [("created", "Ariel"), ("marked", "Ariel"), ("spared", "Ariel"), ("destroyed", "Ariel")]
@@ -0,0 +1,69 @@
+import pytest
+
+import retrieval
+
+DOCUMENTS = {
+    "deploy.md": "Deploy with docker compose. The deploy script pushes the image to the registry.",
+    "tests.md": "Run the tests with pytest. Every module has a test file.",
+    "style.md": "Use four spaces. Keep lines under one hundred and twenty characters.",
+}
+
+
+def test_bm25_ranks_the_matching_document_first():
+    index = retrieval.Index.build(DOCUMENTS)
+    hits = index.search("how do I deploy the image")
+    assert hits[0].source == "deploy.md"
+    assert index.rank("pytest tests", 1) == ["tests.md"]
+    assert index.search("nothing matches this") == []
+
+
+def test_context_labels_chunks_and_fits_the_budget():
+    index = retrieval.Index.build(DOCUMENTS)
+    assert index.context("deploy docker").startswith("[deploy.md]\nDeploy with docker compose.")
+    assert index.context("deploy docker", max_tokens=5) == ""
+
+
+def test_saved_index_answers_the_same(tmp_path):
+    built = retrieval.Index.build(DOCUMENTS, chunk_tokens=8)
+    built.save(str(tmp_path / "index"))
+    loaded = retrieval.Index.load(str(tmp_path / "index"))
+    assert loaded.count == built.count
+    assert [(hit.source, hit.text) for hit in loaded.search("registry spaces")] == [(hit.source, hit.text) for hit in built.search("registry spaces")]
+
+
+def test_empty_index_finds_nothing(tmp_path):
+    index = retrieval.Index.build({})
+    index.save(str(tmp_path / "empty"))
+    assert retrieval.Index.load(str(tmp_path / "empty")).search("anything") == []
+
+
+def test_relevant_keeps_the_best_k_and_fills_up_in_order():
+    items = {"alpha": "parses config", "beta": "talks to the database", "gamma": "renders pages"}
+    assert retrieval.relevant("database", items, 3) is items
+    assert list(retrieval.relevant("database", items, 2, str)) == ["beta", "alpha"]
+
+
+def test_knowledge_index_is_rebuilt_only_when_files_change(tmp_path):
+    (tmp_path / "provided").mkdir()
+    (tmp_path / "provided" / "guide.md").write_text("The kernel ticks once a second.")
+    (tmp_path / "provided" / "image.png").write_bytes(b"\x89PNG\x00")
+    index_directory = str(tmp_path / "index")
+    first = retrieval.open_knowledge(str(tmp_path), index_directory)
+    assert first.sources == ["provided/guide.md"]
+    meta = tmp_path / "index" / "meta.json"
+    written = meta.stat().st_mtime_ns
+    retrieval.open_knowledge(str(tmp_path), index_directory)
+    assert meta.stat().st_mtime_ns == written
+    (tmp_path / "provided" / "more.md").write_text("Angels think in parallel.")
+    assert retrieval.open_knowledge(str(tmp_path), index_directory).rank("angels", 1) == ["provided/more.md"]
+    assert retrieval.open_knowledge(str(tmp_path / "nothing"), index_directory) is None
+
+
+def test_embeddings_blend_with_bm25(tmp_path):
+    pytest.importorskip("numpy")
+    index = retrieval.Index.build(DOCUMENTS, embedder=retrieval.HashingEmbedder(64))
+    assert index.search("deploy image")[0].source == "deploy.md"
+    index.save(str(tmp_path / "index"))
+    loaded = retrieval.Index.load(str(tmp_path / "index"))
+    assert loaded.embedder is not None
+    assert loaded.search("deploy image")[0].source == "deploy.md"
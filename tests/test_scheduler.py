@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import scheduler
+
+
+def test_concurrency_is_capped():
+    limits = scheduler.Scheduler(max_concurrency=2, max_retries=0)
+    active = peak = 0
+
+    async def call():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(limits.run(call) for _ in range(6)))
+    assert asyncio.run(main()) == ["done"] * 6
+    assert peak == 2
+    assert limits.active == 0
+
+
+def test_waiters_start_in_priority_order():
+    limits = scheduler.Scheduler(max_concurrency=1, max_retries=0)
+    started = []
+
+    def call(name: str):
+        async def run():
+            started.append(name)
+            await asyncio.sleep(0.001)
+        return run
+
+    async def main():
+        first = limits.submit(call("first"))
+        await asyncio.sleep(0)
+        rest = [limits.submit(call("think"), scheduler.PRIORITY_THINK),
+                limits.submit(call("default")),
+                limits.submit(call("kernel"), scheduler.PRIORITY_KERNEL)]
+        await asyncio.gather(first, *rest)
+    asyncio.run(main())
+    assert started == ["first", "kernel", "default", "think"]
+
+
+def test_failed_calls_are_retried():
+    limits = scheduler.Scheduler(max_retries=2, backoff_base=0.001)
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectionError("reset")
+        return "ok"
+    assert asyncio.run(limits.run(flaky)) == "ok"
+    assert attempts == 3
+
+
+def test_gives_up_after_max_retries():
+    limits = scheduler.Scheduler(max_retries=1, backoff_base=0.001)
+    attempts = 0
+
+    async def broken():
+        nonlocal attempts
+        attempts += 1
+        raise ConnectionError("reset")
+    with pytest.raises(ConnectionError):
+        asyncio.run(limits.run(broken))
+    assert attempts == 2
+    assert limits.active == 0
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    limits = scheduler.Scheduler(max_concurrency=1, max_retries=0)
+
+    async def main():
+        blocker = limits.submit(lambda: asyncio.sleep(0.01))
+        await asyncio.sleep(0)
+        waiter = limits.submit(lambda: asyncio.sleep(0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await blocker
+        await asyncio.wait_for(limits.run(lambda: asyncio.sleep(0)), 1)
+    asyncio.run(main())
+    assert limits.active == 0
+
+
+def test_bucket_waits_for_tokens():
+    bucket = scheduler.TokenBucket(rate_per_minute=600, capacity=1)
+
+    async def main():
+        await bucket.take()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.take()
+        return loop.time() - start
+    assert asyncio.run(main()) >= 0.05
+
+
+def test_bucket_caps_oversized_requests_at_capacity():
+    bucket = scheduler.TokenBucket(rate_per_minute=6000, capacity=10)
+    asyncio.run(asyncio.wait_for(bucket.take(50), 1))
+    assert bucket.tokens < 1
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import attempt1
+import backends
+
+
+class ScriptedStream(backends.Backend):
+    """Streams chunks, calling between(chunk index) before each one. generate answers repairs."""
+    name = "scripted"
+
+    def __init__(self, chunks: list[str], between=lambda index: None, repair: str = ""):
+        super().__init__()
+        self.chunks = chunks
+        self.between = between
+        self.repair = repair
+
+    async def generate(self, prompt, model=backends.DEFAULT_MODEL, generation_config=None):
+        return self.repair
+
+    async def stream(self, prompt, model=backends.DEFAULT_MODEL, generation_config=None):
+        for index, chunk in enumerate(self.chunks):
+            self.between(index)
+            await asyncio.sleep(0)
+            yield chunk
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(attempt1.LLM, "response_cache", None)
+
+
+def test_calls_are_dispatched_while_the_response_streams(monkeypatch):
+    chuck = attempt1.Chuck(goal="test", streaming=True)
+    seen = []
+    chunks = ['__create_register("a", "first")\n__create_reg', 'ister("b", "second")\n', '']
+    monkeypatch.setattr(backends, "_backend", ScriptedStream(chunks, lambda index: seen.append(sorted(chuck.memory))))
+    asyncio.run(chuck.register_lifecycle())
+    assert seen == [[], ["a"], ["a", "b"]]
+
+
+def test_broken_streamed_lines_are_repaired_after_the_stream(monkeypatch):
+    chuck = attempt1.Chuck(goal="test", streaming=True)
+    chunks = ['__create_register("a", "first")\n', '__create_register("b"\n']
+    monkeypatch.setattr(backends, "_backend", ScriptedStream(chunks, repair='__create_register("b", "second")'))
+    asyncio.run(chuck.register_lifecycle())
+    assert sorted(chuck.memory) == ["a", "b"]
+    assert chuck.memory["b"].description == "second"
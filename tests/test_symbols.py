@@ -0,0 +1,87 @@
+import os
+
+from src import symbols
+
+SOURCE = '''import os
+from .util import helper as h
+
+LIMIT = 3
+
+
+class Chuck(Base):
+    """Runs the pipeline.
+
+    More detail.
+    """
+    async def run(self, deadline: float | None = None) -> None:
+        helper()
+        return os.getcwd()
+
+
+def run():
+    Chuck().run()
+'''
+
+
+def indexed(tmp_path, path=None) -> symbols.SymbolIndex:
+    (tmp_path / "a.py").write_text(SOURCE)
+    (tmp_path / "b.py").write_text("from a import Chuck\nChuck()\n")
+    (tmp_path / "notes.md").write_text("Chuck")
+    index = symbols.SymbolIndex(str(tmp_path), path)
+    assert index.update(["a.py", "b.py", "notes.md"]) == 2
+    return index
+
+
+def test_definitions_carry_signatures_and_docs(tmp_path):
+    index = indexed(tmp_path)
+    (method,) = index.find("Chuck.run")
+    assert method['kind'] == 'method'
+    assert method['signature'] == "async def run(self, deadline: float | None=None) -> None"
+    assert (method['line'], method['end_line']) == (12, 14)
+    assert index.find("Chuck")[0]['doc'] == "Runs the pipeline."
+    assert index.find("Chuck")[0]['signature'] == "class Chuck(Base)"
+    assert [d['name'] for d in index.find("run")] == ["Chuck.run", "run"]
+    assert [d['name'] for d in index.outline("a.py")] == ["LIMIT", "Chuck", "Chuck.run", "run"]
+
+
+def test_references_imports_and_calls(tmp_path):
+    index = indexed(tmp_path)
+    assert index.references("Chuck") == ["a.py", "b.py"]
+    assert index.imports("a.py") == [("os", None, None), (".util", "helper", "h")]
+    assert index.importers_of("a") == ["b.py"]
+    assert index.callers("run") == [("a.py", "run")]
+    assert index.callees("a.py", "Chuck.run") == ["getcwd", "helper"]
+    assert index.callees("b.py", "<module>") == ["Chuck"]
+
+
+def test_source_is_just_the_symbol(tmp_path):
+    index = indexed(tmp_path)
+    assert index.source("Chuck.run") == ['    async def run(self, deadline: float | None = None) -> None:\n        helper()\n        return os.getcwd()']
+
+
+def test_update_reparses_only_changed_files_and_drops_removed_ones(tmp_path):
+    index = indexed(tmp_path)
+    assert index.update(["a.py", "b.py"]) == 0
+    (tmp_path / "b.py").write_text("def other():\n    pass\n")
+    assert index.update(["a.py", "b.py"]) == 1
+    assert index.importers_of("a") == []
+    assert index.references("Chuck") == ["a.py"]
+    assert index.update(["b.py"]) == 0
+    assert index.find("Chuck") == []
+    assert index.callers("run") == []
+
+
+def test_broken_files_are_indexed_empty(tmp_path):
+    (tmp_path / "broken.py").write_text("def (:\n")
+    index = symbols.SymbolIndex(str(tmp_path))
+    assert index.update(["broken.py"]) == 1
+    assert index.outline("broken.py") == []
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / "symbols.index")
+    indexed(tmp_path, path)
+    reloaded = symbols.SymbolIndex(str(tmp_path), path)
+    assert [d['name'] for d in reloaded.find("run")] == ["Chuck.run", "run"]
+    assert reloaded.update(["a.py", "b.py"]) == 0
+    assert os.path.exists(path)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import syscalls
+
+
+def test_parse_calls_and_skips_fences():
+    calls, errors = syscalls.parse('```\n__spawn_process("write tests")\n  __kill_process(Ariel);\n```\n')
+    assert errors == []
+    assert [(call.name, call.args, call.line) for call in calls] == [
+        ("__spawn_process", ["write tests"], 2),
+        ("__kill_process", ["Ariel"], 3),
+    ]
+
+
+def test_parse_lists_and_escapes():
+    calls, errors = syscalls.parse("__consolidate_registers(['a', \"b\\\"c\"], merged)\n__send_message(x, 'line\\nbreak')")
+    assert errors == []
+    assert calls[0].args == [["a", 'b"c'], "merged"]
+    assert calls[1].args == ["x", "line\nbreak"]
+
+
+@pytest.mark.parametrize("text, column, message", [
+    ('__kill_process("a"', 18, "expected ','"),
+    ('__kill_process("a) ', 18, "unterminated string"),
+    ('__kill_process(a) extra', 18, "unexpected text after call"),
+    ('__kill_process(a, b)', 0, "takes 1 arguments, got 2"),
+    ('__unknown(a)', 0, "unknown syscall __unknown"),
+    ('__create_register([a], b)', 0, "name of __create_register must be str"),
+])
+def test_parse_errors_point_at_the_problem(text, column, message):
+    calls, errors = syscalls.parse(text)
+    assert calls == []
+    assert len(errors) == 1
+    assert errors[0].line == 1
+    assert errors[0].column == column
+    assert message in errors[0].message
+
+
+def test_parse_keeps_good_calls_next_to_bad_ones():
+    calls, errors = syscalls.parse("__kill_process(a)\nnot a call\n__kill_process(b)")
+    assert [call.args for call in calls] == [["a"], ["b"]]
+    assert [error.line for error in errors] == [2]
+
+
+def test_parse_stream_yields_calls_as_lines_end():
+    async def chunks():
+        for chunk in ('__kill_pro', 'cess(a)\n__send_', 'message(a, "hi")\nbroken(', ''):
+            yield chunk
+
+    async def main():
+        return [item async for item in syscalls.parse_stream(chunks())]
+    parsed = asyncio.run(main())
+    assert [type(item) for item in parsed] == [syscalls.SyscallCall, syscalls.SyscallCall, syscalls.SyscallError]
+    assert parsed[1].args == ["a", "hi"]
+    assert parsed[2].line == 3
+
+
+def test_parse_json_lists_and_named_args():
+    calls, errors = syscalls.parse_json('```json\n[{"name": "__kill_process", "args": ["a"]},'
+                                        ' {"name": "__send_message", "args": {"message": "hi", "name": "b"}}]\n```')
+    assert errors == []
+    assert [call.args for call in calls] == [["a"], ["b", "hi"]]
+
+
+def test_parse_json_single_object_and_calls_key():
+    assert syscalls.parse_json('{"name": "__kill_process", "args": ["a"]}')[0][0].args == ["a"]
+    assert len(syscalls.parse_json('{"calls": [{"name": "__kill_process", "args": ["a"]}]}')[0]) == 1
+
+
+@pytest.mark.parametrize("text", ["3", "null", '"__kill_process"', '{"calls": 5}', "true"])
+def test_parse_json_scalars_are_malformed(text):
+    calls, errors = syscalls.parse_json(text)
+    assert calls == []
+    assert len(errors) == 1
+    assert "expected a list of calls" in errors[0].message
+
+
+@pytest.mark.parametrize("item", ['3', '{"args": []}', '{"name": [1]}', '{"name": "__kill_process", "args": 5}',
+                                  '{"name": "__kill_process", "args": ["a", "b"]}'])
+def test_parse_json_bad_items(item):
+    calls, errors = syscalls.parse_json(f'[{item}, {{"name": "__kill_process", "args": ["ok"]}}]')
+    assert [call.args for call in calls] == [["ok"]]
+    assert [error.line for error in errors] == [1]
+
+
+def test_parse_json_invalid_json():
+    calls, errors = syscalls.parse_json('[{"name": }]')
+    assert calls == []
+    assert "invalid JSON" in errors[0].message
+
+
+def test_dispatch_reports_handler_errors():
+    failures = []
+
+    def handler(name):
+        raise ValueError(f"no process {name}")
+
+    table = syscalls.DispatchTable({"__kill_process": handler}, on_error=lambda call, e: failures.append((call.name, str(e))))
+    calls, _ = syscalls.parse("__kill_process(a)\n__send_message(a, b)")
+    assert not table.dispatch(calls[0])
+    assert not table.dispatch(calls[1])
+    assert failures == [("__kill_process", "no process a")]
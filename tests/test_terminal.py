@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import terminal
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_command_output_and_exit_code():
+    async def main():
+        pool = terminal.TerminalPool()
+        return await pool.run("echo out; echo err >&2; exit 3")
+    result = run(main())
+    assert (result.stdout, result.stderr, result.exit_code) == ("out\n", "err\n", 3)
+    assert not result.ok and not result.timed_out
+
+
+def test_timeout_kills_the_command_and_its_children():
+    async def main():
+        pool = terminal.TerminalPool()
+        return await pool.run("sleep 5 & sleep 5; echo late", timeout=0.2)
+    start = time.monotonic()
+    result = run(main())
+    assert result.timed_out and result.exit_code is None
+    assert "late" not in result.stdout
+    assert time.monotonic() - start < 3
+
+
+def test_output_is_capped():
+    async def main():
+        pool = terminal.TerminalPool(max_output=100)
+        return await pool.run("head -c 5000 /dev/zero | tr '\\0' x")
+    result = run(main())
+    assert result.stdout == "x" * 100
+    assert result.truncated
+
+
+def test_commands_run_concurrently_up_to_the_cap():
+    async def main():
+        pool = terminal.TerminalPool(max_concurrency=2)
+        start = time.monotonic()
+        await asyncio.gather(*(pool.run("sleep 0.2") for _ in range(4)))
+        return time.monotonic() - start
+    assert 0.4 <= run(main()) < 0.8
+
+
+def test_sessions_keep_their_directory_and_variables(tmp_path):
+    async def main():
+        pool = terminal.TerminalPool()
+        await pool.run(f"cd {tmp_path}; NAME=kept", session="s")
+        result = await pool.run("pwd; echo $NAME", session="s")
+        other = await pool.run("echo ${NAME:-unset}", session="other")
+        pool.close()
+        await pool.wait_closed()
+        return result, other
+    result, other = run(main())
+    assert result.stdout == f"{tmp_path}\nkept\n"
+    assert result.exit_code == 0
+    assert other.stdout == "unset\n"
+
+
+def test_session_survives_a_timeout():
+    async def main():
+        pool = terminal.TerminalPool()
+        late = await pool.run("sleep 5", timeout=0.2, session="s")
+        after = await pool.run("echo back", session="s")
+        pool.close()
+        await pool.wait_closed()
+        return late, after
+    late, after = run(main())
+    assert late.timed_out
+    assert after.stdout == "back\n"
+
+
+def test_stream_yields_chunks_then_the_result():
+    async def main():
+        pool = terminal.TerminalPool()
+        return [item async for item in pool.stream("echo one; sleep 0.05; echo two")]
+    items = run(main())
+    assert isinstance(items[-1], terminal.CommandResult)
+    assert "".join(text for name, text in items[:-1] if name == "stdout") == "one\ntwo\n"
+
+
+def test_closed_sessions_are_reaped():
+    async def main():
+        pool = terminal.TerminalPool()
+        await pool.run("true", session="s")
+        process = pool.shells["s"].process
+        pool.end_session("s")
+        await pool.wait_closed()
+        return pool, process
+    pool, process = run(main())
+    assert process.returncode is not None
+    assert not pool.reaping
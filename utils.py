@@ -1,43 +1,80 @@
+import math
 import random
 import secrets
+from collections import deque
 
 
 class NameGenerator:
-    def __init__(self):
-        self.names = []
+    """
+    Hands out unique names from the adverb x adjective x angel name space.
+    Names come from a seeded affine permutation of that space, so each one is O(1) and never collides.
+    Released names are reused before new ones. Once the space is used up, it is reused with a numeric suffix
+    (BoldlyWittyMichael2, ...), so generating never fails.
+    """
+    def __init__(self, seed: int | None = None):
+        self.names: set[str] = set()
         self.adverbs = ["accidentally", "always", "angrily", "annually", "anxiously", "awkwardly", "badly", "blindly", "boastfully", "boldly", "bravely", "brightly", "cheerfully", "deftly", "deliberately", "devotedly", "doubtfully",
                 "dramatically", "dutifully", "eagerly", "elegantly", "enormously", "enthusiastically", "equally", "eventually", "exactly", "faithfully", "fortunately", "frequently", "generously", "gently", "gladly", "gracefully"]
         self.adjectives = ["adaptable", "adventurous", "affectionate", "ambitious", "amiable", "compassionate", "considerate", "courageous", "courteous", "diligent", "empathetic", "exuberant", "frank", "generous",
                            "gregarious", "impartial", "intuitive", "inventive", "passionate", "persistent", "philosophical", "practical", "rational", "reliable", "resourceful", "sensible", "sincere", "sympathetic", "unassuming", "witty"]
 
+        # Deduplicated below, repeats would only shrink the real space.
         self.angel_names = ["Michael", "Gabriel", "Raphael", "Uriel", "Castiel","Lucifer", "Raguel", "Sariel", "Remiel", "Jeremiel", "Barachiel", "Kokabiel", "Tzaphqiel", "Haniel", "Azrael", "Metatron",
                             "Sandalphon", "Jophiel", "Zadkiel", "Raziel", "Chamuel", "Zaphkiel", "Zadkiel", "Zerachiel", "Zophiel", "Zuriel", "Zadkiel", "Zaphkiel", "Zerachiel", "Zophiel", "Zuriel"]
 
+        self.adverbs = list(dict.fromkeys(self.adverbs))
+        self.adjectives = list(dict.fromkeys(self.adjectives))
+        self.angel_names = list(dict.fromkeys(self.angel_names))
+
         self.possible_names = len(self.adverbs) * len(self.adjectives) * len(self.angel_names)
         print(f"Possible names: {self.possible_names}")
 
+        rng = random.Random(seed)
+        self.step = rng.randrange(1, self.possible_names)
+        while math.gcd(self.step, self.possible_names) != 1:
+            self.step = rng.randrange(1, self.possible_names)
+        self.offset = rng.randrange(self.possible_names)
+        self.next_index = 0
+        self.round = 0
+        # name: (position in the space, round), for every name handed out and not yet released.
+        self.allocated: dict[str, tuple[int, int]] = {}
+        self.free: deque[tuple[int, int]] = deque()
+
+    def parts(self, position: int) -> tuple[str, str, str]:
+        position, name = divmod(position, len(self.angel_names))
+        adverb, adjective = divmod(position, len(self.adjectives))
+        return self.adverbs[adverb], self.adjectives[adjective], self.angel_names[name]
+
+    def allocate(self) -> tuple[str, str, str]:
+        """A fresh (full name, adverb, adjective)."""
+        if self.free:
+            position, cycle = self.free.popleft()
+        else:
+            if self.next_index == self.possible_names:
+                self.next_index = 0
+                self.round += 1
+            # i -> (step * i + offset) mod n visits every position exactly once because gcd(step, n) == 1.
+            position, cycle = (self.step * self.next_index + self.offset) % self.possible_names, self.round
+            self.next_index += 1
+        adverb, adjective, name = self.parts(position)
+        full_name = adverb.capitalize() + adjective.capitalize() + name + (str(cycle + 1) if cycle else "")
+        self.names.add(full_name)
+        self.allocated[full_name] = (position, cycle)
+        return full_name, adverb, adjective
+
     def generate_name(self):
-        original = tries = 3
-        while tries > 0:
-            name = random.choice(self.adverbs).capitalize() + random.choice(self.adjectives).capitalize() + random.choice(self.angel_names)
-            if name not in self.names:
-                self.names.append(name)
-                return name
-            tries -= 1
-        raise Exception(f"Could not generate a unique name after {original} tries.")
-    
+        return self.allocate()[0]
+
     def generate_name_and_personality(self):
-        original = tries = 3
-        while tries > 0:
-            adverb = random.choice(self.adverbs)
-            adjective = random.choice(self.adjectives)
-            name = random.choice(self.angel_names)
-            full_name = adverb.capitalize() + adjective.capitalize() + name
-            if full_name not in self.names:
-                self.names.append(full_name)
-                return full_name , f"{adverb} {adjective}"
-            tries -= 1
-        raise Exception(f"Could not generate a unique name after {original} tries.")
+        full_name, adverb, adjective = self.allocate()
+        return full_name, f"{adverb} {adjective}"
+
+    def release(self, name: str):
+        """Put a name back to be handed out again. Names this generator didn't hand out are ignored."""
+        slot = self.allocated.pop(name, None)
+        if slot is not None:
+            self.names.discard(name)
+            self.free.append(slot)
 
 def key_by_value(d: dict, value):
     for key, val in d.items():